@@ -0,0 +1,166 @@
+"""Collision sound scheduling and offline soundtracks shared by the sims.
+
+Physics calls VoiceManager.hit() for every contact, which only advances the
+score and queues the note. Once per frame flush() starts the queued notes:
+hits on the same note within a frame share one voice, and no more than
+max_voices notes start per frame, so a burst of contacts costs a handful of
+Sound.play() calls instead of one per contact.
+
+In a headless export a Soundtrack takes the mixer's place: it records when each
+note starts in simulated time and mixes the notes down into one WAV file.
+
+Notes are Samples: a sound file that is only decoded, and the mixer only
+opened, the first time a note is played or mixed. Decoded sounds are cached by
+path for the whole process, so scenes and scores share them, and processes
+forked after the first decode inherit them. With --no-audio nothing is decoded
+and nothing plays.
+"""
+import os
+import wave
+
+import pygame
+
+# Mixer settings, applied when the first sample is decoded
+settings = {"enabled": True, "channels": 8}
+
+
+def add_arguments(parser):
+    parser.add_argument("--no-audio", action="store_true", help="never open the mixer or play a note")
+
+
+def configure(enabled=True, channels=8):
+    settings.update(enabled=enabled, channels=channels)
+
+
+def enabled():
+    return settings["enabled"]
+
+
+def init_mixer():
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+        pygame.mixer.set_num_channels(settings["channels"])
+
+
+class Sample:
+    cache = {}  # Absolute path -> decoded Sound
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+    def __eq__(self, other):
+        return isinstance(other, Sample) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f"Sample({os.path.basename(self.path)!r})"
+
+    @property
+    def sound(self):
+        sound = Sample.cache.get(self.path)
+        if sound is None:
+            init_mixer()
+            sound = Sample.cache[self.path] = pygame.mixer.Sound(self.path)
+        return sound
+
+    def play(self):
+        if settings["enabled"]:
+            self.sound.play()
+
+
+class VoiceManager:
+    def __init__(self, score, max_voices=8):
+        self.score = score
+        self.score_pointer = 0
+        self.max_voices = max_voices
+        self.queue = []
+        # Counters since start: notes started, hits merged into another hit's note, and
+        # notes skipped because the frame was already at max_voices
+        self.played = 0
+        self.merged = 0
+        self.dropped = 0
+        self.soundtrack = None  # Set to a Soundtrack to record the notes instead of playing them
+
+    def hit(self):
+        # The score advances on every hit, whether or not its note ends up being played
+        self.queue.append(self.score_pointer)
+        self.score_pointer = (self.score_pointer + 1) % len(self.score)
+
+    def flush(self):
+        notes = []
+        for index in self.queue:
+            note = self.score[index]
+            if note in notes:
+                self.merged += 1
+            elif len(notes) < self.max_voices:
+                notes.append(note)
+            else:
+                self.dropped += 1
+        self.queue.clear()
+        for note in notes:
+            if self.soundtrack:
+                self.soundtrack.play(note)
+            else:
+                note.play()
+        self.played += len(notes)
+        return notes
+
+    def summary(self):
+        return f"{self.played} notes played, {self.merged} hits merged, {self.dropped} dropped"
+
+
+class Soundtrack:
+    def __init__(self, timestep):
+        self.timestep = timestep
+        self.events = []  # (simulated ms, Sound)
+
+    def play(self, note, time=None):
+        # Starts now unless given an exact simulated time
+        self.events.append((self.timestep.time if time is None else time, note))
+
+    def mixdown(self, seconds):
+        # 16 bit samples of every recorded note mixed at its start time and clipped like the
+        # mixer would. A note with few starts is added in place at each one; a note with many
+        # is convolved as an impulse train (how often it starts at each sample) with its
+        # samples through an FFT, so the cost stops growing with the number of hits.
+        import numpy as np  # Only offline export needs NumPy
+
+        init_mixer()
+        frequency, size, channels = pygame.mixer.get_init()
+        if size != -16:
+            raise ValueError(f"offline mixdown needs a signed 16 bit mixer, not {size}")
+        length = int(round(seconds * frequency))
+        starts = {}
+        for time, note in self.events:
+            offset = int(round(time * frequency / 1000))
+            if offset < length:
+                starts.setdefault(note, []).append(offset)
+
+        mix = np.zeros((length, channels))
+        samples = {note: pygame.sndarray.array(note.sound).reshape(-1, channels) for note in starts}
+        size = 1 << (length + max(map(len, samples.values()), default=0)).bit_length()
+        spectrum = None
+        for note, offsets in starts.items():
+            data = samples[note]
+            if len(offsets) * len(data) < size * 48:
+                for offset in offsets:
+                    end = min(length, offset + len(data))
+                    mix[offset:end] += data[:end - offset]
+            else:
+                impulses = np.fft.rfft(np.bincount(offsets, minlength=length), size)
+                convolved = impulses[:, None] * np.fft.rfft(data, size, axis=0)
+                spectrum = convolved if spectrum is None else spectrum + convolved
+        if spectrum is not None:
+            mix += np.fft.irfft(spectrum, size, axis=0)[:length]
+        return np.clip(np.rint(mix), -32768, 32767).astype(np.int16)
+
+    def write(self, path, seconds):
+        init_mixer()
+        frequency, size, channels = pygame.mixer.get_init()
+        with wave.open(path, "wb") as output:
+            output.setnchannels(channels)
+            output.setsampwidth(2)
+            output.setframerate(frequency)
+            output.writeframes(self.mixdown(seconds).tobytes())
@@ -0,0 +1,109 @@
+"""Headless benchmarks of the sims.
+
+Every script takes --benchmark FRAMES: it runs its normal main loop on dummy
+SDL drivers, unthrottled and one physics step per frame, with --count balls or
+pendulums, and prints the FrameProfiler's mean ms per phase as one JSON line.
+Running this module drives those scripts at increasing counts and reports
+physics, collision and draw cost separately. Results can be saved as a
+baseline and later runs compared against it:
+
+    python -m common.benchmark --save baseline.json
+    python -m common.benchmark --compare baseline.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Scripts, the options that make their runs repeatable, and the counts run by default
+SCENES = {
+    "plinko/main.py": (["--seed", "1"], [1, 10, 100, 500]),
+    "plinko/comp.py": (["--seed", "1"], [1, 10, 100, 500]),
+    "swing/main.py": ([], [3, 10, 30, 100]),
+    "swing/pendulum_wave.py": ([], [100, 1000, 3000]),
+}
+
+
+def add_arguments(parser, things):
+    parser.add_argument("--benchmark", type=int, metavar="FRAMES",
+                        help="run headless for FRAMES frames and print the time per phase as JSON")
+    parser.add_argument("--count", type=int, help=f"{things} to benchmark with")
+
+
+def report(profiler, **counts):
+    # The last line a benchmark run prints, read back by run_scene(). counts are what the
+    # scene ended up with, e.g. balls=len(balls).
+    print(json.dumps({"frames": profiler.frames, "phases": profiler.summary(), **counts}))
+
+
+def run_scene(scene, count, frames, repeat=1):
+    # Best of repeat runs, phase by phase, as the least disturbed measurement
+    directory, script = os.path.split(os.path.join(ROOT, scene))
+    command = [sys.executable, script, "--benchmark", str(frames), "--count", str(count)] + SCENES[scene][0]
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run(command, cwd=directory, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best:
+            result["phases"] = {phase: min(ms, best["phases"].get(phase, ms)) for phase, ms in result["phases"].items()}
+        best = result
+    return best
+
+
+def table(results, baseline=None, threshold=0.1):
+    # One line per scene and count. With a baseline, every phase also shows its change and
+    # phases that got slower than threshold are counted as regressions.
+    regressions = 0
+    for key, result in results.items():
+        phases = result["phases"]
+        total = sum(phases.values())
+        cells = []
+        for phase, ms in phases.items():
+            cell = f"{phase} {ms:7.3f}"
+            old = (baseline or {}).get(key, {}).get("phases", {}).get(phase)
+            if old:
+                change = (ms - old) / old
+                # Changes under 50 microseconds are noise
+                slower = change > threshold and ms - old > 0.05
+                regressions += slower
+                cell += f" ({change:+.0%}{'!' if slower else ''})"
+            cells.append(cell)
+        print(f"{key:24} {1000 / max(total, 1e-9):8.0f} fps   " + "   ".join(cells))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the sims headless, in ms per frame and phase.")
+    parser.add_argument("scenes", nargs="*", default=list(SCENES), help=f"scenes to run, from {', '.join(SCENES)}")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scene and count, the fastest is kept")
+    parser.add_argument("--counts", help="comma separated counts, instead of each scene's defaults")
+    parser.add_argument("--save", metavar="PATH", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+    for scene in args.scenes:
+        if scene not in SCENES:
+            parser.error(f"unknown scene {scene!r}, choose from {', '.join(SCENES)}")
+
+    results = {}
+    for scene in args.scenes:
+        counts = [int(count) for count in args.counts.split(",")] if args.counts else SCENES[scene][1]
+        for count in counts:
+            results[f"{scene} x{count}"] = run_scene(scene, count, args.frames, args.repeat)
+            print(f"\r{len(results)} runs", end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    regressions = table(results, baseline, args.threshold)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+    if regressions:
+        sys.exit(f"{regressions} phases slower than the baseline")
@@ -0,0 +1,113 @@
+"""Checkpoints: the whole state of a running scene in one small file.
+
+A scene's state is plain data (numbers, lists and the RNG state) taken between
+physics steps, so restoring it and stepping on gives the same run the original
+would have had. Checkpoints are pickled and gzipped.
+
+    python main.py --warmup 120 --save warm.ckpt   # Simulate 2 minutes headless, then save
+    python main.py --restore warm.ckpt             # Carry on from there in the window
+    python main.py --restore warm.ckpt --fork 8 --seconds 30 --jitter 0.5
+
+--fork runs copies of the state in worker processes, each perturbed in its own
+way: its RNG reseeded by its number and its velocities nudged by up to
+--jitter. Every copy simulates --seconds headless and reports its outcome, so
+an expensive warm-up is paid once however many experiments start from it.
+C saves a checkpoint of a live run to --save.
+"""
+import argparse
+import contextlib
+import gzip
+import json
+import multiprocessing
+import os
+import pickle
+import signal
+import sys
+
+from . import export
+
+VERSION = 3  # Bump when a scene's state changes shape
+DEFAULT_PATH = "checkpoint.ckpt"
+
+
+def add_arguments(parser):
+    parser.add_argument("--save", metavar="PATH",
+                        help="checkpoint written by C, after --warmup, or by every --fork copy "
+                             "({fork} in the path becomes the copy's number)")
+    parser.add_argument("--restore", metavar="PATH", help="start from a checkpoint instead of the beginning")
+    parser.add_argument("--warmup", type=float, metavar="SECONDS",
+                        help="simulate SECONDS headless, save a checkpoint to --save and stop")
+    parser.add_argument("--fork", type=int, metavar="COPIES",
+                        help="run COPIES perturbed copies of the start state for --seconds each, in worker processes")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="largest random nudge --fork gives to velocities, in the scene's own units")
+    # How --fork tells a worker which copy it runs, not for the command line
+    parser.add_argument("--perturb", type=int, help=argparse.SUPPRESS)
+
+
+def save(path, scene, state):
+    with gzip.open(path, "wb") as file:
+        pickle.dump({"version": VERSION, "scene": scene, "state": state}, file, pickle.HIGHEST_PROTOCOL)
+    print(f"Saved checkpoint to {path}")
+
+
+def load(path, scene):
+    with gzip.open(path, "rb") as file:
+        checkpoint = pickle.load(file)
+    if checkpoint.get("version") != VERSION or checkpoint.get("scene") != scene:
+        raise SystemExit(f"{path} is not a checkpoint of {scene}")
+    return checkpoint["state"]
+
+
+def save_timestep(timestep):
+    return {"rate": timestep.rate, "accumulator": timestep.accumulator, "steps": timestep.steps, "time": timestep.time}
+
+
+def restore_timestep(timestep, state):
+    timestep.rate = state["rate"]
+    timestep.accumulator = state["accumulator"]
+    timestep.steps = state["steps"]
+    timestep.time = state["time"]
+
+
+def path(args):
+    # Where this run saves: --save, with {fork} filled in for a --fork copy. Other braces in the
+    # path are left alone.
+    return (args.save or DEFAULT_PATH).replace("{fork}", str(args.perturb))
+
+
+def reseed(rng, copy):
+    # A stream of its own for every copy, the same every time the copy is run
+    rng.seed(f"{rng.getrandbits(64)}/{copy}")
+
+
+def simulate(timestep, step, seconds, voices=None, keys=None, handle_event=None):
+    # Run headless and unthrottled for seconds of simulated time, a frame's steps at a time,
+    # with the scripted --keys pressed on the way
+    keys = export.parse_keys(keys)
+    for frame in range(round(seconds * timestep.fps)):
+        for event in export.scripted_events(keys, frame / timestep.fps):
+            handle_event(event)
+        timestep.advance(step, 1000 / timestep.fps)
+        if voices:
+            voices.flush()
+
+
+def run_copy(main, argv):
+    # Worker process: one copy, silent and headless, returning main()'s outcome
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    export.use_dummy_drivers()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return main(argv + ["--no-audio"])
+
+
+def fork(main, argv, copies):
+    # --fork: main(argv) with --perturb 0 .. copies - 1 in a pool of worker processes, printing
+    # the outcome main() returns for every copy. The workers ignore --fork themselves.
+    argv = list(sys.argv[1:] if argv is None else argv)
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    context = multiprocessing.get_context(method)
+    tasks = [(main, argv + ["--perturb", str(copy)]) for copy in range(copies)]
+    with context.Pool(min(copies, os.cpu_count() or 1), maxtasksperchild=1) as pool:
+        for copy, outcome in enumerate(pool.starmap(run_copy, tasks)):
+            print(f"Copy {copy}: {json.dumps(outcome)}")
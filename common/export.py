@@ -0,0 +1,155 @@
+"""Offline frame export shared by the sims.
+
+A scene runs its physics headless, records one plain-data state per frame and
+hands the states to FrameExporter. A pool of worker processes turns states into
+pixels with the scene's render function, and the frames are either streamed to
+an ffmpeg subprocess (video file) or written as numbered PNG files. The notes
+recorded by the scene's Soundtrack are mixed into a WAV file next to them, and
+into the video's audio track.
+"""
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import time
+
+import pygame
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov", ".webm", ".avi")
+
+
+def use_dummy_drivers():
+    # Must run before pygame.init(): no window and no audio device
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+
+def add_arguments(parser):
+    parser.add_argument("--export", metavar="PATH",
+                        help="render offline to a video file (needs ffmpeg) or a directory of PNG frames")
+    parser.add_argument("--seconds", type=float, default=60, help="length of the export in seconds")
+    parser.add_argument("--keys", help='scripted key presses for the export, e.g. "0:space,2.5:return"')
+    parser.add_argument("--workers", type=int, help="render processes for the export, defaults to all cores")
+
+
+def parse_keys(spec):
+    # "0:space,1.5:return" -> [(0.0, KEYDOWN space), (1.5, KEYDOWN return)], sorted by time
+    keys = []
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        seconds, name = item.split(":", 1)
+        event = pygame.event.Event(pygame.KEYDOWN, key=pygame.key.key_code(name), mod=0, unicode="")
+        keys.append((float(seconds), event))
+    return sorted(keys, key=lambda key: key[0])
+
+
+def scripted_events(keys, seconds):
+    # Pop the scripted key presses that are due at the given time
+    due = []
+    while keys and keys[0][0] <= seconds:
+        due.append(keys.pop(0)[1])
+    return due
+
+
+def record(timestep, step, snapshot, handle_event, seconds, keys=None, voices=None):
+    # Run the scene headless on its fixed timestep and return one state per video frame
+    keys = parse_keys(keys)
+    states = []
+    for frame in range(int(seconds * timestep.fps)):
+        for event in scripted_events(keys, frame / timestep.fps):
+            handle_event(event)
+        timestep.advance(step, 1000 / timestep.fps)
+        if voices:
+            voices.flush()
+        states.append(snapshot())
+    return states
+
+
+# Worker process state, set up once per process by init_worker
+worker = {}
+
+
+def init_worker(render, size, layout, pattern):
+    # Forked workers inherit SDL's SIGTERM handler, which would keep Pool.terminate() from
+    # stopping them. Drawing on plain Surfaces needs no pygame.init().
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    worker.update(render=render, surface=pygame.Surface(size), layout=layout, pattern=pattern)
+
+
+def render_frame(task):
+    index, state = task
+    surface = worker["surface"]
+    worker["render"](surface, worker["layout"], state)
+    if worker["pattern"]:
+        pygame.image.save(surface, worker["pattern"] % index)
+        return None
+    return pygame.image.tobytes(surface, "RGB")
+
+
+class FrameExporter:
+    def __init__(self, render, size, layout, output, fps=60, workers=None):
+        # render(surface, layout, state) must be a module-level function so workers can import it
+        self.render = render
+        self.size = size
+        self.layout = layout
+        self.output = output
+        self.fps = fps
+        self.workers = workers or os.cpu_count()
+
+    def export(self, states, soundtrack=None):
+        start = time.perf_counter()
+        duration = len(states) / self.fps
+        video = is_video(self.output)
+        if not video:
+            os.makedirs(self.output, exist_ok=True)
+
+        audio = None
+        if soundtrack:
+            audio = os.path.splitext(self.output)[0] + ".wav" if video else os.path.join(self.output, "soundtrack.wav")
+            soundtrack.write(audio, duration)
+            print(f"Mixed {len(soundtrack.events)} notes to {audio} in {time.perf_counter() - start:.1f}s")
+
+        pattern = None
+        encoder = None
+        if video:
+            encoder = self.open_encoder(audio)
+        else:
+            pattern = os.path.join(self.output, "frame_%06d.png")
+
+        # Forked workers inherit the already imported scene modules
+        method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(method)
+        with context.Pool(self.workers, init_worker, (self.render, self.size, self.layout, pattern)) as pool:
+            chunksize = max(1, len(states) // (self.workers * 8))
+            for frame in pool.imap(render_frame, enumerate(states), chunksize):
+                if encoder:
+                    encoder.stdin.write(frame)
+            pool.close()
+            pool.join()
+        if encoder:
+            encoder.stdin.close()
+            encoder.wait()
+
+        elapsed = time.perf_counter() - start
+        print(f"Exported {len(states)} frames ({duration:.1f}s) to {self.output} in {elapsed:.1f}s"
+              f" ({duration / max(elapsed, 1e-9):.1f}x real time)")
+
+    def open_encoder(self, audio=None):
+        return open_encoder(self.output, self.size, self.fps, audio)
+
+
+def is_video(output):
+    return output.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def open_encoder(output, size, fps, audio=None):
+    # An ffmpeg process that encodes the raw RGB frames written to its stdin
+    if shutil.which("ffmpeg") is None:
+        raise SystemExit("ffmpeg not found on PATH; export to a directory to get PNG frames instead")
+    width, height = size
+    command = ["ffmpeg", "-loglevel", "error", "-y",
+               "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-"]
+    if audio:
+        command += ["-i", audio, "-c:a", "aac", "-shortest"]
+    return subprocess.Popen(command + ["-pix_fmt", "yuv420p", output], stdin=subprocess.PIPE)
+
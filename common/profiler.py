@@ -0,0 +1,122 @@
+"""Per-phase frame timing shared by the sims.
+
+The main loop calls start() at the top of a frame and mark(phase) after each
+phase; mark() books the time since the previous mark to that phase, so phases
+that run several times a frame (physics steps when catching up) add up.
+end_frame() closes the frame. A mark is one perf_counter() call and a dict
+update, cheap enough to leave in the loop all the time.
+
+On top of that the profiler keeps the latest frames for ProfilerHud, an
+on-screen overlay (H toggles it), and can stream every frame to a CSV trace.
+"""
+import csv
+import time
+from collections import deque
+
+import pygame
+
+
+class FrameProfiler:
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument("--hud", action="store_true", help="show the frame profiler overlay, H toggles it")
+        parser.add_argument("--trace", metavar="PATH", help="write the time of every phase of every frame to a CSV file")
+
+    def __init__(self, phases, window=60):
+        self.phases = list(phases)
+        self.frames = 0
+        self.current = dict.fromkeys(self.phases, 0.0)  # ms per phase in the frame being timed
+        self.totals = dict.fromkeys(self.phases, 0.0)   # ms per phase over all finished frames
+        self.counts = {}                                # What the last frame had, e.g. balls
+        self.recent = deque(maxlen=window)              # ms per phase of the latest frames
+        self.periods = deque(maxlen=window)             # ms from one frame's start to the next
+        self.started = None
+        self.last = time.perf_counter()
+        self.trace_file = None
+        self.trace = None
+        self.trace_header = False
+
+    def start(self):
+        now = time.perf_counter()
+        if self.started is not None:
+            self.periods.append((now - self.started) * 1000)
+        self.started = self.last = now
+        self.current = dict.fromkeys(self.phases, 0.0)
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.current[phase] = self.current.get(phase, 0.0) + (now - self.last) * 1000
+        self.last = now
+
+    def end_frame(self, **counts):
+        for phase, ms in self.current.items():
+            self.totals[phase] = self.totals.get(phase, 0.0) + ms
+        self.frames += 1
+        self.counts = counts
+        self.recent.append(self.current)
+        if self.trace:
+            if not self.trace_header:
+                self.trace.writerow(["frame"] + self.phases + list(counts))
+                self.trace_header = True
+            self.trace.writerow([self.frames] + [f"{self.current[phase]:.3f}" for phase in self.phases] +
+                                list(counts.values()))
+
+    def open_trace(self, path):
+        # Rows are buffered by the file object, so tracing costs a little formatting per frame
+        self.trace_file = open(path, "w", newline="")
+        self.trace = csv.writer(self.trace_file)
+
+    def close(self):
+        if self.trace_file:
+            self.trace_file.close()
+            self.trace_file = self.trace = None
+
+    def summary(self):
+        # Mean ms per frame for every phase
+        return {phase: total / max(self.frames, 1) for phase, total in self.totals.items()}
+
+    def averages(self):
+        # Mean ms per phase over the latest frames
+        return {phase: sum(frame.get(phase, 0.0) for frame in self.recent) / max(len(self.recent), 1)
+                for phase in self.phases}
+
+    def fps(self):
+        return 1000 * len(self.periods) / sum(self.periods) if self.periods else 0.0
+
+
+class ProfilerHud:
+    # The profiler's latest averages in a box in the top left corner. The text is only
+    # rendered a few times a second; every other frame blits the cached box.
+    REFRESH = 0.25  # Seconds between text updates
+
+    def __init__(self, profiler, visible=False):
+        self.profiler = profiler
+        self.visible = visible
+        self.font = None
+        self.image = None
+        self.rendered = 0.0
+
+    def draw(self, screen):
+        # Returns the rect drawn to, for dirty rect updates
+        now = time.perf_counter()
+        if self.image is None or now - self.rendered >= self.REFRESH:
+            self.image = self.render()
+            self.rendered = now
+        return screen.blit(self.image, (4, 4))
+
+    def render(self):
+        if self.font is None:
+            pygame.font.init()  # The sims only initialise the modules they use
+            self.font = pygame.font.Font(None, 20)
+        profiler = self.profiler
+        averages = profiler.averages()
+        lines = [f"{profiler.fps():5.1f} fps"]
+        lines += [f"{name} {count}" for name, count in profiler.counts.items()]
+        lines += [f"{phase:10} {ms:6.2f} ms" for phase, ms in averages.items()]
+        lines.append(f"{'total':10} {sum(averages.values()):6.2f} ms")
+        images = [self.font.render(line, True, (255, 255, 255)) for line in lines]
+        height = self.font.get_linesize()
+        image = pygame.Surface((max(text.get_width() for text in images) + 8, height * len(images) + 6))
+        for i, text in enumerate(images):
+            image.blit(text, (4, 3 + i * height))
+        return image
@@ -0,0 +1,239 @@
+"""Columnar recordings of a scene, for replay without physics.
+
+A recording is a directory. header.json lists the columns, and every column is
+a flat binary file of fixed-width rows: frame columns have one row per frame,
+and every table (balls, pendulums, ...) has as many rows per frame as the frame
+had items. index.<table>.bin holds, for every frame, the number of rows of the
+table written up to the end of that frame, so the rows of any frame are found
+with two lookups. Every frame is stored whole, which makes each one a keyframe:
+seeking costs the same wherever it goes.
+
+Rows are appended to the files while the scene runs and read back through
+NumPy memory maps, so a multi-hour recording is never loaded into memory.
+Alongside the scene's tables every recording has an events table: items
+spawned and killed (from a tracked table's "id" column) and notes played.
+
+    python main.py --record run.rec
+    python main.py --replay run.rec
+    python main.py --replay run.rec --export run.mp4
+"""
+import json
+import os
+from collections.abc import Sequence
+
+import pygame
+
+from . import audio
+from .audio import Soundtrack
+from .export import FrameExporter
+
+SPAWN, KILL, NOTE = 0, 1, 2
+EVENT_COLUMNS = {"kind": "u1", "id": "i4"}
+SEEK_SECONDS = 10  # Left and right arrows jump this far in a replay
+
+
+def add_arguments(parser):
+    parser.add_argument("--record", metavar="PATH", help="record every frame to a replayable recording directory")
+    parser.add_argument("--replay", metavar="PATH", help="play a recording back instead of simulating, or export it")
+
+
+def column_spec(spec):
+    # "i2" or ("i2", (15, 2)) -> ("i2", (15, 2)); a bare dtype is one value per row
+    dtype, shape = spec if isinstance(spec, (tuple, list)) else (spec, ())
+    return dtype, tuple(shape)
+
+
+class Recorder:
+    def __init__(self, path, fps, frame_columns, tables, track=None, meta=None):
+        # frame_columns is {name: spec}, tables is {table: {name: spec}}. Items of the track
+        # table are told apart by its "id" column, to record when they spawn and die.
+        import numpy as np  # Only recording and replay need NumPy
+
+        self.np = np
+        os.makedirs(path, exist_ok=True)
+        self.frame_columns = {name: column_spec(spec) for name, spec in frame_columns.items()}
+        self.tables = {table: {name: column_spec(spec) for name, spec in columns.items()}
+                       for table, columns in tables.items()}
+        self.tables["events"] = {name: column_spec(spec) for name, spec in EVENT_COLUMNS.items()}
+        self.track = track
+        self.ids = set()
+        self.counts = dict.fromkeys(self.tables, 0)
+        self.frames = 0
+
+        header = {"version": 1, "fps": fps, "meta": meta or {}, "frame": self.frame_columns, "tables": self.tables}
+        with open(os.path.join(path, "header.json"), "w") as file:
+            json.dump(header, file, indent=2)
+        self.files = {}
+        for name in self.frame_columns:
+            self.files["frame", name] = open(os.path.join(path, f"frame.{name}.bin"), "wb")
+        for table, columns in self.tables.items():
+            self.files["index", table] = open(os.path.join(path, f"index.{table}.bin"), "wb")
+            for name in columns:
+                self.files[table, name] = open(os.path.join(path, f"{table}.{name}.bin"), "wb")
+
+    def write(self, frame, tables, notes=()):
+        # One frame: {name: value} for the frame columns, {table: {name: values}} with a
+        # value per item for the tables, and the indexes of the notes started this frame
+        np = self.np
+        for name, (dtype, shape) in self.frame_columns.items():
+            self.files["frame", name].write(np.asarray(frame[name], dtype).reshape(shape).tobytes())
+
+        events = []
+        if self.track:
+            ids = set(tables[self.track]["id"])
+            events += [(SPAWN, item) for item in sorted(ids - self.ids)]
+            events += [(KILL, item) for item in sorted(self.ids - ids)]
+            self.ids = ids
+        events += [(NOTE, note) for note in notes]
+        tables = dict(tables, events={"kind": [kind for kind, _ in events], "id": [item for _, item in events]})
+
+        for table, columns in self.tables.items():
+            rows = 0
+            for name, (dtype, shape) in columns.items():
+                values = np.asarray(tables[table][name], dtype).reshape((-1,) + shape)
+                rows = len(values)
+                self.files[table, name].write(values.tobytes())
+            self.counts[table] += rows
+            self.files["index", table].write(np.int64(self.counts[table]).tobytes())
+        self.frames += 1
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+
+class Recording:
+    def __init__(self, path):
+        import numpy as np
+
+        self.np = np
+        self.path = path
+        with open(os.path.join(path, "header.json")) as file:
+            header = json.load(file)
+        self.fps = header["fps"]
+        self.meta = header["meta"]
+        self.frame_columns = {name: self.map(f"frame.{name}", dtype, shape)
+                              for name, (dtype, shape) in header["frame"].items()}
+        self.tables = {table: {name: self.map(f"{table}.{name}", dtype, shape)
+                               for name, (dtype, shape) in columns.items()}
+                       for table, columns in header["tables"].items()}
+        self.index = {table: self.map(f"index.{table}", "i8", ()) for table in self.tables}
+        # A recording cut short by a crash keeps every frame whose rows were all written
+        self.frames = min([len(index) for index in self.index.values()] +
+                          [len(column) for column in self.frame_columns.values()])
+        for table, columns in self.tables.items():
+            written = min((len(column) for column in columns.values()), default=0)
+            ends = self.index[table][:self.frames]
+            self.frames = min(self.frames, int(np.searchsorted(ends, written, side="right")))
+
+    def map(self, name, dtype, shape):
+        np = self.np
+        path = os.path.join(self.path, f"{name}.bin")
+        rows = os.path.getsize(path) // (np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64)))
+        if not rows:
+            return np.zeros((0,) + tuple(shape), dtype)
+        return np.memmap(path, dtype, "r", shape=(rows,) + tuple(shape))
+
+    def __len__(self):
+        return self.frames
+
+    def rows(self, table, index):
+        # {name: array} of the table's rows in frame index, views into the memory maps
+        index_column = self.index[table]
+        start = int(index_column[index - 1]) if index else 0
+        end = int(index_column[index])
+        return {name: column[start:end] for name, column in self.tables[table].items()}
+
+    def frame(self, index):
+        # {name: value} of the frame columns
+        return {name: column[index] for name, column in self.frame_columns.items()}
+
+    def notes(self, index):
+        events = self.rows("events", index)
+        return events["id"][events["kind"] == NOTE].tolist()
+
+    def states(self, decode):
+        # The frames as scene states, decoded one at a time when they are read
+        return States(self, decode)
+
+    def soundtrack(self, soundtrack, sounds):
+        # Fill a Soundtrack with the recorded notes, each at the start of its frame
+        kinds = self.tables["events"]["kind"]
+        ids = self.tables["events"]["id"]
+        ends = self.index["events"][:self.frames]
+        for position in self.np.flatnonzero(kinds[:int(ends[-1]) if len(ends) else 0] == NOTE):
+            frame = int(self.np.searchsorted(ends, position, side="right"))
+            soundtrack.play(sounds[ids[position]], frame * 1000 / self.fps)
+
+
+class States(Sequence):
+    # A read-only list of decoded frames, for FrameExporter
+    def __init__(self, recording, decode):
+        self.recording = recording
+        self.decode = decode
+
+    def __len__(self):
+        return len(self.recording)
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self.recording):
+            raise IndexError(index)
+        return self.decode(self.recording, index)
+
+
+def play(recording, screen, draw, sounds=None):
+    # Show the recording in the window at its own frame rate. draw(screen, index) draws a
+    # frame; notes are played as playback passes them, not when seeking. Space pauses,
+    # the arrows seek, comma and period step a paused replay, Home and End jump.
+    clock = pygame.time.Clock()
+    step = round(SEEK_SECONDS * recording.fps)
+    last = len(recording) - 1
+    index, paused = 0, False
+    while last >= 0:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return
+            if event.type != pygame.KEYDOWN:
+                continue
+            if event.key == pygame.K_SPACE:
+                paused = not paused
+            elif event.key == pygame.K_RIGHT:
+                index = min(index + step, last)
+            elif event.key == pygame.K_LEFT:
+                index = max(index - step, 0)
+            elif event.key == pygame.K_PERIOD and paused:
+                index = min(index + 1, last)
+            elif event.key == pygame.K_COMMA and paused:
+                index = max(index - 1, 0)
+            elif event.key == pygame.K_HOME:
+                index = 0
+            elif event.key == pygame.K_END:
+                index = last
+        draw(screen, index)
+        pygame.display.flip()
+        if not paused:
+            if sounds:
+                for note in recording.notes(index):
+                    sounds[note].play()
+            if index < last:
+                index += 1
+            else:
+                paused = True
+        clock.tick(recording.fps)
+
+
+def replay(path, screen, render, layout, decode, sounds, output=None, workers=None):
+    # --replay: show a recording in the window, or with --export render it to output the way
+    # a simulated export would be. render and layout are the scene's exporter ones, decode
+    # turns a recorded frame back into a state for render.
+    recording = Recording(path)
+    if output:
+        soundtrack = None
+        if audio.enabled():
+            soundtrack = Soundtrack(None)
+            recording.soundtrack(soundtrack, sounds)
+        exporter = FrameExporter(render, screen.get_size(), layout, output, recording.fps, workers)
+        exporter.export(recording.states(decode), soundtrack)
+    else:
+        play(recording, screen, lambda screen, index: render(screen, layout, decode(recording, index)), sounds)
@@ -0,0 +1,261 @@
+"""Headless frame streaming to local socket clients.
+
+With --serve a scene runs without a window and, instead of updating the
+display, hands every frame to a Server. The server runs an asyncio loop in a
+thread of its own: it encodes the frames and sends them to any number of
+clients on a Unix socket (a path) or a TCP port on this machine (host:port).
+
+Frames go through bounded queues, one to the encoder and one per client. A full
+queue drops its oldest frame for the new one, so a slow client misses frames
+instead of holding up the other clients or the simulation. The scene's loop
+never waits on the network.
+
+A client reads one JSON line describing the stream:
+    {"width": 810, "height": 1440, "fps": 60, "pixels": "RGB", "encoding": "zlib", "header": "!QI"}
+then frames, each a header of the frame number and the payload length packed
+as "header", then the payload: the frame's RGB pixels, zlib compressed with
+--encoding zlib. Clients send commands as lines of text: "spawn" and "start"
+press Enter and Space, "key NAME" presses any key pygame knows by that name.
+
+    python main.py --serve /tmp/plinko.sock --encoding zlib
+    python -m common.stream /tmp/plinko.sock --send spawn --frames 300 --save last.png
+"""
+import argparse
+import asyncio
+import json
+import os
+import stat
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+
+import pygame
+
+HEADER = "!QI"  # Frame number, payload length
+COMMANDS = {"spawn": pygame.K_RETURN, "start": pygame.K_SPACE}
+TIMEOUT = 10  # Seconds to wait for the server thread to start listening
+
+
+def add_arguments(parser):
+    parser.add_argument("--serve", metavar="ADDRESS",
+                        help="run headless and stream the frames to clients on a Unix socket path or host:port")
+    parser.add_argument("--encoding", choices=["raw", "zlib"], default="raw", help="how --serve encodes frames")
+    parser.add_argument("--queue", type=int, default=2, help="frames --serve holds per client before dropping the oldest")
+
+
+def parse_address(address):
+    # "host:port" -> ("host", port), anything else is a Unix socket path
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address, None
+
+
+class Client:
+    def __init__(self, writer, size):
+        self.writer = writer
+        self.queue = asyncio.Queue(size)
+        self.sent = 0
+        self.dropped = 0
+
+
+def offer(queue, item):
+    # Put item on a bounded queue, dropping the oldest item when it is full. Returns whether one was.
+    dropped = queue.full()
+    if dropped:
+        queue.get_nowait()
+    queue.put_nowait(item)
+    return dropped
+
+
+class Server:
+    def __init__(self, address, size, fps, encoding="raw", queue=2):
+        self.address = address
+        self.size = size
+        self.fps = fps
+        self.encoding = encoding
+        self.queue_size = max(1, queue)
+        self.clients = set()
+        self.commands = deque()  # Key codes from the clients, taken by publish() in the scene's thread
+        self.frames = 0
+        self.dropped = 0  # Frames the encoder fell behind on
+        self.loop = asyncio.new_event_loop()
+        self.started = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="stream server", daemon=True)
+        self.thread.start()
+        if not self.started.wait(TIMEOUT) or self.error:
+            raise SystemExit(f"Can't serve on {address}: {self.error or 'timed out'}")
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.listen())
+        except OSError as error:
+            self.error = error
+            self.started.set()
+            return
+        self.started.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def listen(self):
+        self.encoder_queue = asyncio.Queue(self.queue_size)
+        self.encoder = asyncio.ensure_future(self.encode())
+        host, port = parse_address(self.address)
+        if port is None:
+            # A socket file left behind by an earlier run would make binding fail
+            if os.path.exists(host) and stat.S_ISSOCK(os.stat(host).st_mode):
+                os.unlink(host)
+            self.server = await asyncio.start_unix_server(self.serve_client, host)
+        else:
+            self.server = await asyncio.start_server(self.serve_client, host, port)
+        print(f"Serving frames on {self.address}")
+
+    async def encode(self):
+        # Compress in a worker thread, zlib lets go of the GIL while it works
+        while True:
+            index, pixels = await self.encoder_queue.get()
+            if self.encoding == "zlib":
+                pixels = await self.loop.run_in_executor(None, zlib.compress, pixels, 1)
+            message = struct.pack(HEADER, index, len(pixels)) + pixels
+            for client in self.clients:
+                client.dropped += offer(client.queue, message)
+
+    async def serve_client(self, reader, writer):
+        client = Client(writer, self.queue_size)
+        width, height = self.size
+        hello = {"width": width, "height": height, "fps": self.fps, "pixels": "RGB", "encoding": self.encoding,
+                 "header": HEADER}
+        # Counted in before the header goes out, so every frame published once a client has it reaches it
+        self.clients.add(client)
+        writer.write(json.dumps(hello).encode() + b"\n")
+        sender = asyncio.ensure_future(self.send(client))
+        try:
+            async for line in reader:
+                self.command(line.decode(errors="replace").strip())
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+            writer.close()
+            print(f"Client left after {client.sent} frames, {client.dropped} dropped")
+
+    async def send(self, client):
+        try:
+            while True:
+                message = await client.queue.get()
+                client.writer.write(message)
+                await client.writer.drain()
+                client.sent += 1
+        except ConnectionError:
+            pass
+
+    def command(self, line):
+        name, _, argument = line.partition(" ")
+        try:
+            if name in COMMANDS:
+                self.commands.append(COMMANDS[name])
+            elif name == "key":
+                self.commands.append(pygame.key.key_code(argument))
+            elif line:
+                raise ValueError(line)
+        except ValueError:
+            print(f"Unknown command from a client: {line!r}")
+
+    def publish(self, screen, dirty):
+        # The scene's end, in place of pygame.display.update(dirty): hand the frame over and post
+        # the key presses the clients sent since the last one. Frames are whole, so dirty is unused.
+        while self.commands:
+            key = self.commands.popleft()
+            pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode=""))
+        if self.clients:
+            frame = (self.frames, pygame.image.tobytes(screen, "RGB"))
+            self.loop.call_soon_threadsafe(self.hand_over, frame)
+        self.frames += 1
+
+    def hand_over(self, frame):
+        self.dropped += offer(self.encoder_queue, frame)
+
+    async def shutdown(self):
+        # Stop listening and cancel the encoder and every client's tasks before the loop stops
+        self.server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.loop.stop()
+
+    def close(self):
+        if self.thread.is_alive():
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop)
+            self.thread.join(TIMEOUT)
+        host, port = parse_address(self.address)
+        if port is None and os.path.exists(host):
+            os.unlink(host)
+
+
+def connect(address):
+    # A blocking client socket, for scripts and the command line client below
+    import socket
+
+    host, port = parse_address(address)
+    if port is None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(host)
+    else:
+        connection = socket.create_connection((host, port))
+    return connection
+
+
+def read_frames(connection):
+    # The stream header, then (frame number, RGB pixels) for every frame as it arrives
+    stream = connection.makefile("rb")
+    hello = json.loads(stream.readline())
+    size = struct.calcsize(hello["header"])
+
+    def frames():
+        while True:
+            header = stream.read(size)
+            if len(header) < size:
+                return
+            index, length = struct.unpack(hello["header"], header)
+            payload = stream.read(length)
+            yield index, zlib.decompress(payload) if hello["encoding"] == "zlib" else payload
+
+    return hello, frames()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch a scene streamed with --serve.")
+    parser.add_argument("address", help="the scene's --serve address")
+    parser.add_argument("--send", action="append", default=[], help='command to send first, e.g. "spawn"')
+    parser.add_argument("--frames", type=int, default=120, help="frames to read before stopping")
+    parser.add_argument("--delay", type=float, default=0, help="seconds to wait after every frame, to act slow")
+    parser.add_argument("--save", metavar="PATH", help="save the last frame as an image")
+    args = parser.parse_args()
+
+    connection = connect(args.address)
+    hello, frames = read_frames(connection)
+    for command in args.send:
+        connection.sendall(command.encode() + b"\n")
+    start = time.perf_counter()
+    received, first, last = 0, None, None
+    for index, pixels in frames:
+        first = index if first is None else first
+        received, last = received + 1, (index, pixels)
+        if received == args.frames:
+            break
+        time.sleep(args.delay)
+    elapsed = time.perf_counter() - start
+    connection.close()
+    if not last:
+        sys.exit("The stream ended before the first frame")
+    skipped = last[0] - first + 1 - received
+    print(f"{received} frames in {elapsed:.1f}s ({received / elapsed:.1f} fps), {skipped} skipped by the server")
+    if args.save:
+        pygame.image.save(pygame.image.frombytes(last[1], (hello["width"], hello["height"]), "RGB"), args.save)
@@ -0,0 +1,215 @@
+"""Many boards side by side, each simulated in its own process.
+
+Every board is a scene's main() running headless in a worker process. Instead
+of updating a window it blits its dirty rects into its tile: a Surface over a
+slice of one shared memory block. A compositor process scales the tiles into a
+grid and shows it in a window or encodes it, so frames are never pickled and
+every board gets a core of its own.
+
+Boards and compositor run in lockstep on two barriers. A board simulates and
+draws its next frame on its own screen while the compositor reads the tiles,
+waits on "free" until the compositor is done, blits into its tile and waits on
+"ready". Key presses in the compositor window (and scripted --keys) are passed
+on to every board through the head of the shared block.
+"""
+import math
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+
+import pygame
+
+from . import export
+
+MAX_KEYS = 15  # Key presses passed on to the boards per frame
+TIMEOUT = 60  # Seconds to wait on the other side before giving up, e.g. for a board that crashed
+
+
+def add_arguments(parser):
+    parser.add_argument("--grid", default="2x2", help="columns x rows of boards, e.g. 4x4")
+    parser.add_argument("--scale", type=float, help="size of a board on the wall, defaults to fitting the screen")
+
+
+def parse_grid(spec):
+    # "4x4" -> (4, 4)
+    columns, rows = (int(part) for part in spec.lower().split("x"))
+    return columns, rows
+
+
+class TileWall:
+    def __init__(self, count, tile_size, context):
+        # One framebuffer of tile_size per board, after a header holding the key presses
+        width, height = tile_size
+        self.count = count
+        self.tile_size = tile_size
+        self.tile_bytes = width * height * 4
+        self.header = 4 * (MAX_KEYS + 1)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.header + self.tile_bytes * count)
+        self.ready = context.Barrier(count + 1, timeout=TIMEOUT)  # Every board has blitted its frame
+        self.free = context.Barrier(count + 1, timeout=TIMEOUT)   # The compositor is done reading
+        self.views = []
+
+    def surface(self, index):
+        # A Surface drawing straight into the tile's slice of shared memory
+        start = self.header + index * self.tile_bytes
+        view = self.shm.buf[start:start + self.tile_bytes]
+        self.views.append(view)
+        return pygame.image.frombuffer(view, self.tile_size, "RGBX")
+
+    def send_keys(self, keys):
+        # Only between "ready" and "free", when no board reads them
+        keys = keys[:MAX_KEYS]
+        header = self.shm.buf[:self.header].cast("i")
+        header[0] = len(keys)
+        for index, key in enumerate(keys):
+            header[1 + index] = key
+        header.release()
+
+    def receive_keys(self):
+        header = self.shm.buf[:self.header].cast("i")
+        keys = header[1:1 + header[0]].tolist()
+        header.release()
+        return keys
+
+    def abort(self):
+        # Wake everyone waiting on a barrier with BrokenBarrierError
+        self.ready.abort()
+        self.free.abort()
+
+    def close(self, unlink=False):
+        # Surfaces made by surface() must be gone by now
+        for view in self.views:
+            view.release()
+        self.views = []
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class Tile:
+    # A board's end of the wall, passed to the scene's main() as tile=
+    def __init__(self, wall, index):
+        self.wall = wall
+        self.surface = wall.surface(index)
+
+    def publish(self, screen, dirty):
+        # Copy the frame's dirty rects into the tile once the compositor is done with the
+        # last frame, and post the key presses passed on with this one
+        self.wall.free.wait()
+        for rect in dirty:
+            self.surface.blit(screen, rect, rect)
+        keys = self.wall.receive_keys()
+        self.wall.ready.wait()
+        for key in keys:
+            pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode=""))
+
+    def close(self):
+        self.surface = None
+        self.wall.close()
+
+
+def run_board(main, argv, wall, index):
+    # Worker process: the scene's main loop, headless and silent, until the compositor stops
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    export.use_dummy_drivers()
+    tile = Tile(wall, index)
+    try:
+        main(argv + ["--no-audio"], tile=tile)
+    except threading.BrokenBarrierError:
+        pass
+    finally:
+        tile.close()
+
+
+def fit_scale(columns, rows, tile_size, max_size=(1920, 1080)):
+    # The largest scale, up to 1, that fits the whole wall in max_size
+    width, height = tile_size
+    return min(1.0, max_size[0] / (columns * width), max_size[1] / (rows * height))
+
+
+def run(main, boards, tile_size, fps, columns, scale=None, title="Boards", output=None, seconds=60, keys=None):
+    # Run main(argv, tile=...) for every argv in boards and show the tiles in a grid, or with
+    # output write seconds of it to a video file (needs ffmpeg) or a directory of PNG frames
+    rows = math.ceil(len(boards) / columns)
+    scale = scale or fit_scale(columns, rows, tile_size)
+    cell = (round(tile_size[0] * scale), round(tile_size[1] * scale))
+    size = (cell[0] * columns, cell[1] * rows)
+
+    # Boards are forked before the compositor touches SDL
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    context = multiprocessing.get_context(method)
+    wall = TileWall(len(boards), tile_size, context)
+    workers = [context.Process(target=run_board, args=(main, argv, wall, index), daemon=True)
+               for index, argv in enumerate(boards)]
+    for worker in workers:
+        worker.start()
+
+    encoder = pattern = None
+    if output:
+        export.use_dummy_drivers()
+        if export.is_video(output):
+            encoder = export.open_encoder(output, size, fps)
+        else:
+            os.makedirs(output, exist_ok=True)
+            pattern = os.path.join(output, "frame_%06d.png")
+    pygame.display.init()
+    if output:
+        screen = pygame.Surface(size)
+    else:
+        screen = pygame.display.set_mode(size)
+        pygame.display.set_caption(title)
+    tiles = [wall.surface(index) for index in range(len(boards))]  # Dropped before the wall closes
+    tile = None
+    scaled = pygame.Surface(cell, 0, tiles[0])  # smoothscale() needs the tiles' pixel format
+    cells = [screen.subsurface(pygame.Rect(((index % columns) * cell[0], (index // columns) * cell[1]), cell))
+             for index in range(len(boards))]
+    scripted = export.parse_keys(keys)
+    clock = pygame.time.Clock()
+
+    start = time.perf_counter()
+    frame = 0
+    try:
+        while not output or frame < seconds * fps:
+            pressed = [event.key for event in export.scripted_events(scripted, frame / fps)]
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return
+                if event.type == pygame.KEYDOWN:
+                    pressed.append(event.key)
+            wall.send_keys(pressed)
+            wall.free.wait()
+            wall.ready.wait()
+
+            for index, tile in enumerate(tiles):
+                if cell == tile_size:
+                    cells[index].blit(tile, (0, 0))
+                else:
+                    pygame.transform.smoothscale(tile, cell, scaled)
+                    cells[index].blit(scaled, (0, 0))
+            if encoder:
+                encoder.stdin.write(pygame.image.tobytes(screen, "RGB"))
+            elif pattern:
+                pygame.image.save(screen, pattern % frame)
+            else:
+                pygame.display.flip()
+                clock.tick(fps)
+            frame += 1
+    except threading.BrokenBarrierError:
+        raise SystemExit("A board stopped responding")
+    finally:
+        wall.abort()
+        for worker in workers:
+            worker.join(5)
+            if worker.is_alive():
+                worker.terminate()
+        tiles = tile = None
+        wall.close(unlink=True)
+        if encoder:
+            encoder.stdin.close()
+            encoder.wait()
+        if output:
+            elapsed = time.perf_counter() - start
+            print(f"Exported {frame} frames of {len(boards)} boards to {output} in {elapsed:.1f}s")
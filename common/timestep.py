@@ -0,0 +1,52 @@
+"""Fixed-timestep driver shared by the sims.
+
+Physics always advances in whole steps (velocities are in pixels per step), and
+the number of steps run per rendered frame comes from the real time elapsed,
+so simulation speed no longer depends on how fast frames are drawn.
+"""
+import time
+
+
+class FixedTimestep:
+    def __init__(self, rate, fps, max_steps=16):
+        self.rate = rate            # Physics steps per second of real time
+        self.fps = fps              # Target rendered frames per second
+        self.max_steps = max_steps  # Cap per frame so a slow frame can't snowball
+        self.accumulator = 0.0
+        self.fast_forward = False
+        self.steps = 0              # Physics steps run so far
+        self.time = 0.0             # Simulated milliseconds, each step lasts 1000 / rate
+
+    def advance(self, step, elapsed_ms):
+        # Run step() as often as the elapsed frame time calls for. In fast-forward mode
+        # the frame limit is ignored and physics runs flat out for one frame's budget.
+        count = 0
+        if self.fast_forward:
+            deadline = time.perf_counter() + 1 / self.fps
+            while time.perf_counter() < deadline:
+                self.run_step(step)
+                count += 1
+        else:
+            self.accumulator += elapsed_ms * self.rate / 1000
+            due = int(self.accumulator + 1e-9)  # Tolerate float error at exact multiples
+            self.accumulator -= due
+            if due > self.max_steps:
+                # Drop the backlog rather than spiral
+                due, self.accumulator = self.max_steps, 0.0
+            for count in range(1, due + 1):
+                self.run_step(step)
+        return count
+
+    def run_step(self, step):
+        step()
+        self.steps += 1
+        self.time += 1000 / self.rate
+
+    def tick(self, clock):
+        # End of frame: throttle to fps unless fast-forwarding, returns the elapsed ms
+        return clock.tick(0 if self.fast_forward else self.fps)
+
+    @property
+    def ticks(self):
+        # A stand-in for pygame.time.get_ticks() that follows physics
+        return int(self.time)
@@ -0,0 +1,92 @@
+"""Continuous collision detection for the plinko balls.
+
+A ball is a circle swept along its move for the step. Instead of testing for
+overlap where the move ends, which misses thin pins and walls once a ball moves
+further per step than they are wide, the functions here return the time of
+impact: the fraction of the move at which the ball first touches an obstacle,
+with the contact normal pointing from the obstacle to the ball. The loops move
+the ball to that point, bounce it and carry on with the rest of the step.
+
+A contact is (t, nx, ny). A ball that already overlaps an obstacle touches it
+at t = 0 if it is moving further in, and not at all if it is on its way out.
+"""
+import math
+
+import pygame
+
+
+def circle_contact(x, y, dx, dy, radius, cx, cy, other_radius):
+    # Circle at (x, y) moving by (dx, dy) against a circle at (cx, cy)
+    px, py = x - cx, y - cy
+    reach = radius + other_radius
+    a = dx * dx + dy * dy
+    b = px * dx + py * dy
+    c = px * px + py * py - reach * reach
+    if c <= 0:
+        if b >= 0:
+            return None
+        distance = math.sqrt(px * px + py * py)
+        return 0.0, px / distance, py / distance
+    if b >= 0:
+        return None
+    discriminant = b * b - a * c
+    if discriminant < 0:
+        return None
+    t = (-b - math.sqrt(discriminant)) / a
+    if t > 1:
+        return None
+    return t, (px + t * dx) / reach, (py + t * dy) / reach
+
+
+def box_contact(x, y, dx, dy, left, top, right, bottom):
+    # Point at (x, y) moving by (dx, dy) entering a box from outside (slab test)
+    entry, exit, normal = 0.0, 1.0, None
+    for start, move, low, high, axis in ((x, dx, left, right, (1, 0)), (y, dy, top, bottom, (0, 1))):
+        if move == 0:
+            if not low < start < high:
+                return None
+            continue
+        near, far = (low - start) / move, (high - start) / move
+        if near > far:
+            near, far = far, near
+        if near >= entry:
+            entry = near
+            sign = -1 if move > 0 else 1
+            normal = (axis[0] * sign, axis[1] * sign)
+        exit = min(exit, far)
+        if entry > exit:
+            return None
+    return (entry,) + normal if normal else None
+
+
+def rect_contact(x, y, dx, dy, radius, left, top, right, bottom):
+    # Circle at (x, y) moving by (dx, dy) against an axis-aligned rect. The shape the centre
+    # must not enter is the rect grown by the radius with rounded corners: two boxes (the
+    # rect grown sideways and grown up and down) and a circle on every corner. The first
+    # contact with that shape is the first contact with any of its pieces.
+    if (min(x, x + dx) > right + radius or max(x, x + dx) < left - radius or
+            min(y, y + dy) > bottom + radius or max(y, y + dy) < top - radius):
+        return None
+    nearest_x, nearest_y = min(max(x, left), right), min(max(y, top), bottom)
+    px, py = x - nearest_x, y - nearest_y
+    if px * px + py * py < radius * radius:
+        # Already overlapping: push out of the nearest side
+        if px or py:
+            distance = math.sqrt(px * px + py * py)
+            nx, ny = px / distance, py / distance
+        else:
+            nx, ny = min(((-1, 0, x - left), (1, 0, right - x), (0, -1, y - top), (0, 1, bottom - y)),
+                         key=lambda side: side[2])[:2]
+        return (0.0, nx, ny) if dx * nx + dy * ny < 0 else None
+    contacts = [box_contact(x, y, dx, dy, left - radius, top, right + radius, bottom),
+                box_contact(x, y, dx, dy, left, top - radius, right, bottom + radius)]
+    contacts += [circle_contact(x, y, dx, dy, radius, cx, cy, 0)
+                 for cx in (left, right) for cy in (top, bottom)]
+    return min((contact for contact in contacts if contact is not None), default=None)
+
+
+def swept_rect(x, y, dx, dy, radius):
+    # The area a circle at (x, y) covers while moving by (dx, dy), for the broadphase
+    left, top = math.floor(min(x, x + dx) - radius), math.floor(min(y, y + dy) - radius)
+    right, bottom = math.ceil(max(x, x + dx) + radius), math.ceil(max(y, y + dy) + radius)
+    return pygame.Rect(left, top, right - left + 1, bottom - top + 1)
@@ -1,10 +1,20 @@
 import pygame
+import argparse
+import os
 import sys
 import random
 import math
-
-# Initialize Pygame
-pygame.init()
+import itertools
+import inspect
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import audio, benchmark, checkpoint, export, recording, stream
+from common.audio import Sample, Soundtrack, VoiceManager
+from common.profiler import FrameProfiler, ProfilerHud
+from common.timestep import FixedTimestep
+from plinko import ccd, render, transitions
+from plinko.spatial import StaticGrid, touching
 
 # Define constants
 SCREEN_WIDTH = 135                  # 810
@@ -24,6 +34,14 @@ PIN_SPACING_X = 70                 # 120
 HORIZONTAL_OFFSET = 35              # 40
 VERTICAL_OFFSET = 60                # 60
 PIN_MOD = 1                         # 0
+BALL_COLLISIONS = False             # True: balls stay in their slots and pile up
+FPS = 60                            # 60
+PHYSICS_RATE = 60                   # Physics steps per second, independent of FPS
+STEP = 60 / PHYSICS_RATE            # Length of a step in 60 Hz frames, the unit velocities and gravity are tuned in
+MAX_CONTACTS = 4                    # Bounces resolved per ball and step, the ball stops at the next one
+GRAVITY = 0.35                      # Added to a ball's vy every 60 Hz frame
+SEED = None                         # Set to an int to replay a run exactly
+MAX_VOICES = 8                      # Collision notes started per frame at most
 
 if NUM_BALLS == 1:
     # Maybe implement no pins and fast x velocity instead
@@ -33,6 +51,13 @@ if NUM_BALLS == 1:
     PINS_PER_LAYER = 1
     PIN_SPACING_Y = 100
 
+# The constants the physics depends on: the board's, which engine.Board takes as lowercase
+# keywords, then the motion's. The transition tables are cached under their values.
+BOARD_CONSTANTS = ["SCREEN_WIDTH", "SCREEN_HEIGHT", "BALL_RADIUS", "WALL_WIDTH", "WALL_HEIGHT", "NUM_SLOTS",
+                   "SLOT_WIDTH", "SLOT_HEIGHT", "NUM_LAYERS", "PINS_PER_LAYER", "PIN_RADIUS", "PIN_SPACING_Y",
+                   "PIN_SPACING_X", "HORIZONTAL_OFFSET", "VERTICAL_OFFSET", "PIN_MOD"]
+PHYSICS_CONSTANTS = BOARD_CONSTANTS + ["GRAVITY", "PHYSICS_RATE", "STEP", "MAX_CONTACTS"]
+
 # Define colors
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
@@ -49,14 +74,15 @@ PURPLE = (128,0,255)
 MAGENTA = (255,0,255)
 PINK = (255,0,128)
 
-# Sounds
-pygame.mixer.set_num_channels(200)
-a_note = pygame.mixer.Sound("sounds/A_BELL.wav")
-c_note = pygame.mixer.Sound("sounds/C_BELL.wav")
-c_sharp_note = pygame.mixer.Sound("sounds/C#_BELL.wav")
-d_note = pygame.mixer.Sound("sounds/D_BELL.wav")
-e_note = pygame.mixer.Sound("sounds/E_BELL.wav")
-f_note = pygame.mixer.Sound("sounds/F_BELL.wav")
+# Sounds, decoded the first time they play
+SOUNDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sounds")
+MIXER_CHANNELS = 200
+a_note = Sample(os.path.join(SOUNDS, "A_BELL.wav"))
+c_note = Sample(os.path.join(SOUNDS, "C_BELL.wav"))
+c_sharp_note = Sample(os.path.join(SOUNDS, "C#_BELL.wav"))
+d_note = Sample(os.path.join(SOUNDS, "D_BELL.wav"))
+e_note = Sample(os.path.join(SOUNDS, "E_BELL.wav"))
+f_note = Sample(os.path.join(SOUNDS, "F_BELL.wav"))
 score = [f_note, d_note, a_note, d_note, 
          f_note, d_note, a_note, d_note, 
          f_note, c_note, a_note, c_note, 
@@ -65,73 +91,77 @@ score = [f_note, d_note, a_note, d_note,
          e_note, c_sharp_note, a_note, c_sharp_note, 
          e_note, c_sharp_note, a_note, c_sharp_note, 
          e_note, c_sharp_note, a_note, c_sharp_note]
-score_pointer = 0
+bells = [a_note, c_note, c_sharp_note, d_note, e_note, f_note]  # Recordings refer to notes by their index here
 
-# Define classes
+
+# Define classes. The scene's run-time state is passed in: the RNG a ball's drop comes from,
+# the timestep its rainbow hue follows and its id in recordings.
 class Ball(pygame.sprite.Sprite):
-    def __init__(self, x=None, y=None):
+    def __init__(self, rng, timestep, serial, x=None, y=None):
         super().__init__()
+        self.timestep = timestep
+        self.serial = serial
         self.radius = BALL_RADIUS
-        self.image = pygame.Surface((self.radius * 2, self.radius * 2), pygame.SRCALPHA)
         self.color_change_speed = 0.05
-        self.color = self.get_rainbow_color()
-        pygame.draw.circle(self.image, self.color, (self.radius, self.radius), self.radius)
+        self.hue, self.color, self.image = self.get_rainbow_color()
         if x is None:
-            x = random.uniform(0, SCREEN_WIDTH - 2 * BALL_RADIUS)
+            x = rng.uniform(0, SCREEN_WIDTH - 2 * BALL_RADIUS)
         if y is None:
             y = 10
         self.real_x = x
         self.real_y = y
         self.prev_x = x  # Store previous x coordinate
         self.prev_y = y  # Store previous y coordinate
+        self.start_x = x  # Where the step started; move() moves prev on to every contact point
+        self.start_y = y
         self.rect = self.image.get_rect()
         self.rect.x = x
         self.rect.y = y
-        self.velocity = [random.uniform(-5, 5), random.uniform(-3, 1)]  # Initial velocity
-        self.gravity = 0.35  # Gravity strength
+        self.velocity = [rng.uniform(-5, 5), rng.uniform(-3, 1)]  # Initial velocity
+        self.gravity = GRAVITY  # Gravity strength
         self.in_slot = False
         self.started = False
 
     def get_rainbow_color(self):
-        # Function to get a rainbow color based on time
-        color = pygame.Color(0)
-        color.hsva = (int(pygame.time.get_ticks() * self.color_change_speed) % 360, 100, 100, 100)
-        return color
+        # Rainbow hue based on simulated time, with its color and shared pre-rendered image
+        hue = int(self.timestep.ticks * self.color_change_speed) % 360
+        return (hue,) + render.rainbow_ball(hue, self.radius)
 
     def update(self):
         if self.started:
             # Update velocity with gravity
-            self.velocity[1] += self.gravity
+            self.velocity[1] += self.gravity * STEP
 
-            # Update position with velocity
-            self.prev_x = self.real_x  # Store previous x coordinate before updating
-            self.prev_y = self.real_y  # Store previous y coordinate before updating
-            self.real_x += self.velocity[0]
-            self.real_y += self.velocity[1]
+            # Update position with velocity, step() sweeps the move for collisions
+            self.prev_x = self.start_x = self.real_x  # Store previous x coordinate before updating
+            self.prev_y = self.start_y = self.real_y  # Store previous y coordinate before updating
+            self.real_x += self.velocity[0] * STEP
+            self.real_y += self.velocity[1] * STEP
             self.rect.x = self.real_x
             self.rect.y = self.real_y
 
         # Update color
-        self.color = self.get_rainbow_color()
-        self.image.fill((0, 0, 0, 0))  # Clear the surface
-        pygame.draw.circle(self.image, self.color, (self.radius, self.radius), self.radius)
+        self.hue, self.color, self.image = self.get_rainbow_color()
+
 
 class Pin(pygame.sprite.Sprite):
-    def __init__(self, x, y):
+    def __init__(self, x, y, radius):
         super().__init__()
-        self.radius = PIN_RADIUS
+        self.radius = radius
         self.image = pygame.Surface((self.radius * 2, self.radius * 2), pygame.SRCALPHA)
         pygame.draw.circle(self.image, WHITE, (self.radius, self.radius), self.radius)
         self.rect = self.image.get_rect(center=(x, y))
 
 
 class Slot(pygame.sprite.Sprite):
-    def __init__(self, x, y, points, color):
+    def __init__(self, x, y, width, height, points, color):
         super().__init__()
-        self.image = pygame.Surface((SLOT_WIDTH, SLOT_HEIGHT))
+        self.image = pygame.Surface((width, height))
         self.image.fill(color)
         self.rect = self.image.get_rect(topleft=(x, y))
         self.points = points
+        self.landed = 0  # Balls whose first slot this was
+
 
 class Wall(pygame.sprite.Sprite):
     def __init__(self, x, y, width, height):
@@ -140,6 +170,7 @@ class Wall(pygame.sprite.Sprite):
         self.image.fill(WHITE)
         self.rect = self.image.get_rect(topleft=(x, y))
 
+
 class Floor(pygame.sprite.Sprite):
     def __init__(self, x, y, width, height):
         super().__init__()
@@ -148,187 +179,579 @@ class Floor(pygame.sprite.Sprite):
         self.rect = self.image.get_rect(topleft=(x, y))
 
 
-# Create screen
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Plinko Simulation")
-
-# Create groups for sprites
-all_sprites = pygame.sprite.Group()
-balls = pygame.sprite.Group()
-pins = pygame.sprite.Group()
-slots = pygame.sprite.Group()
-walls = pygame.sprite.Group()
-floors = pygame.sprite.Group()
-
-# Create pins (one less pin for even layers)
-for layer in range(NUM_LAYERS):
-    if PIN_MOD == 0:
-        for i in range(PINS_PER_LAYER):
-            pin = Pin(i * PIN_SPACING_X + SLOT_WIDTH // 2 + (layer % 2) * (PIN_SPACING_X // 2) + HORIZONTAL_OFFSET,
-                    (layer + 1) * PIN_SPACING_Y + VERTICAL_OFFSET)
-            pins.add(pin)
-            all_sprites.add(pin)
-    elif PIN_MOD == 1:
-        num_pins = PINS_PER_LAYER - (layer % 2)  # Decrease by one for even layers
-        for i in range(num_pins):
-            pin = Pin(i * PIN_SPACING_X + SLOT_WIDTH // 2 + (layer % 2) * (PIN_SPACING_X // 2) + HORIZONTAL_OFFSET,
-                    (layer + 1) * PIN_SPACING_Y + VERTICAL_OFFSET)
-            pins.add(pin)
-            all_sprites.add(pin)
-
-# Create slots
-# slot_colors = [RED, ORANGE, YELLOW, LIME, GREEN, SEAGREEN, CYAN, SKYBLUE, BLUE, PURPLE, MAGENTA, PINK]
-slot_colors = [RED, RED, RED, RED, RED, RED, RED, RED, RED, RED, RED, RED]
-slot_points = [random.randint(1, 10) for _ in range(NUM_SLOTS)]
-for i, points in enumerate(slot_points):
-    # slot = Slot(i * SLOT_WIDTH, SCREEN_HEIGHT - SLOT_HEIGHT, points, slot_colors[i])
-    slot = Slot(i * SLOT_WIDTH, SCREEN_HEIGHT - (WALL_HEIGHT // 2), points, slot_colors[i])
-    slots.add(slot)
-    all_sprites.add(slot)
-
-# Create walls between slots
-left_wall = Wall(0, 0, WALL_WIDTH, SCREEN_HEIGHT)
-right_wall = Wall(SCREEN_WIDTH - WALL_WIDTH, 0, WALL_WIDTH, SCREEN_HEIGHT)
-walls.add(left_wall, right_wall)
-all_sprites.add(left_wall, right_wall)
-for i in range(NUM_SLOTS - 1):
-    wall = Wall((i + 1) * SLOT_WIDTH - WALL_WIDTH // 2, SCREEN_HEIGHT - WALL_HEIGHT, WALL_WIDTH, WALL_HEIGHT)
-    walls.add(wall)
-    all_sprites.add(wall)
-
-# Create floors
-top_floor = Floor(0, 0, SCREEN_WIDTH, WALL_WIDTH)
-bottom_floor = Floor(0, SCREEN_HEIGHT - WALL_WIDTH, SCREEN_WIDTH, WALL_WIDTH)
-floors.add(top_floor, bottom_floor)
-all_sprites.add(top_floor, bottom_floor)
-
-
 # Define functions
-def play_sound():
-    global score_pointer
-    score[score_pointer].play()
-    score_pointer += 1
-    if score_pointer == len(score):
-        score_pointer = 0
-
-def initialize_balls():
-    global balls
-    gap = SCREEN_WIDTH // (NUM_BALLS + 1)  # Gap between each ball
-    iballs_list = []
-
-    for i in range(NUM_BALLS):
-        x = (i + 1) * gap - BALL_RADIUS  # Place the ball at the center of the gap
-        y = 10
-        new_ball = Ball(x, y)
-        iballs_list.append(new_ball)
-        balls.add(new_ball)
-        all_sprites.add(new_ball)
-
-    return iballs_list
-
-
-# Create balls
-# initial_ball = Ball()
-# balls.add(initial_ball)
-# all_sprites.add(initial_ball)
-        
-# Main loop
-FPS = 60
-frame_count = 0
-clock = pygame.time.Clock()
-iballs_list = initialize_balls()
-spacebar = False
-
-while True:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit()
-        elif event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
-            new_ball = Ball()
-            balls.add(new_ball)
-            all_sprites.add(new_ball)
-        elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-            spacebar = True
-
-    # Start balls
-    if iballs_list and spacebar:
-        if frame_count % 120 == 0:
-            start_ball = random.choice(iballs_list)
-            start_ball.started = True
-            iballs_list.remove(start_ball)        
-
-    # Update
-    all_sprites.update()
-
-    # Check for collisions with pins
+def bounce(ball, other, clamp=True):
+    # Bounce off the other sprite's centre, keeping a damped speed along the line between them.
+    # The direction is worked out without trig, so engine.py's NumPy version gets the same bits.
+    x = ball.real_x + BALL_RADIUS - other.rect.centerx
+    y = ball.real_y + BALL_RADIUS - other.rect.centery
+    distance = math.sqrt(x * x + y * y)
+    speed = math.sqrt(ball.velocity[0] * ball.velocity[0] + ball.velocity[1] * ball.velocity[1])
+    damping_factor = max(0.5, 1 / speed) if speed else 0.5  # Damping factor based on the inverse of the speed
+    ball.velocity[0] = speed * (x / distance if distance else 1.0) * damping_factor
+    ball.velocity[1] = speed * (y / distance if distance else 0.0) * damping_factor
+    if clamp:
+        ball.velocity[0] = max(ball.velocity[0], 1) if ball.velocity[0] > 0 else min(ball.velocity[0], -1)
+        ball.velocity[1] = max(ball.velocity[1], 1) if ball.velocity[1] > 0 else min(ball.velocity[1], -1)
+
+
+def collide_balls(balls):
+    # Balls that end their move overlapping a ball in a slot bounce off it and go back to where
+    # they started the step, so the balls in the slots pile up instead of sinking into each
+    # other. Pairs come from a sweep-and-prune broadphase.
+    ball_hits = touching(balls)
     for ball in balls:
-        pins_hit = pygame.sprite.spritecollide(ball, pins, False)
-        for pin in pins_hit:
-            # Bounce off the pin
-            angle = math.atan2(ball.rect.centery - pin.rect.centery, ball.rect.centerx - pin.rect.centerx)
-            speed = math.sqrt(ball.velocity[0]**2 + ball.velocity[1]**2)
-            damping_factor = max(0.5, 1 / speed)  # Damping factor based on the inverse of the speed
-            ball.velocity[0] = speed * math.cos(angle) * damping_factor
-            ball.velocity[1] = speed * math.sin(angle) * damping_factor
-            ball.velocity[0] = max(ball.velocity[0], 1) if ball.velocity[0] > 0 else min(ball.velocity[0], -1)
-            ball.velocity[1] = max(ball.velocity[1], 1) if ball.velocity[1] > 0 else min(ball.velocity[1], -1)
-            ball.real_x = ball.prev_x
-            ball.real_y = ball.prev_y
-            play_sound()
-
-        # Check for collisions with walls
-        walls_hit = pygame.sprite.spritecollide(ball, walls, False)
-        for wall in walls_hit:
-            if ball.rect.bottom < wall.rect.top + 20:
+        for other_ball in ball_hits.get(ball, ()):
+            if other_ball.in_slot:
+                bounce(ball, other_ball, clamp=False)
+                ball.real_x, ball.real_y = ball.start_x, ball.start_y
+                ball.rect.x, ball.rect.y = ball.real_x, ball.real_y
+
+
+def main(argv=None, tile=None):
+    # Command line options
+    parser = argparse.ArgumentParser(description="Plinko simulation")
+    parser.add_argument("--seed", type=int, help="seed for the simulation RNG, overrides SEED")
+    parser.add_argument("--crowd", type=int, default=0, metavar="BALLS",
+                        help="with --render batch or heatmap, keep BALLS more balls falling, simulated on arrays by engine.py")
+    export.add_arguments(parser)
+    benchmark.add_arguments(parser, "balls")
+    FrameProfiler.add_arguments(parser)
+    recording.add_arguments(parser)
+    render.add_arguments(parser)
+    transitions.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    stream.add_arguments(parser)
+    audio.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.crowd and args.render == "sprites":
+        parser.error("--crowd needs --render batch or heatmap")
+    if args.fork and args.perturb is None:
+        checkpoint.fork(main, argv, args.fork)
+        return
+    if args.export or args.benchmark or args.predict is not None or args.warmup or args.serve:
+        export.use_dummy_drivers()
+    audio.configure(not args.no_audio and not args.warmup and not args.serve, MIXER_CHANNELS)
+
+    # Initialize Pygame: the mixer and fonts start when they are first used
+    pygame.display.init()
+
+    # Seeded RNG for everything random in the simulation
+    seed = args.seed if args.seed is not None else SEED
+    if seed is None:
+        # On stderr, out of the way of the scripts that read the benchmark and fork results
+        seed = random.randrange(2 ** 32)
+        print(f"Seed: {seed} (pass --seed {seed} to run this again)", file=sys.stderr)
+    rng = random.Random(seed)
+    serials = itertools.count()  # Ball ids for recordings
+    timestep = FixedTimestep(PHYSICS_RATE, FPS)
+    profiler = FrameProfiler(["events", "physics", "collisions", "sound", "draw", "display", "record"])
+    hud = ProfilerHud(profiler, args.hud)
+    if args.trace:
+        profiler.open_trace(args.trace)
+    voices = VoiceManager(score, MAX_VOICES)
+
+    # Create screen
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Plinko Simulation")
+
+    # Create groups for sprites
+    all_sprites = pygame.sprite.Group()
+    balls = pygame.sprite.RenderUpdates()  # Tracks the rects balls are drawn to
+    pins = pygame.sprite.Group()
+    slots = pygame.sprite.Group()
+    walls = pygame.sprite.Group()
+    floors = pygame.sprite.Group()
+
+    # Create pins (one less pin for even layers)
+    for layer in range(NUM_LAYERS):
+        if PIN_MOD == 0:
+            for i in range(PINS_PER_LAYER):
+                pin = Pin(i * PIN_SPACING_X + SLOT_WIDTH // 2 + (layer % 2) * (PIN_SPACING_X // 2) + HORIZONTAL_OFFSET,
+                        (layer + 1) * PIN_SPACING_Y + VERTICAL_OFFSET, PIN_RADIUS)
+                pins.add(pin)
+                all_sprites.add(pin)
+        elif PIN_MOD == 1:
+            num_pins = PINS_PER_LAYER - (layer % 2)  # Decrease by one for even layers
+            for i in range(num_pins):
+                pin = Pin(i * PIN_SPACING_X + SLOT_WIDTH // 2 + (layer % 2) * (PIN_SPACING_X // 2) + HORIZONTAL_OFFSET,
+                        (layer + 1) * PIN_SPACING_Y + VERTICAL_OFFSET, PIN_RADIUS)
+                pins.add(pin)
+                all_sprites.add(pin)
+
+    # Create slots
+    # slot_colors = [RED, ORANGE, YELLOW, LIME, GREEN, SEAGREEN, CYAN, SKYBLUE, BLUE, PURPLE, MAGENTA, PINK]
+    slot_colors = [RED, RED, RED, RED, RED, RED, RED, RED, RED, RED, RED, RED]
+    slot_points = [rng.randint(1, 10) for _ in range(NUM_SLOTS)]
+    for i, points in enumerate(slot_points):
+        # slot = Slot(i * SLOT_WIDTH, SCREEN_HEIGHT - SLOT_HEIGHT, points, slot_colors[i])
+        slot = Slot(i * SLOT_WIDTH, SCREEN_HEIGHT - (WALL_HEIGHT // 2), SLOT_WIDTH, SLOT_HEIGHT, points, slot_colors[i])
+        slots.add(slot)
+        all_sprites.add(slot)
+
+    # Create walls between slots
+    left_wall = Wall(0, 0, WALL_WIDTH, SCREEN_HEIGHT)
+    right_wall = Wall(SCREEN_WIDTH - WALL_WIDTH, 0, WALL_WIDTH, SCREEN_HEIGHT)
+    walls.add(left_wall, right_wall)
+    all_sprites.add(left_wall, right_wall)
+    for i in range(NUM_SLOTS - 1):
+        wall = Wall((i + 1) * SLOT_WIDTH - WALL_WIDTH // 2, SCREEN_HEIGHT - WALL_HEIGHT, WALL_WIDTH, WALL_HEIGHT)
+        walls.add(wall)
+        all_sprites.add(wall)
+
+    # Create floors
+    top_floor = Floor(0, 0, SCREEN_WIDTH, WALL_WIDTH)
+    bottom_floor = Floor(0, SCREEN_HEIGHT - WALL_WIDTH, SCREEN_WIDTH, WALL_WIDTH)
+    floors.add(top_floor, bottom_floor)
+    all_sprites.add(top_floor, bottom_floor)
+
+    # Static broadphase for collisions, cells follow the staggered pin lattice
+    pin_grid = StaticGrid(pins, PIN_SPACING_X // 2, PIN_SPACING_Y)
+    wall_grid = StaticGrid(walls, PIN_SPACING_X // 2, PIN_SPACING_Y)
+    floor_grid = StaticGrid(floors, PIN_SPACING_X // 2, PIN_SPACING_Y)
+    slot_grid = StaticGrid(slots, PIN_SPACING_X // 2, PIN_SPACING_Y)
+
+    # Static sprites composited once, balls are drawn over them
+    scenery = render.Scenery(screen.get_size(), all_sprites)
+    heatmap = render.Heatmap(scenery, args.decay, args.colormap) if args.render == "heatmap" else None
+
+    # Crowd: --crowd balls on the same board, simulated on arrays by engine.py and drawn from
+    # them. They don't touch the sprites and aren't recorded, exported or checkpointed.
+    crowd = None
+    if args.crowd:
+        import numpy as np  # Only the crowd needs NumPy
+        from plinko.engine import Board, Engine
+
+        crowd = Engine(Board(slot_points=slot_points), rng.randrange(2 ** 32), keep_steps=False)
+
+
+    # Define functions
+    def new_ball(x=None, y=None):
+        # A ball with the next recording id, in no group yet
+        return Ball(rng, timestep, next(serials), x, y)
+
+    def play_sound():
+        # Queued, the voice manager starts the notes once per frame
+        voices.hit()
+
+    def first_contact(ball):
+        # The earliest pin, wall or floor the ball touches on its move from prev to real, as
+        # (t, nx, ny, obstacle), or None
+        x, y = ball.prev_x + BALL_RADIUS, ball.prev_y + BALL_RADIUS
+        dx, dy = ball.real_x - ball.prev_x, ball.real_y - ball.prev_y
+        area = ccd.swept_rect(x, y, dx, dy, BALL_RADIUS)
+        contacts = []
+        for pin in pin_grid.query(area):
+            contact = ccd.circle_contact(x, y, dx, dy, BALL_RADIUS, *pin.rect.center, pin.radius)
+            if contact:
+                contacts.append(contact + (pin,))
+        for obstacle in wall_grid.query(area) + floor_grid.query(area):
+            rect = obstacle.rect
+            contact = ccd.rect_contact(x, y, dx, dy, BALL_RADIUS, rect.left, rect.top, rect.right, rect.bottom)
+            if contact:
+                contacts.append(contact + (obstacle,))
+        return min(contacts, key=lambda contact: contact[0], default=None)
+
+    def move(ball):
+        # Resolve the ball's move for this step: at the first obstacle in the way it stops at
+        # the point of contact, bounces, and moves with its new velocity for the rest of the
+        # step, so no speed is fast enough to pass through a pin or a wall. Returns the area
+        # the whole move swept through.
+        remaining = 1.0  # Fraction of the step still to move
+        path = pygame.Rect(ball.prev_x, ball.prev_y, BALL_RADIUS * 2, BALL_RADIUS * 2)
+        for bounces_left in range(MAX_CONTACTS, -1, -1):
+            contact = first_contact(ball)
+            if contact is None:
+                break
+            t, nx, ny, obstacle = contact
+            ball.real_x = ball.prev_x + (ball.real_x - ball.prev_x) * t
+            ball.real_y = ball.prev_y + (ball.real_y - ball.prev_y) * t
+            path.union_ip(pygame.Rect(ball.real_x, ball.real_y, BALL_RADIUS * 2, BALL_RADIUS * 2))
+            if not bounces_left:
+                break
+
+            if isinstance(obstacle, Pin):
+                # Bounce off the pin
+                bounce(ball, obstacle)
+                play_sound()
+            elif isinstance(obstacle, Wall) and ny < 0:
                 # Ball hits the top of the wall
-                angle = math.atan2(ball.rect.centery - wall.rect.centery, ball.rect.centerx - wall.rect.centerx)
-                speed = math.sqrt(ball.velocity[0]**2 + ball.velocity[1]**2)
-                damping_factor = max(0.5, 1 / speed)  # Damping factor based on the inverse of the speed
-                ball.velocity[0] = speed * math.cos(angle) * damping_factor
-                ball.velocity[1] = speed * math.sin(angle) * damping_factor
-                ball.velocity[0] = max(ball.velocity[0], 1) if ball.velocity[0] > 0 else min(ball.velocity[0], -1)
-                ball.velocity[1] = max(ball.velocity[1], 1) if ball.velocity[1] > 0 else min(ball.velocity[1], -1)
-                ball.real_x = ball.prev_x
-                ball.real_y = ball.prev_y
+                bounce(ball, obstacle)
                 play_sound()
-            else:
+            elif isinstance(obstacle, Wall):
                 # Ball hits the side of the wall
                 ball.velocity[0] *= -0.7
-                ball.real_x = ball.prev_x
-
-        # Check for collisions with floors
-        floors_hit = pygame.sprite.spritecollide(ball, floors, False)
-        for floor in floors_hit:
-            ball.velocity[1] *= -0.3  # Bounce off the ground with some damping
-            ball.real_x = ball.prev_x
-            ball.real_y = ball.prev_y
-
-        # Check for collisions with slots
-        if not ball.in_slot:
-            slot_hits = pygame.sprite.spritecollide(ball, slots, False)
-            for slot in slot_hits:
-                ball.in_slot = True
-                ball.kill()
-                slot.image.fill(GREEN)
+            else:
+                ball.velocity[1] *= -0.3  # Bounce off the ground with some damping
+
+            remaining *= 1 - t
+            ball.prev_x, ball.prev_y = ball.real_x, ball.real_y
+            ball.real_x += ball.velocity[0] * STEP * remaining
+            ball.real_y += ball.velocity[1] * STEP * remaining
+        ball.rect.x = ball.real_x
+        ball.rect.y = ball.real_y
+        return path.union(ball.rect).inflate(2, 2)
+
+    def initialize_balls():
+        gap = SCREEN_WIDTH // (NUM_BALLS + 1)  # Gap between each ball
+        iballs_list = []
+
+        for i in range(NUM_BALLS):
+            x = (i + 1) * gap - BALL_RADIUS  # Place the ball at the center of the gap
+            y = 10
+            ball = new_ball(x, y)
+            iballs_list.append(ball)
+            balls.add(ball)
+            all_sprites.add(ball)
+
+        return iballs_list
+
+    def describe_board():
+        # Everything the transition tables depend on besides the physics code, as plain data
+        constants = {name: globals()[name] for name in PHYSICS_CONSTANTS}
+        return {"constants": constants,
+                "obstacles": [[type(sprite).__name__, tuple(sprite.rect)] for sprite in all_sprites if sprite not in balls]}
+
+    # Stage lines of the transition tables: where balls are dropped, then halfway between
+    # every pin layer and the one above
+    lines = [10 + BALL_RADIUS] + [(layer + 1) * PIN_SPACING_Y + VERTICAL_OFFSET - PIN_SPACING_Y / 2
+                                  for layer in range(NUM_LAYERS)]
+    slot_list = list(slots)
+
+    def cross(stage, x, y, vx, vy):
+        # Balls through one stage, for transitions.build(), on engine.py's arrays: from their
+        # centers at x and y until they cross the stage's bottom line, or land in a slot
+        import numpy as np  # Only the predictions need NumPy
+        from plinko.engine import Board, Engine
+
+        batch = Engine(Board(**{name.lower(): globals()[name] for name in BOARD_CONSTANTS}), keep_steps=False)
+        batch.spawn(len(x), x - BALL_RADIUS, y - BALL_RADIUS, vx, vy)
+        end = lines[stage + 1] if stage + 1 < len(lines) else None
+        outcomes = np.full(len(x), -1) if end is None else np.full((len(x), 4), np.nan)
+        for _ in range(transitions.MAX_STEPS):
+            if not len(batch):
+                break
+            batch.step()
+            if end is None:
+                serials, landed_slots = batch.landings
+                outcomes[serials] = landed_slots
+                continue
+            # Balls carry on in the next stage from exactly where this step left them
+            crossed = batch.y + BALL_RADIUS >= end
+            centers = (batch.x[crossed] + BALL_RADIUS, batch.y[crossed] + BALL_RADIUS)
+            outcomes[batch.serial[crossed]] = np.column_stack(centers + (batch.vx[crossed], batch.vy[crossed]))
+            batch.keep(~crossed)
+        return outcomes
+
+    def predict(count):
+        # --predict: expected balls per slot from the transition tables, built first if the
+        # board changed. Ball collisions are left out, as if BALL_COLLISIONS were False.
+        from plinko import engine
+
+        # Bins over the centers balls are dropped at, lined up with the first pin of a layer
+        bins = transitions.Bins((BALL_RADIUS, SCREEN_WIDTH - BALL_RADIUS), PIN_SPACING_X,
+                                SLOT_WIDTH // 2 + HORIZONTAL_OFFSET)
+        np = bins.np
+        # The tables depend on the physics code the batches run, not on the rest of the scene
+        sources = [inspect.getsource(code) for code in (engine.rect_round, engine.RectLattice, engine.circle_contacts,
+                                                        engine.box_contacts, engine.rect_contacts, engine.Board,
+                                                        engine.Engine, cross)]
+        key = transitions.board_key(describe_board(), sources)
+        # Balls are dropped like Ball() drops them, anywhere across the board or at --drop-x
+        x_range = (BALL_RADIUS, SCREEN_WIDTH - BALL_RADIUS) if args.drop_x is None else (args.drop_x, args.drop_x)
+        spawn = {"x_range": x_range, "vx_range": (-5, 5), "vy_range": (-3, 1)}
+
+        tables = None if args.rebuild else transitions.load(args.tables, "comp", key, np)
+        if tables is None:
+            start = time.perf_counter()
+            everywhere = bins.spawn(**dict(spawn, x_range=(BALL_RADIUS, SCREEN_WIDTH - BALL_RADIUS)))
+            tables = transitions.build(bins, len(lines), NUM_SLOTS, cross, everywhere, lines[0])
+            transitions.save(args.tables, "comp", key, tables, np)
+            print(f"Built transition tables {key} in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        shares = transitions.predict(tables, bins.spawn(**spawn), NUM_SLOTS)
+        elapsed = (time.perf_counter() - start) * 1000
+        for index, (slot, share) in enumerate(zip(slot_list, shares.tolist())):
+            print(f"Slot {index + 1} ({slot.points} points): {share:7.2%} {share * count:10.1f} balls")
+        lost = 1 - float(shares.sum())
+        if lost > 0.0005:
+            print(f"Lost: {lost:.2%} of the balls never reached a slot in the table runs")
+        print(f"Expected points: {float(shares @ [slot.points for slot in slot_list]) * count:.1f} "
+              f"for {count} balls, predicted in {elapsed:.1f} ms")
+        return shares.tolist()
+
+
+    # Create balls
+    # initial_ball = Ball()
+    # balls.add(initial_ball)
+    # all_sprites.add(initial_ball)
+        
+    # Physics step
+    def step():
+        nonlocal frame_count
+
+        # Start balls
+        if iballs_list and spacebar:
+            if frame_count % round(120 / STEP) == 0:
+                start_ball = rng.choice(iballs_list)
+                start_ball.started = True
+                iballs_list.remove(start_ball)        
+
+        # Update
+        all_sprites.update()
+        profiler.mark("physics")
+
+        for ball in balls:
+            # Move the ball, bouncing off the pins, walls and floors in its way
+            path = move(ball)
+
+            # Check for collisions with slots, along the path so fast balls can't skip one
+            if not ball.in_slot:
+                slot_hits = slot_grid.query(path)
+                if slot_hits:
+                    slot_hits[0].landed += 1
+                for slot in slot_hits:
+                    ball.in_slot = True
+                    if not BALL_COLLISIONS:
+                        ball.kill()
+                    slot.image.fill(GREEN)
+                    scenery.refresh(slot)
 
         # Check for collisions with other balls
-        # balls_hit = pygame.sprite.spritecollide(ball, balls, False)
-        # for other_ball in balls_hit:
-        #     if ball != other_ball and other_ball.in_slot:
-        #         # Bounce off the other ball
-        #         angle = math.atan2(ball.rect.centery - other_ball.rect.centery, ball.rect.centerx - other_ball.rect.centerx)
-        #         speed = math.sqrt(ball.velocity[0] ** 2 + ball.velocity[1] ** 2)
-        #         damping_factor = max(0.5, 1 / speed) 
-        #         ball.velocity[0] = speed * math.cos(angle) * damping_factor
-        #         ball.velocity[1] = speed * math.sin(angle) * damping_factor
-        #         ball.real_x = ball.prev_x
-        #         ball.real_y = ball.prev_y
-
-    # Draw
-    screen.fill(BLACK)
-    all_sprites.draw(screen)
-
-    pygame.display.flip()
-    clock.tick(FPS)
-    frame_count += 1
+        if BALL_COLLISIONS:
+            collide_balls(balls)
+
+        # The crowd, topped up to --crowd balls in flight
+        if crowd is not None:
+            crowd.spawn(args.crowd - len(crowd))
+            crowd.step()
+        profiler.mark("collisions")
+
+        frame_count += 1
+
+
+    def ball_arrays():
+        # Top-left corners and hues of the balls for the batch and heatmap modes: the sprites,
+        # then the crowd
+        xs, ys, hues = render.ball_arrays(balls)
+        if crowd is not None:
+            left, top = crowd.corners()
+            hue = int(timestep.ticks * 0.05) % 360  # What Ball.get_rainbow_color() gives now
+            xs, ys = np.concatenate([xs, left]), np.concatenate([ys, top])
+            hues = np.concatenate([hues, np.full(len(left), hue)])
+        return xs, ys, hues
+
+    # Checkpoints: everything that changes while the scene runs, as plain data
+    def save_state():
+        nonlocal serials
+        serial = next(serials)  # Reading the counter uses a number up, so it starts again there
+        serials = itertools.count(serial)
+        order = balls.sprites()
+        return {"timestep": checkpoint.save_timestep(timestep),
+                "seed": seed,
+                "rng": rng.getstate(),
+                "serial": serial,
+                "balls": [(ball.serial, ball.hue, ball.real_x, ball.real_y, ball.prev_x, ball.prev_y, *ball.velocity,
+                           ball.in_slot, ball.started) for ball in order],
+                "waiting": [order.index(ball) for ball in iballs_list],
+                "frame_count": frame_count,
+                "spacebar": spacebar,
+                "slots": [(slot.points, tuple(slot.image.get_at((0, 0)))[:3], slot.landed) for slot in slots],
+                "score_pointer": voices.score_pointer,
+                "voices": (voices.played, voices.merged, voices.dropped)}
+
+    def restore_state(state):
+        nonlocal seed, serials, iballs_list, frame_count, spacebar
+        seed = state["seed"]
+        checkpoint.restore_timestep(timestep, state["timestep"])
+        for ball in balls.sprites():
+            ball.kill()
+        # Balls are put back in their old order, which is the order they step in. Making one
+        # uses up random numbers and a serial, both restored after.
+        order = []
+        for serial, hue, real_x, real_y, prev_x, prev_y, vx, vy, in_slot, started in state["balls"]:
+            ball = new_ball(real_x, real_y)
+            ball.serial, ball.hue = serial, hue
+            ball.color, ball.image = render.rainbow_ball(hue, ball.radius)
+            ball.prev_x, ball.prev_y = prev_x, prev_y
+            ball.velocity = [vx, vy]
+            ball.in_slot, ball.started = in_slot, started
+            balls.add(ball)
+            all_sprites.add(ball)
+            order.append(ball)
+        iballs_list = [order[index] for index in state["waiting"]]
+        rng.setstate(state["rng"])
+        serials = itertools.count(state["serial"])
+        frame_count, spacebar = state["frame_count"], state["spacebar"]
+        for slot, (points, color, landed) in zip(slots, state["slots"]):
+            slot.points, slot.landed = points, landed
+            if color != tuple(slot.image.get_at((0, 0)))[:3]:
+                slot.image.fill(color)
+                scenery.refresh(slot)
+        voices.score_pointer = state["score_pointer"]
+        voices.played, voices.merged, voices.dropped = state["voices"]
+
+    def perturb(copy):
+        # A --fork copy: its own random numbers from here on, and velocities nudged by up to --jitter
+        checkpoint.reseed(rng, copy)
+        for ball in balls:
+            ball.velocity[0] += rng.uniform(-args.jitter, args.jitter)
+            ball.velocity[1] += rng.uniform(-args.jitter, args.jitter)
+
+    def outcome():
+        return {"seconds": round(timestep.time / 1000, 3), "balls": len(balls), "waiting": len(iballs_list),
+                "slots_hit": sum(tuple(slot.image.get_at((0, 0)))[:3] == GREEN for slot in slots),
+                "landed": [slot.landed for slot in slots],
+                "notes": voices.played}
+
+    # Input. The stream server and the recorder start with the main loop, but QUIT can come
+    # before that, during a warm-up or an export.
+    server = recorder = None
+
+    def handle_event(event):
+        nonlocal spacebar
+        if event.type == pygame.QUIT:
+            print(f"Sound: {voices.summary()}")
+            profiler.close()
+            if recorder:
+                recorder.close()
+            if server:
+                server.close()
+            pygame.quit()
+            sys.exit()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
+            ball = new_ball()
+            balls.add(ball)
+            all_sprites.add(ball)
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+            spacebar = True
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_f:
+            # Toggle unthrottled fast-forward
+            timestep.fast_forward = not timestep.fast_forward
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_h:
+            hud.visible = not hud.visible
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
+            checkpoint.save(checkpoint.path(args), "plinko/comp.py", save_state())
+
+
+    # Main loop
+    frame_count = 0
+    clock = pygame.time.Clock()
+    elapsed = 1000 / FPS
+    iballs_list = initialize_balls()
+    spacebar = False
+
+    # Replay: show or export a recording instead of simulating
+    if args.replay:
+        layout = render.describe(all_sprites, balls, slots)
+        recording.replay(args.replay, screen, render.render_frame, layout, render.decode, bells, args.export, args.workers)
+        return
+
+    # Prediction: slot distribution from transition tables instead of dropping balls
+    if args.predict is not None:
+        return predict(args.predict)
+
+    # Checkpoints: start from a saved state, perturbed in a --fork copy
+    if args.restore:
+        restore_state(checkpoint.load(args.restore, "plinko/comp.py"))
+    if args.perturb is not None:
+        perturb(args.perturb)
+
+    # Warm-up: simulate headless and save the state for later runs to start from
+    if args.warmup:
+        checkpoint.simulate(timestep, step, args.warmup, voices, args.keys, handle_event)
+        checkpoint.save(checkpoint.path(args), "plinko/comp.py", save_state())
+        return
+
+    # A --fork copy: simulate headless and hand the outcome back
+    if args.perturb is not None:
+        checkpoint.simulate(timestep, step, args.seconds, voices, args.keys, handle_event)
+        if args.save:
+            checkpoint.save(checkpoint.path(args), "plinko/comp.py", save_state())
+        return outcome()
+
+    # Offline export: simulate headless, then render the recorded frames in parallel
+    if args.export:
+        if audio.enabled():
+            voices.soundtrack = Soundtrack(timestep)
+        states = export.record(timestep, step, lambda: render.snapshot(balls, slots), handle_event, args.seconds, args.keys, voices)
+        layout = render.describe(all_sprites, balls, slots)
+        export.FrameExporter(render.render_frame, screen.get_size(), layout, args.export, FPS, args.workers).export(states, voices.soundtrack)
+        return
+
+    # Benchmark: --count balls dropped at once
+    if args.benchmark:
+        for _ in range(args.count or 1):
+            ball = new_ball()
+            ball.started = True
+            balls.add(ball)
+            all_sprites.add(ball)
+
+    # Streaming: frames go to socket clients instead of the window
+    server = stream.Server(args.serve, screen.get_size(), FPS, args.encoding, args.queue) if args.serve else None
+
+    # Recording: every frame from here on
+    if args.record:
+        recorder = recording.Recorder(args.record, FPS, *render.recording_columns(len(slots)), track="balls",
+                                      meta={"scene": "plinko/comp.py", "seed": seed})
+
+    while True:
+        profiler.start()
+        for event in pygame.event.get():
+            handle_event(event)
+        profiler.mark("events")
+
+        # Run as many fixed physics steps as the last frame took
+        timestep.advance(step, elapsed)
+        notes = voices.flush()
+        profiler.mark("sound")
+
+        # Draw the balls over the static background, pushing only the changed rects or, in
+        # batch mode, the whole frame
+        if args.render == "batch":
+            dirty = scenery.draw_batch(screen, *ball_arrays(), BALL_RADIUS)
+        elif args.render == "heatmap":
+            xs, ys, _ = ball_arrays()
+            dirty = heatmap.draw(screen, xs + BALL_RADIUS, ys + BALL_RADIUS)
+        else:
+            dirty = scenery.draw(screen, balls)
+        if hud.visible:
+            # The overlay goes on top; the next frame restores the background under it
+            rect = hud.draw(screen)
+            dirty.append(rect)
+            scenery.changed.append(rect)
+        profiler.mark("draw")
+        if tile:
+            # A board of a tiled wall hands its frame to the compositor, see common/tiles.py
+            tile.publish(screen, dirty)
+        elif server:
+            server.publish(screen, dirty)
+        else:
+            pygame.display.update(dirty)
+        profiler.mark("display")
+        if recorder:
+            render.record_frame(recorder, balls, slots, [bells.index(note) for note in notes])
+            profiler.mark("record")
+        profiler.end_frame(balls=len(balls))
+
+        if args.benchmark:
+            # Unthrottled, with the same physics steps every frame
+            if profiler.frames == args.benchmark:
+                benchmark.report(profiler, balls=len(balls))
+                profiler.close()
+                if recorder:
+                    recorder.close()
+                if server:
+                    server.close()
+                return
+            elapsed = 1000 / FPS
+        elif tile:
+            # In lockstep with the other boards, the compositor keeps the pace
+            elapsed = 1000 / FPS
+        else:
+            elapsed = timestep.tick(clock)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+"""Headless, vectorized version of the plinko/comp.py board.
+
+Every ball lives in a row of a set of NumPy arrays and all balls are advanced
+together with the same rules the sprite loop uses: gravity, then a move swept
+for contacts as comp.py sweeps it (see ccd.py), bouncing off pins, wall tops
+and sides and floors at the time of impact, and landing in the first slot the
+move passes over. The contact maths is ccd.py's on arrays, in the same order,
+and the board and motion constants are comp.py's own, so a ball takes the
+same path here as in the scene. There is no window and no frame limiter, so
+large batches can be run to estimate slot distributions.
+
+    python engine.py --balls 100000 --seed 1
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from plinko import comp
+
+GRAVITY = comp.GRAVITY
+MAX_CONTACTS = comp.MAX_CONTACTS
+STEP = comp.STEP
+SWEEP = 24  # Move per step, in pixels, the broadphase is laid out for; faster balls try every rect
+
+
+def rect_round(value):
+    # pygame rounds half away from zero when a float is assigned to a Rect attribute
+    return np.copysign(np.floor(np.abs(value) + 0.5), value).astype(np.int64)
+
+
+class RectLattice:
+    # Static rects bucketed on a uniform grid. Every rect is listed in each cell the top-left
+    # corner of a box up to size wide and high can be in while overlapping it, so the area a
+    # ball sweeps in a step only looks at one cell.
+    def __init__(self, rects, cell_width, cell_height, size, width, height):
+        self.size = size
+        self.cell_width = max(1, int(cell_width))
+        self.cell_height = max(1, int(cell_height))
+        self.cells_x = int(width) // self.cell_width + 1
+        self.cells_y = int(height) // self.cell_height + 1
+        cells = [[] for _ in range(self.cells_x * self.cells_y)]
+        for index, (x, y, w, h) in enumerate(rects):
+            x0, x1 = self.cell_x(x - size + 1), self.cell_x(x + w - 1)
+            y0, y1 = self.cell_y(y - size + 1), self.cell_y(y + h - 1)
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    cells[cx * self.cells_y + cy].append(index)
+        # columns[k][cell] is the k-th rect of a cell (in rect order), or a sentinel far off the board
+        depth = max(map(len, cells), default=0)
+        self.columns = np.full((depth, len(cells)), len(rects), dtype=np.int64)
+        for cell, indices in enumerate(cells):
+            self.columns[:len(indices), cell] = indices
+        self.used = np.array([bool(indices) for indices in cells])
+        padded = np.vstack([np.asarray(rects, dtype=np.int64).reshape(-1, 4), [(-10 ** 9, -10 ** 9, 0, 0)]])
+        self.lefts, self.tops = padded[:, 0], padded[:, 1]
+        self.rights, self.bottoms = padded[:, 0] + padded[:, 2], padded[:, 1] + padded[:, 3]
+
+    def cell_x(self, x):
+        return min(max(x // self.cell_width, 0), self.cells_x - 1)
+
+    def cell_y(self, y):
+        return min(max(y // self.cell_height, 0), self.cells_y - 1)
+
+    def cells(self, left, top):
+        # Grid cell of each box's top-left corner; lattices with the same grid can share it
+        cell_x = np.minimum(np.maximum(left // self.cell_width, 0), self.cells_x - 1)
+        cell_y = np.minimum(np.maximum(top // self.cell_height, 0), self.cells_y - 1)
+        return cell_x * self.cells_y + cell_y
+
+    def overlap(self, left, top, right, bottom, rect):
+        # pygame's Rect.colliderect between boxes and rects
+        return ((left < self.rights[rect]) & (right > self.lefts[rect])
+                & (top < self.bottoms[rect]) & (bottom > self.tops[rect]))
+
+    def near(self, left, top, right, bottom, cell):
+        # Overlaps between boxes and the rects as (boxes, rects) index arrays, one entry per
+        # pair. Boxes bigger than size, from balls moving very fast, are tried on every rect.
+        small = (right - left <= self.size) & (bottom - top <= self.size)
+        fits = np.flatnonzero(small & self.used[cell])
+        box = left[fits], top[fits], right[fits], bottom[fits]
+        cell = cell[fits]
+        boxes, rects = [], []
+        for column in self.columns:
+            rect = column[cell]
+            hit = self.overlap(*box, rect)
+            boxes.append(fits[hit])
+            rects.append(rect[hit])
+        big = np.flatnonzero(~small)
+        for rect in range(len(self.lefts) - 1):
+            hit = self.overlap(left[big], top[big], right[big], bottom[big], rect)
+            boxes.append(big[hit])
+            rects.append(np.full(hit.sum(), rect, dtype=np.int64))
+        if not boxes:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(boxes), np.concatenate(rects)
+
+
+def circle_contacts(x, y, dx, dy, radius, cx, cy, other_radius):
+    # ccd.circle_contact for arrays of moves and circles, as arrays of t, nx and ny with
+    # t = inf where there is no contact
+    px, py = x - cx, y - cy
+    reach = radius + other_radius
+    a = dx * dx + dy * dy
+    b = px * dx + py * dy
+    c = px * px + py * py - reach * reach
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = np.sqrt(px * px + py * py)
+        t = (-b - np.sqrt(b * b - a * c)) / a
+        inside = (c <= 0) & (b < 0)
+        ahead = (c > 0) & (b < 0) & (b * b - a * c >= 0) & (t <= 1)
+        nx = np.where(inside, px / distance, (px + t * dx) / reach)
+        ny = np.where(inside, py / distance, (py + t * dy) / reach)
+    return np.where(inside, 0.0, np.where(ahead, t, np.inf)), nx, ny
+
+
+def box_contacts(x, y, dx, dy, left, top, right, bottom):
+    # ccd.box_contact for arrays of moves and boxes (slab test), t = inf where there is none
+    entry, exit = np.zeros(len(x)), np.ones(len(x))
+    nx, ny = np.zeros(len(x)), np.zeros(len(x))
+    normal = np.zeros(len(x), dtype=bool)
+    valid = np.ones(len(x), dtype=bool)
+    for start, move, low, high, axis in ((x, dx, left, right, 0), (y, dy, top, bottom, 1)):
+        still = move == 0
+        valid &= ~still | ((low < start) & (start < high))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            near, far = (low - start) / move, (high - start) / move
+        near, far = np.minimum(near, far), np.maximum(near, far)
+        moving = valid & ~still
+        entered = moving & (near >= entry)
+        entry = np.where(entered, near, entry)
+        sign = np.where(move > 0, -1.0, 1.0)
+        nx = np.where(entered, sign if axis == 0 else 0.0, nx)
+        ny = np.where(entered, sign if axis == 1 else 0.0, ny)
+        normal |= entered
+        exit = np.where(moving, np.minimum(exit, far), exit)
+        valid &= ~(moving & (entry > exit))
+    return np.where(valid & normal, entry, np.inf), nx, ny
+
+
+def rect_contacts(x, y, dx, dy, radius, left, top, right, bottom):
+    # ccd.rect_contact for arrays of moves and rects: the first contact with the rect grown by
+    # the radius with rounded corners, ties going to the smaller normal like min() on tuples
+    end_x, end_y = x + dx, y + dy
+    near = ~((np.minimum(x, end_x) > right + radius) | (np.maximum(x, end_x) < left - radius) |
+             (np.minimum(y, end_y) > bottom + radius) | (np.maximum(y, end_y) < top - radius))
+    px = x - np.minimum(np.maximum(x, left), right)
+    py = y - np.minimum(np.maximum(y, top), bottom)
+    inside = near & (px * px + py * py < radius * radius)
+
+    # Already overlapping: push out of the nearest side
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = np.sqrt(px * px + py * py)
+        side = np.argmin([x - left, right - x, y - top, bottom - y], axis=0)
+        centred = (px == 0) & (py == 0)
+        out_x = np.where(centred, np.array([-1.0, 1.0, 0.0, 0.0])[side], px / distance)
+        out_y = np.where(centred, np.array([0.0, 0.0, -1.0, 1.0])[side], py / distance)
+
+    candidates = [box_contacts(x, y, dx, dy, left - radius, top, right + radius, bottom),
+                  box_contacts(x, y, dx, dy, left, top - radius, right, bottom + radius)]
+    candidates += [circle_contacts(x, y, dx, dy, radius, cx, cy, 0) for cx in (left, right) for cy in (top, bottom)]
+    t, nx, ny = candidates[0]
+    for other_t, other_nx, other_ny in candidates[1:]:
+        better = (other_t < t) | ((other_t == t) & ((other_nx < nx) | ((other_nx == nx) & (other_ny < ny))))
+        t, nx, ny = np.where(better, other_t, t), np.where(better, other_nx, nx), np.where(better, other_ny, ny)
+
+    leaving = inside & ~(dx * out_x + dy * out_y < 0)
+    t = np.where(inside, 0.0, np.where(near, t, np.inf))
+    return np.where(leaving, np.inf, t), np.where(inside, out_x, nx), np.where(inside, out_y, ny)
+
+
+class Board:
+    # Static geometry of a comp.py board. Keyword names are the lowercase versions of
+    # comp.BOARD_CONSTANTS and default to those constants, so the default board is the one
+    # comp.py runs.
+    def __init__(self, screen_width=comp.SCREEN_WIDTH, screen_height=comp.SCREEN_HEIGHT,
+                 ball_radius=comp.BALL_RADIUS, wall_width=comp.WALL_WIDTH, wall_height=comp.WALL_HEIGHT,
+                 num_slots=comp.NUM_SLOTS, slot_width=comp.SLOT_WIDTH, slot_height=comp.SLOT_HEIGHT,
+                 num_layers=comp.NUM_LAYERS, pins_per_layer=comp.PINS_PER_LAYER, pin_radius=comp.PIN_RADIUS,
+                 pin_spacing_y=comp.PIN_SPACING_Y, pin_spacing_x=comp.PIN_SPACING_X,
+                 horizontal_offset=comp.HORIZONTAL_OFFSET, vertical_offset=comp.VERTICAL_OFFSET,
+                 pin_mod=comp.PIN_MOD, slot_points=None, seed=None):
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.ball_radius = ball_radius
+        self.ball_size = int(ball_radius * 2)
+        self.pin_radius = pin_radius
+        if slot_points is None:
+            rng = random.Random(seed)
+            slot_points = [rng.randint(1, 10) for _ in range(num_slots)]
+        self.slot_points = list(slot_points)
+
+        # Pins (one less pin for even layers when pin_mod == 1)
+        pins = []
+        pin_size = int(pin_radius * 2)
+        for layer in range(num_layers):
+            num_pins = pins_per_layer - (layer % 2) if pin_mod == 1 else pins_per_layer
+            for i in range(num_pins):
+                x = i * pin_spacing_x + slot_width // 2 + (layer % 2) * (pin_spacing_x // 2) + horizontal_offset
+                y = (layer + 1) * pin_spacing_y + vertical_offset
+                pins.append((int(rect_round(x)) - pin_size // 2, int(rect_round(y)) - pin_size // 2, pin_size, pin_size))
+        self.pins = np.array(pins, dtype=np.int64).reshape(-1, 4)
+
+        # Slots
+        slots = []
+        for i in range(num_slots):
+            slots.append((int(rect_round(i * slot_width)), int(rect_round(screen_height - wall_height // 2)),
+                          int(slot_width), int(slot_height)))
+        self.slots = np.array(slots, dtype=np.int64).reshape(-1, 4)
+
+        # Side walls, then walls between slots
+        walls = [(0, 0, int(wall_width), int(screen_height)),
+                 (int(rect_round(screen_width - wall_width)), 0, int(wall_width), int(screen_height))]
+        for i in range(num_slots - 1):
+            walls.append((int(rect_round((i + 1) * slot_width - wall_width // 2)),
+                          int(rect_round(screen_height - wall_height)), int(wall_width), int(wall_height)))
+        self.walls = np.array(walls, dtype=np.int64).reshape(-1, 4)
+
+        # Top and bottom floors
+        self.floors = np.array([(0, 0, int(screen_width), int(wall_width)),
+                                (0, int(rect_round(screen_height - wall_width)), int(screen_width), int(wall_width))],
+                               dtype=np.int64)
+
+        # Static broadphase, cells follow the staggered pin lattice and hold what the area a
+        # ball sweeps in a step can touch
+        cell = (pin_spacing_x // 2, pin_spacing_y, self.ball_size + SWEEP, screen_width, screen_height)
+        self.pin_lattice = RectLattice(self.pins, *cell)
+        self.wall_lattice = RectLattice(self.walls, *cell)
+        self.floor_lattice = RectLattice(self.floors, *cell)
+        self.slot_lattice = RectLattice(self.slots, *cell)
+
+    @property
+    def num_slots(self):
+        return len(self.slots)
+
+
+class SimulationResult:
+    def __init__(self, slot_points, counts, landing_steps, stuck):
+        self.slot_points = slot_points
+        self.counts = counts                # Balls landed per slot, in slot order
+        self.landing_steps = landing_steps  # Steps from spawn to landing for every landed ball
+        self.stuck = stuck                  # Balls still in flight when the step limit was hit
+
+    @property
+    def total(self):
+        return int(self.counts.sum()) + self.stuck
+
+    @property
+    def mean_steps(self):
+        return float(self.landing_steps.mean()) if len(self.landing_steps) else float("nan")
+
+    def distribution(self):
+        return self.counts / max(self.total, 1)
+
+
+class Engine:
+    # keep_steps=False drops the steps each ball took to land, for engines that run for ever
+    def __init__(self, board, seed=None, keep_steps=True):
+        self.board = board
+        self.rng = np.random.default_rng(seed)
+        self.keep_steps = keep_steps
+        self.steps = 0
+        self.counts = np.zeros(board.num_slots, dtype=np.int64)
+        self.landed_steps = []
+        empty = np.empty(0)
+        self.x, self.y, self.vx, self.vy = empty, empty, empty, empty
+        self.spawn_step = np.empty(0, dtype=np.int64)
+        self.spawned = 0  # Balls spawned so far, numbered in spawn order in serial
+        self.serial = np.empty(0, dtype=np.int64)
+        self.landings = (self.serial, self.serial)  # Serials and slots of the balls the last step landed
+
+    def __len__(self):
+        return len(self.x)
+
+    def spawn(self, n, x=None, y=None, vx=None, vy=None):
+        # Defaults match Ball(): random x across the top, y = 10 and a random initial velocity
+        board = self.board
+        if x is None:
+            x = self.rng.uniform(0, board.screen_width - 2 * board.ball_radius, n)
+        if y is None:
+            y = np.full(n, 10.0)
+        if vx is None:
+            vx = self.rng.uniform(-5, 5, n)
+        if vy is None:
+            vy = self.rng.uniform(-3, 1, n)
+        self.x = np.concatenate([self.x, np.broadcast_to(np.asarray(x, dtype=float), n)])
+        self.y = np.concatenate([self.y, np.broadcast_to(np.asarray(y, dtype=float), n)])
+        self.vx = np.concatenate([self.vx, np.broadcast_to(np.asarray(vx, dtype=float), n)])
+        self.vy = np.concatenate([self.vy, np.broadcast_to(np.asarray(vy, dtype=float), n)])
+        self.spawn_step = np.concatenate([self.spawn_step, np.full(n, self.steps, dtype=np.int64)])
+        self.serial = np.concatenate([self.serial, np.arange(self.spawned, self.spawned + n)])
+        self.spawned += n
+
+    def keep(self, balls):
+        # Drop every ball but those picked by balls, a mask or indexes
+        self.x, self.y = self.x[balls], self.y[balls]
+        self.vx, self.vy = self.vx[balls], self.vy[balls]
+        self.spawn_step = self.spawn_step[balls]
+        self.serial = self.serial[balls]
+
+    def bounce(self, balls, bx, by, cx, cy):
+        # Bounce off an obstacle centre: keep the speed (damped) along the line between the centres
+        x, y = bx - cx, by - cy
+        vx, vy = self.vx[balls], self.vy[balls]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance = np.sqrt(x * x + y * y)
+            speed = np.sqrt(vx * vx + vy * vy)
+            damping_factor = np.where(speed > 0, np.maximum(0.5, 1 / speed), 0.5)
+            vx = speed * np.where(distance > 0, x / distance, 1.0) * damping_factor
+            vy = speed * np.where(distance > 0, y / distance, 0.0) * damping_factor
+        self.vx[balls] = np.where(vx > 0, np.maximum(vx, 1), np.minimum(vx, -1))
+        self.vy[balls] = np.where(vy > 0, np.maximum(vy, 1), np.minimum(vy, -1))
+
+    def first_contact(self, x, y, dx, dy):
+        # The earliest pin, wall or floor each ball center at (x, y) touches on its move by
+        # (dx, dy), like comp.py's first_contact(): returns the balls that touch one, with t,
+        # the contact normal's y and the obstacle as kind (0 pin, 1 wall, 2 floor) and index
+        board = self.board
+        radius = board.ball_radius
+        left = np.floor(np.minimum(x, x + dx) - radius).astype(np.int64)
+        top = np.floor(np.minimum(y, y + dy) - radius).astype(np.int64)
+        right = np.ceil(np.maximum(x, x + dx) + radius).astype(np.int64) + 1
+        bottom = np.ceil(np.maximum(y, y + dy) + radius).astype(np.int64) + 1
+        cell = board.pin_lattice.cells(left, top)
+
+        found = []
+        balls, pin = board.pin_lattice.near(left, top, right, bottom, cell)
+        rects = board.pins[pin]
+        t, _, ny = circle_contacts(x[balls], y[balls], dx[balls], dy[balls], radius,
+                                   rects[:, 0] + rects[:, 2] // 2, rects[:, 1] + rects[:, 3] // 2, board.pin_radius)
+        found.append((balls, t, ny, 0, pin))
+        for kind, (lattice, rects) in enumerate(((board.wall_lattice, board.walls),
+                                                 (board.floor_lattice, board.floors)), 1):
+            balls, index = lattice.near(left, top, right, bottom, cell)
+            rects = rects[index]
+            t, _, ny = rect_contacts(x[balls], y[balls], dx[balls], dy[balls], radius, rects[:, 0], rects[:, 1],
+                                     rects[:, 0] + rects[:, 2], rects[:, 1] + rects[:, 3])
+            found.append((balls, t, ny, kind, index))
+
+        # Per ball the smallest t, ties going to the obstacle comp.py lists first
+        balls, t, ny, index = (np.concatenate([entry[i] for entry in found]) for i in (0, 1, 2, 4))
+        kind = np.concatenate([np.full(len(entry[0]), entry[3]) for entry in found])
+        hit = np.isfinite(t)
+        balls, t, ny, kind, index = balls[hit], t[hit], ny[hit], kind[hit], index[hit]
+        order = np.lexsort((index, kind, t, balls))
+        first = order[np.r_[True, balls[order][1:] != balls[order][:-1]]] if len(order) else order
+        return balls[first], t[first], ny[first], kind[first], index[first]
+
+    def step(self):
+        board = self.board
+        size = board.ball_size
+        radius = board.ball_radius
+
+        # Update velocity with gravity and position with velocity
+        self.vy += GRAVITY * STEP
+        prev_x, prev_y = self.x.copy(), self.y.copy()
+        self.x = self.x + self.vx * STEP
+        self.y = self.y + self.vy * STEP
+
+        # Area the move covers, for the slots: like pygame.Rect(), the start and every contact
+        # point truncate, and the end rounds like a Rect attribute
+        path_left, path_top = np.trunc(prev_x).astype(np.int64), np.trunc(prev_y).astype(np.int64)
+        path_right, path_bottom = path_left + size, path_top + size
+
+        # Resolve the moves: at the first obstacle in the way a ball stops at the point of
+        # contact, bounces, and moves with its new velocity for the rest of the step
+        remaining = np.ones(len(self.x))
+        moving = np.arange(len(self.x))
+        for bounces_left in range(MAX_CONTACTS, -1, -1):
+            dx, dy = self.x[moving] - prev_x[moving], self.y[moving] - prev_y[moving]
+            hit, t, ny, kind, index = self.first_contact(prev_x[moving] + radius, prev_y[moving] + radius, dx, dy)
+            if not len(hit):
+                break
+            moving, dx, dy = moving[hit], dx[hit], dy[hit]
+            self.x[moving] = prev_x[moving] + dx * t
+            self.y[moving] = prev_y[moving] + dy * t
+            left, top = np.trunc(self.x[moving]).astype(np.int64), np.trunc(self.y[moving]).astype(np.int64)
+            path_left[moving] = np.minimum(path_left[moving], left)
+            path_top[moving] = np.minimum(path_top[moving], top)
+            path_right[moving] = np.maximum(path_right[moving], left + size)
+            path_bottom[moving] = np.maximum(path_bottom[moving], top + size)
+            if not bounces_left:
+                break
+
+            # Pins and the tops of walls bounce off their centre, wall sides flip vx and floors vy
+            for obstacles, centred in ((board.pins, kind == 0), (board.walls, (kind == 1) & (ny < 0))):
+                balls, rects = moving[centred], obstacles[index[centred]]
+                self.bounce(balls, self.x[balls] + radius, self.y[balls] + radius,
+                            rects[:, 0] + rects[:, 2] // 2, rects[:, 1] + rects[:, 3] // 2)
+            self.vx[moving[(kind == 1) & ~(ny < 0)]] *= -0.7
+            self.vy[moving[kind == 2]] *= -0.3
+
+            remaining[moving] *= 1 - t
+            prev_x[moving], prev_y[moving] = self.x[moving], self.y[moving]
+            self.x[moving] += self.vx[moving] * STEP * remaining[moving]
+            self.y[moving] += self.vy[moving] * STEP * remaining[moving]
+
+        left, top = rect_round(self.x), rect_round(self.y)
+        path_left, path_top = np.minimum(path_left, left) - 1, np.minimum(path_top, top) - 1
+        path_right, path_bottom = np.maximum(path_right, left + size) + 1, np.maximum(path_bottom, top + size) + 1
+
+        # Check for collisions with slots along the path; a ball lands in the first slot it touches
+        slots = board.slots
+        near = np.flatnonzero(path_bottom > slots[:, 1].min())
+        slot_index = np.full(len(near), -1)
+        for index in range(board.num_slots - 1, -1, -1):
+            slot_left, slot_top, slot_width, slot_height = slots[index]
+            hit = ((path_left[near] < slot_left + slot_width) & (path_right[near] > slot_left)
+                   & (path_top[near] < slot_top + slot_height) & (path_bottom[near] > slot_top))
+            slot_index[hit] = index
+        landed = np.zeros(len(self.x), dtype=bool)
+        landed[near[slot_index >= 0]] = True
+        self.landings = (self.serial[landed], slot_index[slot_index >= 0])
+        if landed.any():
+            np.add.at(self.counts, slot_index[slot_index >= 0], 1)
+            if self.keep_steps:
+                self.landed_steps.append(self.steps + 1 - self.spawn_step[landed])
+            self.keep(~landed)
+
+        self.steps += 1
+        return int(landed.sum())
+
+    def corners(self):
+        # Top-left corner of every ball's rect, where the sprite loop would draw it
+        return rect_round(self.x), rect_round(self.y)
+
+    def run(self, max_steps):
+        # Step until every ball has landed or the step limit is reached
+        for _ in range(max_steps):
+            if not len(self.x):
+                break
+            self.step()
+        return self.result()
+
+    def result(self):
+        steps = np.concatenate(self.landed_steps) if self.landed_steps else np.empty(0, dtype=np.int64)
+        return SimulationResult(self.board.slot_points, self.counts.copy(), steps, len(self.x))
+
+
+def simulate(board, num_balls, seed=None, max_steps=5000, batch_size=250_000):
+    # Drop num_balls balls in batches and merge the per-batch results
+    seeds = np.random.SeedSequence(seed).spawn((num_balls + batch_size - 1) // batch_size)
+    counts = np.zeros(board.num_slots, dtype=np.int64)
+    landing_steps, stuck = [], 0
+    for batch_seed in seeds:
+        engine = Engine(board, batch_seed)
+        engine.spawn(min(batch_size, num_balls))
+        num_balls -= batch_size
+        result = engine.run(max_steps)
+        counts += result.counts
+        landing_steps.append(result.landing_steps)
+        stuck += result.stuck
+    steps = np.concatenate(landing_steps) if landing_steps else np.empty(0, dtype=np.int64)
+    return SimulationResult(board.slot_points, counts, steps, stuck)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate the slot distribution of a plinko board headlessly.")
+    parser.add_argument("--balls", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-steps", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=250_000)
+    args = parser.parse_args()
+
+    board = Board(seed=args.seed)
+    start = time.perf_counter()
+    result = simulate(board, args.balls, args.seed, args.max_steps, args.batch_size)
+    elapsed = time.perf_counter() - start
+
+    for i, (points, count) in enumerate(zip(result.slot_points, result.counts)):
+        print(f"Slot {i} ({points} points): {count} balls ({100 * count / max(result.total, 1):.2f}%)")
+    print(f"Stuck: {result.stuck}  Mean steps to slot: {result.mean_steps:.1f}")
+    print(f"Simulated {result.total} balls in {elapsed:.2f}s")
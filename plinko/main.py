@@ -1,10 +1,19 @@
 import pygame
+import argparse
+import os
 import sys
 import random
 import math
+import itertools
+from array import array
 
-# Initialize Pygame
-pygame.init()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import audio, benchmark, checkpoint, export, recording, stream
+from common.audio import Sample, Soundtrack, VoiceManager
+from common.profiler import FrameProfiler, ProfilerHud
+from common.timestep import FixedTimestep
+from plinko import ccd, render
+from plinko.spatial import StaticGrid
 
 # Define constants
 SCREEN_WIDTH = 810
@@ -27,14 +36,15 @@ WHITE = (255, 255, 255)
 RED = (196, 0, 0)
 GREEN = (0, 201, 145)
 
-# Sounds
-pygame.mixer.set_num_channels(100)
-a_note = pygame.mixer.Sound("sounds/A_BELL.wav")
-c_note = pygame.mixer.Sound("sounds/C_BELL.wav")
-c_sharp_note = pygame.mixer.Sound("sounds/C#_BELL.wav")
-d_note = pygame.mixer.Sound("sounds/D_BELL.wav")
-e_note = pygame.mixer.Sound("sounds/E_BELL.wav")
-f_note = pygame.mixer.Sound("sounds/F_BELL.wav")
+# Sounds, decoded the first time they play
+SOUNDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sounds")
+MIXER_CHANNELS = 100
+a_note = Sample(os.path.join(SOUNDS, "A_BELL.wav"))
+c_note = Sample(os.path.join(SOUNDS, "C_BELL.wav"))
+c_sharp_note = Sample(os.path.join(SOUNDS, "C#_BELL.wav"))
+d_note = Sample(os.path.join(SOUNDS, "D_BELL.wav"))
+e_note = Sample(os.path.join(SOUNDS, "E_BELL.wav"))
+f_note = Sample(os.path.join(SOUNDS, "F_BELL.wav"))
 score = [f_note, d_note, a_note, d_note, 
          f_note, d_note, a_note, d_note, 
          f_note, c_note, a_note, c_note, 
@@ -43,76 +53,177 @@ score = [f_note, d_note, a_note, d_note,
          e_note, c_sharp_note, a_note, c_sharp_note, 
          e_note, c_sharp_note, a_note, c_sharp_note, 
          e_note, c_sharp_note, a_note, c_sharp_note]
-score_pointer = 0
+bells = [a_note, c_note, c_sharp_note, d_note, e_note, f_note]  # Recordings refer to notes by their index here
 
 FPS = 60
+PHYSICS_RATE = 60  # Physics steps per second, independent of FPS
+STEP = 60 / PHYSICS_RATE  # Length of a step in 60 Hz frames, the unit velocities and gravity are tuned in
+MAX_CONTACTS = 4  # Bounces resolved per ball and step, the ball stops at the next one
+SEED = None  # Set to an int to replay a run exactly
+MAX_VOICES = 8  # Collision notes started per frame at most
+MAX_BALLS = 1000  # Balls in play at most
+OVERFLOW = "queue"  # Balls spawned over MAX_BALLS: "queue" them until there is room, "drop" them, or "aggregate" them into a counter
 
-# Define classes
+
+# Define classes. The scene's run-time state is passed in: the RNG balls drop with and the
+# timestep their rainbow hue follows.
 class Ball(pygame.sprite.Sprite):
-    def __init__(self):
+    def __init__(self, rng, timestep, serial):
         super().__init__()
+        self.rng = rng
+        self.timestep = timestep
         self.radius = BALL_RADIUS
-        self.image = pygame.Surface((self.radius * 2, self.radius * 2), pygame.SRCALPHA)
         self.color_change_speed = 0.05
-        self.color = self.get_rainbow_color()
-        pygame.draw.circle(self.image, self.color, (self.radius, self.radius), self.radius)
-        self.realx = random.uniform(0, SCREEN_WIDTH - 2 * BALL_RADIUS)
+        self.gravity = 0.35  # Gravity strength
+        self.rect = pygame.Rect(0, 0, BALL_RADIUS * 2, BALL_RADIUS * 2)
+        self.reset(serial)
+
+    def reset(self, serial):
+        # Drop in from the top again, for a new ball or one recycled by the pool. serial is
+        # its id in recordings.
+        self.serial = serial
+        self.hue, self.color, self.image = self.get_rainbow_color()
+        self.realx = self.rng.uniform(0, SCREEN_WIDTH - 2 * BALL_RADIUS)
         self.realy = 0
         self.prev_x = self.realx  # Store previous x coordinate
         self.prev_y = self.realy  # Store previous y coordinate
-        self.rect = self.image.get_rect()
         self.rect.x = self.realx
         self.rect.y = 0
-        self.velocity = [random.uniform(-5, 5), random.uniform(-3, 1)]  # Initial velocity
-        self.gravity = 0.35  # Gravity strength
+        self.velocity = [self.rng.uniform(-5, 5), self.rng.uniform(-3, 1)]  # Initial velocity
 
     def get_rainbow_color(self):
-        # Function to get a rainbow color based on time
-        color = pygame.Color(0)
-        color.hsva = (int(pygame.time.get_ticks() * self.color_change_speed) % 360, 100, 100, 100)
-        return color
+        # Rainbow hue based on simulated time, with its color and shared pre-rendered image
+        hue = int(self.timestep.ticks * self.color_change_speed) % 360
+        return (hue,) + render.rainbow_ball(hue, self.radius)
 
     def update(self):
         # Update velocity with gravity
-        self.velocity[1] += self.gravity
+        self.velocity[1] += self.gravity * STEP
 
-        # Update position with velocity
+        # Update position with velocity, step() sweeps the move for collisions
         self.prev_x = self.realx  # Store previous x coordinate before updating
         self.prev_y = self.realy  # Store previous y coordinate before updating
-        self.realx += self.velocity[0]
-        self.realy += self.velocity[1]
+        self.realx += self.velocity[0] * STEP
+        self.realy += self.velocity[1] * STEP
         self.rect.x = self.realx
         self.rect.y = self.realy
 
-        # Check for collisions with the window boundaries
-        if self.rect.left < 0 or self.rect.right > SCREEN_WIDTH:
-            self.velocity[0] *= -1  # Bounce off the sides
-            ball.realx = ball.prev_x
-            ball.realy = ball.prev_y
-            play_sound()
-
         # Update color
-        self.color = self.get_rainbow_color()
-        self.image.fill((0, 0, 0, 0))  # Clear the surface
-        pygame.draw.circle(self.image, self.color, (self.radius, self.radius), self.radius)
+        self.hue, self.color, self.image = self.get_rainbow_color()
+
+
+class BallPool:
+    # Spawns balls into the groups, reusing the instances of balls that left play, and
+    # holds the population at max_balls. Spawns over the cap are handled by the overflow
+    # policy: "queue" keeps a count of them and spawns them as balls leave, "drop" throws
+    # them away and "aggregate" adds them to a counter that stands in for them. Balls are
+    # numbered for recordings in the order they are spawned. The pool also stores where the
+    # balls in play are, so the batch and heatmap modes get arrays without going through
+    # the sprites.
+    def __init__(self, groups, rng, timestep, max_balls=MAX_BALLS, overflow=OVERFLOW):
+        self.groups = groups
+        self.rng = rng
+        self.timestep = timestep
+        self.max_balls = max_balls
+        self.overflow = overflow
+        self.serials = itertools.count()
+        self.free = []  # Balls out of play, ready for reuse
+        self.live = []  # Balls in play, each at its ball.index
+        # Top-left corners and hues of the balls in play, by ball.index
+        self.xs, self.ys, self.hues = array("q"), array("q"), array("q")
+        # Counters since start: balls created, spawns that reused a ball, and spawns
+        # over the cap that were queued (still waiting), dropped or aggregated
+        self.created = 0
+        self.recycled = 0
+        self.queued = 0
+        self.dropped = 0
+        self.aggregated = 0
+
+    def new_ball(self):
+        # A ball with the next serial, in no group yet
+        return Ball(self.rng, self.timestep, next(self.serials))
+
+    def spawn(self):
+        if len(self.groups[0]) >= self.max_balls:
+            if self.overflow == "queue":
+                self.queued += 1
+            elif self.overflow == "drop":
+                self.dropped += 1
+            else:
+                self.aggregated += 1
+            return None
+        if self.free:
+            ball = self.free.pop()
+            ball.reset(next(self.serials))
+            self.recycled += 1
+        else:
+            ball = self.new_ball()
+            self.created += 1
+        self.enter(ball)
+        return ball
+
+    def enter(self, ball):
+        # Put a ball in play as it is, at the end of the storage
+        ball.index = len(self.live)
+        self.live.append(ball)
+        self.xs.append(ball.rect.x)
+        self.ys.append(ball.rect.y)
+        self.hues.append(ball.hue)
+        ball.add(*self.groups)
+
+    def store(self, ball):
+        # Record where a ball in play has moved to
+        index = ball.index
+        self.xs[index], self.ys[index], self.hues[index] = ball.rect.x, ball.rect.y, ball.hue
+
+    def release(self, ball):
+        if ball.alive():
+            ball.kill()
+            self.free.append(ball)
+            # The last ball in play takes the released one's place in the storage
+            last = self.live.pop()
+            x, y, hue = self.xs.pop(), self.ys.pop(), self.hues.pop()
+            if last is not ball:
+                index = last.index = ball.index
+                self.live[index] = last
+                self.xs[index], self.ys[index], self.hues[index] = x, y, hue
+
+    def refill(self):
+        # Spawn queued balls into the room released balls left
+        while self.queued and len(self.groups[0]) < self.max_balls:
+            self.queued -= 1
+            self.spawn()
+
+    def arrays(self):
+        # Top-left corners and hues of the balls in play as NumPy arrays, copied so the
+        # storage can change while they are drawn
+        import numpy as np  # Only the batched modes need NumPy
+
+        return tuple(np.frombuffer(column, np.int64).copy() for column in (self.xs, self.ys, self.hues))
+
+    def summary(self):
+        return (f"{self.created} created, {self.recycled} recycled, {self.queued} queued, "
+                f"{self.dropped} dropped, {self.aggregated} aggregated")
+
 
 class Pin(pygame.sprite.Sprite):
-    def __init__(self, x, y):
+    def __init__(self, x, y, radius):
         super().__init__()
-        self.radius = PIN_RADIUS
+        self.radius = radius
         self.image = pygame.Surface((self.radius * 2, self.radius * 2), pygame.SRCALPHA)
         pygame.draw.circle(self.image, WHITE, (self.radius, self.radius), self.radius)
         self.rect = self.image.get_rect(center=(x, y))
 
 
 class Slot(pygame.sprite.Sprite):
-    def __init__(self, x, y, points, color):
+    def __init__(self, x, y, width, height, points, color):
         super().__init__()
-        self.image = pygame.Surface((SLOT_WIDTH, SLOT_HEIGHT))
+        self.image = pygame.Surface((width, height))
         self.image.fill(color)
         self.rect = self.image.get_rect(topleft=(x, y))
         self.points = points
 
+
 class Wall(pygame.sprite.Sprite):
     def __init__(self, x, y, width, height):
         super().__init__()
@@ -120,120 +231,382 @@ class Wall(pygame.sprite.Sprite):
         self.image.fill(WHITE)
         self.rect = self.image.get_rect(topleft=(x, y))
 
-# Define functions
-def play_sound():
-    global score_pointer
-    score[score_pointer].play()
-    score_pointer += 1
-    if score_pointer == len(score):
-        score_pointer = 0
-
-# Create screen
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Plinko Simulation")
-
-# Create groups for sprites
-all_sprites = pygame.sprite.Group()
-pins = pygame.sprite.Group()
-slots = pygame.sprite.Group()
-walls = pygame.sprite.Group()
-
-# Create pins
-for layer in range(NUM_LAYERS):
-    for i in range(PINS_PER_LAYER):
-        horizontal_offset = 5
-        pin = Pin(i * PIN_SPACING_X + SLOT_WIDTH // 2 + (layer % 2) * (PIN_SPACING_X // 2) + horizontal_offset,
-                  (layer + 1) * PIN_SPACING_Y)
-        pins.add(pin)
-        all_sprites.add(pin)
-
-# Create slots
-slot_colors = [RED, RED, RED, GREEN, GREEN, GREEN]
-slot_points = [random.randint(1, 10) for _ in range(NUM_SLOTS)]
-for i, points in enumerate(slot_points):
-    slot = Slot(i * SLOT_WIDTH, SCREEN_HEIGHT - SLOT_HEIGHT, points, slot_colors[i])
-    slots.add(slot)
-    all_sprites.add(slot)
-
-# Create walls between slots
-for i in range(NUM_SLOTS - 1):
-    wall = Wall((i + 1) * SLOT_WIDTH - WALL_WIDTH // 2, SCREEN_HEIGHT - WALL_HEIGHT, WALL_WIDTH, WALL_HEIGHT)
-    walls.add(wall)
-    all_sprites.add(wall)
-
-# Create balls
-balls = pygame.sprite.Group()
-initial_ball = Ball()
-balls.add(initial_ball)
-all_sprites.add(initial_ball)
-
-# Main loop
-clock = pygame.time.Clock()
-
-while True:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit()
-        elif event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
-            new_ball = Ball()
-            balls.add(new_ball)
-            all_sprites.add(new_ball)
-
-    # Update
-    all_sprites.update()
-
-    # Check for collisions with pins
-    for ball in balls:
-        pins_hit = pygame.sprite.spritecollide(ball, pins, False)
-        for pin in pins_hit:
-            # Bounce off the pin
-            angle = math.atan2(ball.rect.centery - pin.rect.centery, ball.rect.centerx - pin.rect.centerx)
-            speed = math.sqrt(ball.velocity[0]**2 + ball.velocity[1]**2)
-            damping_factor = max(0.5, 1 / speed)  # Damping factor based on the inverse of the speed
-            ball.velocity[0] = speed * math.cos(angle) * damping_factor
-            ball.velocity[1] = speed * math.sin(angle) * damping_factor
-            ball.velocity[0] = max(ball.velocity[0], 1) if ball.velocity[0] > 0 else min(ball.velocity[0], -1)
-            ball.velocity[1] = max(ball.velocity[1], 1) if ball.velocity[1] > 0 else min(ball.velocity[1], -1)
-            ball.realx = ball.prev_x
-            ball.realy = ball.prev_y
-            play_sound()
 
-        # Check for collisions with slots
-        slot_hits = pygame.sprite.spritecollide(ball, slots, False)
-        for slot in slot_hits:
-            if slot.rect.centerx > SCREEN_WIDTH // 2:
-                # Right slots: Add a new ball
-                ball.kill()
-                print(f"Ball in slot with {slot.points} points. Adding two new ball.")
-                new_ball = Ball()
-                balls.add(new_ball)
-                all_sprites.add(new_ball)
-                new_ball = Ball()
-                balls.add(new_ball)
-                all_sprites.add(new_ball)
-            else:
-                # Left slots: Remove a ball
-                ball.kill()
-                print(f"Ball in slot with {slot.points} points. Removing a ball.")
 
-        # Check for collisions with walls
-        walls_hit = pygame.sprite.spritecollide(ball, walls, False)
-        for wall in walls_hit:
-            if ball.rect.bottom < wall.rect.top + 25:
-                # Ball hits the top of the wall
+def main(argv=None):
+    # Command line options
+    parser = argparse.ArgumentParser(description="Plinko simulation")
+    parser.add_argument("--seed", type=int, help="seed for the simulation RNG, overrides SEED")
+    parser.add_argument("--max-balls", type=int, help="population cap, overrides MAX_BALLS and the benchmark --count")
+    parser.add_argument("--overflow", choices=["queue", "drop", "aggregate"], help="what happens to balls over the cap, overrides OVERFLOW")
+    export.add_arguments(parser)
+    benchmark.add_arguments(parser, "balls")
+    FrameProfiler.add_arguments(parser)
+    recording.add_arguments(parser)
+    render.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    stream.add_arguments(parser)
+    audio.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.fork and args.perturb is None:
+        checkpoint.fork(main, argv, args.fork)
+        return
+    if args.export or args.benchmark or args.warmup or args.serve:
+        export.use_dummy_drivers()
+    audio.configure(not args.no_audio and not args.warmup and not args.serve, MIXER_CHANNELS)
+
+    # Initialize Pygame: the mixer and fonts start when they are first used
+    pygame.display.init()
+
+    # Seeded RNG for everything random in the simulation
+    seed = args.seed if args.seed is not None else SEED
+    if seed is None:
+        # On stderr, out of the way of the scripts that read the benchmark and fork results
+        seed = random.randrange(2 ** 32)
+        print(f"Seed: {seed} (pass --seed {seed} to run this again)", file=sys.stderr)
+    rng = random.Random(seed)
+    timestep = FixedTimestep(PHYSICS_RATE, FPS)
+    profiler = FrameProfiler(["events", "physics", "collisions", "sound", "draw", "display", "record"])
+    hud = ProfilerHud(profiler, args.hud)
+    if args.trace:
+        profiler.open_trace(args.trace)
+    voices = VoiceManager(score, MAX_VOICES)
+
+    # Define functions
+    def play_sound():
+        # Queued, the voice manager starts the notes once per frame
+        voices.hit()
+
+    # Create screen
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Plinko Simulation")
+
+    # Create groups for sprites
+    all_sprites = pygame.sprite.Group()
+    pins = pygame.sprite.Group()
+    slots = pygame.sprite.Group()
+    walls = pygame.sprite.Group()
+
+    # Create pins
+    for layer in range(NUM_LAYERS):
+        for i in range(PINS_PER_LAYER):
+            horizontal_offset = 5
+            pin = Pin(i * PIN_SPACING_X + SLOT_WIDTH // 2 + (layer % 2) * (PIN_SPACING_X // 2) + horizontal_offset,
+                      (layer + 1) * PIN_SPACING_Y, PIN_RADIUS)
+            pins.add(pin)
+            all_sprites.add(pin)
+
+    # Create slots
+    slot_colors = [RED, RED, RED, GREEN, GREEN, GREEN]
+    slot_points = [rng.randint(1, 10) for _ in range(NUM_SLOTS)]
+    for i, points in enumerate(slot_points):
+        slot = Slot(i * SLOT_WIDTH, SCREEN_HEIGHT - SLOT_HEIGHT, SLOT_WIDTH, SLOT_HEIGHT, points, slot_colors[i])
+        slots.add(slot)
+        all_sprites.add(slot)
+
+    # Create walls between slots
+    for i in range(NUM_SLOTS - 1):
+        wall = Wall((i + 1) * SLOT_WIDTH - WALL_WIDTH // 2, SCREEN_HEIGHT - WALL_HEIGHT, WALL_WIDTH, WALL_HEIGHT)
+        walls.add(wall)
+        all_sprites.add(wall)
+
+    # Static broadphase for collisions, cells follow the staggered pin lattice
+    pin_grid = StaticGrid(pins, PIN_SPACING_X // 2, PIN_SPACING_Y)
+    slot_grid = StaticGrid(slots, PIN_SPACING_X // 2, PIN_SPACING_Y)
+    wall_grid = StaticGrid(walls, PIN_SPACING_X // 2, PIN_SPACING_Y)
+
+    # Beyond the window sides, balls bounce off them like walls that are never drawn
+    edges = [pygame.Rect(-SCREEN_WIDTH, -SCREEN_HEIGHT, SCREEN_WIDTH, 3 * SCREEN_HEIGHT),
+             pygame.Rect(SCREEN_WIDTH, -SCREEN_HEIGHT, SCREEN_WIDTH, 3 * SCREEN_HEIGHT)]
+
+    # Static sprites composited once, balls are drawn over them
+    scenery = render.Scenery(screen.get_size(), all_sprites)
+    heatmap = render.Heatmap(scenery, args.decay, args.colormap) if args.render == "heatmap" else None
+
+    # Create balls
+    balls = pygame.sprite.RenderUpdates()  # Tracks the rects balls are drawn to
+    # A benchmark gets all the balls of its --count in play unless --max-balls says otherwise
+    max_balls = args.max_balls or max(MAX_BALLS, args.count or 0)
+    pool = BallPool([balls, all_sprites], rng, timestep, max_balls, args.overflow or OVERFLOW)
+    pool.spawn()
+
+    # Collisions
+    def first_contact(ball):
+        # The earliest pin, wall or window side the ball touches on its move from prev to real,
+        # as (t, nx, ny, obstacle), or None
+        x, y = ball.prev_x + BALL_RADIUS, ball.prev_y + BALL_RADIUS
+        dx, dy = ball.realx - ball.prev_x, ball.realy - ball.prev_y
+        area = ccd.swept_rect(x, y, dx, dy, BALL_RADIUS)
+        contacts = []
+        for pin in pin_grid.query(area):
+            contact = ccd.circle_contact(x, y, dx, dy, BALL_RADIUS, *pin.rect.center, pin.radius)
+            if contact:
+                contacts.append(contact + (pin,))
+        for rect in [wall.rect for wall in wall_grid.query(area)] + edges:
+            contact = ccd.rect_contact(x, y, dx, dy, BALL_RADIUS, rect.left, rect.top, rect.right, rect.bottom)
+            if contact:
+                contacts.append(contact + (rect,))
+        return min(contacts, key=lambda contact: contact[0], default=None)
+
+    def move(ball):
+        # Resolve the ball's move for this step: at the first obstacle in the way it stops at
+        # the point of contact, bounces, and moves with its new velocity for the rest of the
+        # step, so no speed is fast enough to pass through a pin or a wall. Returns the area
+        # the whole move swept through.
+        remaining = 1.0  # Fraction of the step still to move
+        path = pygame.Rect(ball.prev_x, ball.prev_y, BALL_RADIUS * 2, BALL_RADIUS * 2)
+        for bounces_left in range(MAX_CONTACTS, -1, -1):
+            contact = first_contact(ball)
+            if contact is None:
+                break
+            t, nx, ny, obstacle = contact
+            ball.realx = ball.prev_x + (ball.realx - ball.prev_x) * t
+            ball.realy = ball.prev_y + (ball.realy - ball.prev_y) * t
+            path.union_ip(pygame.Rect(ball.realx, ball.realy, BALL_RADIUS * 2, BALL_RADIUS * 2))
+            if not bounces_left:
+                break
+
+            if isinstance(obstacle, Pin):
+                # Bounce off the pin
+                angle = math.atan2(ny, nx)
+                speed = math.sqrt(ball.velocity[0]**2 + ball.velocity[1]**2)
+                damping_factor = max(0.5, 1 / speed)  # Damping factor based on the inverse of the speed
+                ball.velocity[0] = speed * math.cos(angle) * damping_factor
+                ball.velocity[1] = speed * math.sin(angle) * damping_factor
+                ball.velocity[0] = max(ball.velocity[0], 1) if ball.velocity[0] > 0 else min(ball.velocity[0], -1)
+                ball.velocity[1] = max(ball.velocity[1], 1) if ball.velocity[1] > 0 else min(ball.velocity[1], -1)
+            elif ny < 0:
+                # Ball hits the top of a wall
                 ball.velocity[0] *= 0.85
                 ball.velocity[1] = -ball.velocity[1] * 0.65
                 ball.velocity[0] = max(ball.velocity[0], 2) if ball.velocity[0] > 0 else min(ball.velocity[0], -2)
                 ball.velocity[1] = max(ball.velocity[1], 2) if ball.velocity[1] > 0 else min(ball.velocity[1], -2)
-                ball.realy = wall.rect.top - BALL_RADIUS - 25
             else:
+                # Ball hits the side of a wall or the window
                 ball.velocity[0] *= -1
             play_sound()
 
-    # Draw
-    screen.fill(BLACK)
-    all_sprites.draw(screen)
+            remaining *= 1 - t
+            ball.prev_x, ball.prev_y = ball.realx, ball.realy
+            ball.realx += ball.velocity[0] * STEP * remaining
+            ball.realy += ball.velocity[1] * STEP * remaining
+        ball.rect.x = ball.realx
+        ball.rect.y = ball.realy
+        return path.union(ball.rect).inflate(2, 2)
+
+    # Physics step
+    def step():
+        # Update
+        all_sprites.update()
+        profiler.mark("physics")
+
+        for ball in balls:
+            # Move the ball, bouncing off the pins and walls in its way
+            path = move(ball)
+            pool.store(ball)
+
+            # Check for collisions with slots, along the path so fast balls can't skip one. A ball
+            # lands in the first slot it reaches: releasing it can hand the same instance straight
+            # back out of the pool, so no other slot may touch it after that.
+            slot_hits = slot_grid.query(path)
+            if not slot_hits:
+                continue
+            slot = slot_hits[0]
+            if slot.rect.centerx > SCREEN_WIDTH // 2:
+                # Right slots: Add a new ball
+                pool.release(ball)
+                print(f"Ball in slot with {slot.points} points. Adding two new ball.")
+                pool.spawn()
+                pool.spawn()
+            else:
+                # Left slots: Remove a ball
+                pool.release(ball)
+                print(f"Ball in slot with {slot.points} points. Removing a ball.")
+        pool.refill()
+        profiler.mark("collisions")
+
+
+    # Checkpoints: everything that changes while the scene runs, as plain data
+    def save_state():
+        serial = next(pool.serials)  # Reading the counter uses a number up, so it starts again there
+        pool.serials = itertools.count(serial)
+        return {"timestep": checkpoint.save_timestep(timestep),
+                "seed": seed,
+                "rng": rng.getstate(),
+                "serial": serial,
+                "balls": [(ball.serial, ball.hue, ball.realx, ball.realy, ball.prev_x, ball.prev_y, *ball.velocity)
+                          for ball in balls],
+                "slot_points": [slot.points for slot in slots],
+                "score_pointer": voices.score_pointer,
+                "voices": (voices.played, voices.merged, voices.dropped),
+                "pool": (pool.created, pool.recycled, pool.queued, pool.dropped, pool.aggregated, len(pool.free))}
+
+    def restore_state(state):
+        nonlocal seed
+        seed = state["seed"]
+        checkpoint.restore_timestep(timestep, state["timestep"])
+        for ball in balls.sprites():
+            pool.release(ball)
+        # Balls are put back in their old order, which is the order they step in. Making one
+        # uses up random numbers and a serial, both restored after.
+        for serial, hue, realx, realy, prev_x, prev_y, vx, vy in state["balls"]:
+            ball = pool.free.pop() if pool.free else pool.new_ball()
+            ball.serial, ball.hue = serial, hue
+            ball.color, ball.image = render.rainbow_ball(hue, ball.radius)
+            ball.realx, ball.realy, ball.prev_x, ball.prev_y = realx, realy, prev_x, prev_y
+            ball.rect.x, ball.rect.y = realx, realy
+            ball.velocity = [vx, vy]
+            pool.enter(ball)
+        created, pool.recycled, pool.queued, pool.dropped, pool.aggregated, free = state["pool"]
+        pool.free = pool.free[:free] + [pool.new_ball() for _ in range(free - len(pool.free))]
+        pool.created = created
+        rng.setstate(state["rng"])
+        pool.serials = itertools.count(state["serial"])
+        for slot, points in zip(slots, state["slot_points"]):
+            slot.points = points
+        voices.score_pointer = state["score_pointer"]
+        voices.played, voices.merged, voices.dropped = state["voices"]
+
+    def perturb(copy):
+        # A --fork copy: its own random numbers from here on, and velocities nudged by up to --jitter
+        checkpoint.reseed(rng, copy)
+        for ball in balls:
+            ball.velocity[0] += rng.uniform(-args.jitter, args.jitter)
+            ball.velocity[1] += rng.uniform(-args.jitter, args.jitter)
+
+    def outcome():
+        return {"seconds": round(timestep.time / 1000, 3), "balls": len(balls), "created": pool.created,
+                "queued": pool.queued, "dropped": pool.dropped, "aggregated": pool.aggregated,
+                "notes": voices.played}
+
+    # Input. The stream server and the recorder start with the main loop, but QUIT can come
+    # before that, during a warm-up or an export.
+    server = recorder = None
+
+    def handle_event(event):
+        if event.type == pygame.QUIT:
+            print(f"Sound: {voices.summary()}")
+            print(f"Balls: {pool.summary()}")
+            profiler.close()
+            if recorder:
+                recorder.close()
+            if server:
+                server.close()
+            pygame.quit()
+            sys.exit()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
+            pool.spawn()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_f:
+            # Toggle unthrottled fast-forward
+            timestep.fast_forward = not timestep.fast_forward
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_h:
+            hud.visible = not hud.visible
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
+            checkpoint.save(checkpoint.path(args), "plinko/main.py", save_state())
+
+
+    # Replay: show or export a recording instead of simulating
+    if args.replay:
+        layout = render.describe(all_sprites, balls, slots)
+        recording.replay(args.replay, screen, render.render_frame, layout, render.decode, bells, args.export, args.workers)
+        return
+
+    # Checkpoints: start from a saved state, perturbed in a --fork copy
+    if args.restore:
+        restore_state(checkpoint.load(args.restore, "plinko/main.py"))
+    if args.perturb is not None:
+        perturb(args.perturb)
+
+    # Warm-up: simulate headless and save the state for later runs to start from
+    if args.warmup:
+        checkpoint.simulate(timestep, step, args.warmup, voices, args.keys, handle_event)
+        checkpoint.save(checkpoint.path(args), "plinko/main.py", save_state())
+        print(f"Balls: {pool.summary()}")
+        return
+
+    # A --fork copy: simulate headless and hand the outcome back
+    if args.perturb is not None:
+        checkpoint.simulate(timestep, step, args.seconds, voices, args.keys, handle_event)
+        if args.save:
+            checkpoint.save(checkpoint.path(args), "plinko/main.py", save_state())
+        return outcome()
+
+    # Offline export: simulate headless, then render the recorded frames in parallel
+    if args.export:
+        if audio.enabled():
+            voices.soundtrack = Soundtrack(timestep)
+        states = export.record(timestep, step, lambda: render.snapshot(balls, slots), handle_event, args.seconds, args.keys, voices)
+        layout = render.describe(all_sprites, balls, slots)
+        export.FrameExporter(render.render_frame, screen.get_size(), layout, args.export, FPS, args.workers).export(states, voices.soundtrack)
+        return
+
+    # Benchmark: start with --count balls
+    if args.benchmark:
+        for _ in range(len(balls), args.count or 1):
+            pool.spawn()
+
+    # Streaming: frames go to socket clients instead of the window
+    server = stream.Server(args.serve, screen.get_size(), FPS, args.encoding, args.queue) if args.serve else None
+
+    # Recording: every frame from here on
+    if args.record:
+        recorder = recording.Recorder(args.record, FPS, *render.recording_columns(len(slots)), track="balls",
+                                      meta={"scene": "plinko/main.py", "seed": seed})
+
+    # Main loop
+    clock = pygame.time.Clock()
+    elapsed = 1000 / FPS
+
+    while True:
+        profiler.start()
+        for event in pygame.event.get():
+            handle_event(event)
+        profiler.mark("events")
+
+        # Run as many fixed physics steps as the last frame took
+        timestep.advance(step, elapsed)
+        notes = voices.flush()
+        profiler.mark("sound")
+
+        # Draw the balls over the static background, pushing only the changed rects or, in
+        # batch mode, the whole frame
+        if args.render == "batch":
+            dirty = scenery.draw_batch(screen, *pool.arrays(), BALL_RADIUS)
+        elif args.render == "heatmap":
+            xs, ys, _ = pool.arrays()
+            dirty = heatmap.draw(screen, xs + BALL_RADIUS, ys + BALL_RADIUS)
+        else:
+            dirty = scenery.draw(screen, balls)
+        if hud.visible:
+            # The overlay goes on top; the next frame restores the background under it
+            rect = hud.draw(screen)
+            dirty.append(rect)
+            scenery.changed.append(rect)
+        profiler.mark("draw")
+        if server:
+            server.publish(screen, dirty)
+        else:
+            pygame.display.update(dirty)
+        profiler.mark("display")
+        if recorder:
+            render.record_frame(recorder, balls, slots, [bells.index(note) for note in notes])
+            profiler.mark("record")
+        profiler.end_frame(balls=len(balls), queued=pool.queued, aggregated=pool.aggregated)
+
+        if args.benchmark:
+            # Unthrottled, with the same physics steps every frame
+            if profiler.frames == args.benchmark:
+                benchmark.report(profiler, balls=len(balls))
+                profiler.close()
+                if recorder:
+                    recorder.close()
+                if server:
+                    server.close()
+                return
+            elapsed = 1000 / FPS
+        else:
+            elapsed = timestep.tick(clock)
+
 
-    pygame.display.flip()
-    clock.tick(FPS)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Drawing shared by the plinko scripts: the rainbow ball images, and recorded
+frames for the offline exporter.
+
+Balls are drawn as sprites with dirty rects by default. With --render batch
+every frame redraws the whole board instead and blits all the balls from
+arrays of their positions, one cached stamp per color, in one Surface.blits()
+call, which keeps thousands of balls cheap. --render heatmap draws no balls at
+all: it bins the ball centers into a density buffer and shows how many balls
+passed over every pixel lately, for crowds too big to draw one by one. In
+comp.py both modes can also draw a --crowd simulated on arrays by engine.py.
+
+A frame is plain data so it can be pickled to worker processes:
+    (slot colors, [(x, y, radius, hue) for every ball])
+and it is drawn on top of a layout describing the static sprites. Recordings
+store the same frames as columns, see common/recording.py.
+"""
+import itertools
+
+import pygame
+
+BLACK = (0, 0, 0)
+
+# Per-process cache of decoded static images
+images = {}
+
+# Pre-rendered rainbow balls shared by every Ball, filled lazily: (hue, radius) -> (color, image).
+# Hues are whole degrees, so there are at most 360 images per radius.
+rainbow_balls = {}
+
+# Colorkeyed copies of the rainbow balls for batched drawing: (hue, radius) -> Surface.
+# A ball is one solid circle, so the colorkey draws the same pixels as the alpha channel,
+# and RLE colorkey blits cost a fraction of alpha blending. Balls are never black.
+ball_stamps = {}
+
+
+# Heatmap colors from no balls to the most crowded pixel, as evenly spaced stops
+COLORMAPS = {
+    "heat": [(0, 0, 0), (120, 0, 40), (230, 60, 0), (255, 200, 0), (255, 255, 255)],
+    "ice": [(0, 0, 0), (0, 30, 110), (0, 140, 220), (130, 240, 255), (255, 255, 255)],
+    "gray": [(0, 0, 0), (255, 255, 255)],
+}
+
+
+def add_arguments(parser):
+    parser.add_argument("--render", choices=["sprites", "batch", "heatmap"], default="sprites",
+                        help="draw balls as sprites with dirty rects, all at once from stamps (for thousands of "
+                             "balls), or as a density heatmap (for crowds)")
+    parser.add_argument("--decay", type=float, default=0.9,
+                        help="share of the heatmap kept from one frame to the next, 0 shows only the current frame")
+    parser.add_argument("--colormap", choices=list(COLORMAPS), default="heat", help="heatmap colors")
+
+
+class Scenery:
+    # The static sprites composited once onto a background. Balls are drawn over it with
+    # dirty rects, so a frame only touches the screen where balls were and are.
+    def __init__(self, size, sprites):
+        self.sprites = list(sprites)
+        self.background = pygame.Surface(size)
+        self.background.fill(BLACK)
+        for sprite in self.sprites:
+            self.background.blit(sprite.image, sprite.rect)
+        self.changed = [self.background.get_rect()]  # The first frame shows everything
+
+    def refresh(self, sprite):
+        # Recomposite the background under a static sprite whose image changed
+        rect = sprite.rect.copy()
+        self.background.set_clip(rect)
+        self.background.fill(BLACK)
+        for other in self.sprites:
+            if other.rect.colliderect(rect):
+                self.background.blit(other.image, other.rect)
+        self.background.set_clip(None)
+        self.changed.append(rect)
+
+    def draw_batch(self, screen, xs, ys, hues, radius):
+        # Redraw the whole board: at thousands of balls one full update costs less than a
+        # dirty rect per ball. The balls come as arrays of their top-left corners and hues (or
+        # one hue for all), and every hue is one cached stamp, so the blit list is zipped
+        # straight from the arrays. Returns the rects for display.update().
+        import numpy as np  # Only the batched modes need NumPy
+
+        screen.blit(self.background, (0, 0))
+        if np.ndim(hues) == 0:
+            stamps = itertools.repeat(ball_stamp(int(hues), radius))
+        else:
+            colors, which = np.unique(hues, return_inverse=True)
+            stamps = map([ball_stamp(hue, radius) for hue in colors.tolist()].__getitem__, which.tolist())
+        screen.blits(zip(stamps, zip(xs.tolist(), ys.tolist())), doreturn=False)
+        self.changed = []
+        return [screen.get_rect()]
+
+    def draw(self, screen, balls):
+        # balls must be a pygame.sprite.RenderUpdates. Returns the rects for display.update().
+        balls.clear(screen, self.background)
+        for rect in self.changed:
+            screen.blit(self.background, rect, rect)
+        dirty = self.changed + balls.draw(screen)
+        self.changed = []
+        return dirty
+
+
+class Heatmap:
+    # Ball density for --render heatmap. Every frame the buffer fades by decay and every ball
+    # adds one to the pixel under its center; the buffer is shown on a log scale through a
+    # 256-color lookup table, written to the screen with surfarray, and the static sprites
+    # are laid over it. The cost depends on the screen size, hardly on the number of balls.
+    def __init__(self, scenery, decay=0.9, colormap="heat"):
+        import numpy as np  # Only the heatmap needs NumPy
+
+        self.np = np
+        self.scenery = scenery
+        self.decay = decay
+        self.width, self.height = scenery.background.get_size()
+        self.density = np.zeros((self.width, self.height), np.float32)  # Indexed [x, y] like surfarray
+        stops = np.array(COLORMAPS[colormap], dtype=float)
+        levels = np.linspace(0, 1, 256)
+        positions = np.linspace(0, 1, len(stops))
+        self.colors = np.stack([np.interp(levels, positions, stops[:, channel]) for channel in range(3)],
+                               axis=1).astype(np.uint8)
+        self.lut = None  # The colors as the screen's pixel values, made on the first draw
+
+    def add(self, xs, ys):
+        # Fade, then count the balls at pixels (xs, ys); balls off the screen are left out
+        np = self.np
+        self.density *= self.decay
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        pixels = xs[inside] * self.height + ys[inside]
+        self.density += np.bincount(pixels, minlength=self.width * self.height).reshape(self.width, self.height)
+
+    def draw(self, screen, xs, ys):
+        # xs and ys are arrays of the ball centers. Returns the rects for display.update(),
+        # the whole screen
+        np = self.np
+        if self.lut is None:
+            self.lut = np.array([screen.map_rgb(tuple(color)) for color in self.colors.tolist()], np.uint32)
+        self.add(xs, ys)
+
+        levels = np.log1p(self.density)
+        levels *= 255 / max(float(levels.max()), 1e-6)
+        pygame.surfarray.blit_array(screen, self.lut[levels.astype(np.uint8)])
+        screen.blit(self.scenery.background, (0, 0), special_flags=pygame.BLEND_RGB_MAX)
+        self.scenery.changed = []
+        return [screen.get_rect()]
+
+
+def ball_arrays(balls):
+    # Top-left corners and hues of sprite balls as arrays, for the batch and heatmap modes
+    # when the balls don't live in arrays already
+    import numpy as np  # Only the batched modes need NumPy
+
+    count = len(balls)
+    return (np.fromiter((ball.rect.x for ball in balls), np.int64, count),
+            np.fromiter((ball.rect.y for ball in balls), np.int64, count),
+            np.fromiter((ball.hue for ball in balls), np.int64, count))
+
+
+def describe(all_sprites, balls, slots):
+    # Static sprites in all_sprites draw order: the pixels of every static image, and
+    # slots as bare rects so each frame can fill in their current color
+    items = []
+    for sprite in all_sprites:
+        if sprite in balls:
+            continue
+        if sprite in slots:
+            items.append(("slot", tuple(sprite.rect)))
+        else:
+            image = sprite.image
+            items.append(("image", pygame.image.tobytes(image, "RGBA"), image.get_size(), sprite.rect.topleft))
+    return items
+
+
+def snapshot(balls, slots):
+    slot_colors = tuple(tuple(slot.image.get_at((0, 0)))[:3] for slot in slots)
+    return slot_colors, [(ball.rect.x, ball.rect.y, ball.radius, ball.hue) for ball in balls]
+
+
+def recording_columns(num_slots):
+    # Frame columns and tables of a recording: the slot colors, and a row per ball
+    return ({"slot_colors": ("u1", (num_slots, 3))},
+            {"balls": {"id": "u4", "x": "i2", "y": "i2", "radius": "u1", "hue": "u2"}})
+
+
+def record_frame(recorder, balls, slots, notes=()):
+    slot_colors, rows = snapshot(balls, slots)
+    xs, ys, radii, hues = zip(*rows) if rows else ((), (), (), ())
+    columns = {"id": [ball.serial for ball in balls], "x": xs, "y": ys, "radius": radii, "hue": hues}
+    recorder.write({"slot_colors": slot_colors}, {"balls": columns}, notes)
+
+
+def decode(recording, index):
+    # A recorded frame in the form snapshot() returns
+    balls = recording.rows("balls", index)
+    slot_colors = tuple(map(tuple, recording.frame(index)["slot_colors"].tolist()))
+    return slot_colors, list(zip(balls["x"].tolist(), balls["y"].tolist(),
+                                 balls["radius"].tolist(), balls["hue"].tolist()))
+
+
+def rainbow_ball(hue, radius):
+    # The images are shared, so they must never be drawn on
+    key = (hue, radius)
+    if key not in rainbow_balls:
+        color = pygame.Color(0)
+        color.hsva = (hue, 100, 100, 100)
+        image = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+        pygame.draw.circle(image, color, (radius, radius), radius)
+        rainbow_balls[key] = color, image
+    return rainbow_balls[key]
+
+
+def ball_stamp(hue, radius):
+    key = (hue, radius)
+    if key not in ball_stamps:
+        stamp = pygame.Surface((radius * 2, radius * 2))
+        stamp.fill(BLACK)
+        pygame.draw.circle(stamp, rainbow_ball(hue, radius)[0], (radius, radius), radius)
+        stamp.set_colorkey(BLACK, pygame.RLEACCEL)
+        ball_stamps[key] = stamp
+    return ball_stamps[key]
+
+
+def render_frame(surface, layout, state):
+    slot_colors, balls = state
+    surface.fill(BLACK)
+    slot_index = 0
+    for index, item in enumerate(layout):
+        if item[0] == "slot":
+            surface.fill(slot_colors[slot_index], item[1])
+            slot_index += 1
+        else:
+            if index not in images:
+                images[index] = pygame.image.frombytes(item[1], item[2], "RGBA")
+            surface.blit(images[index], item[3])
+    surface.blits([(ball_stamp(hue, radius), (x, y)) for x, y, radius, hue in balls], doreturn=False)
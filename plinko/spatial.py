@@ -0,0 +1,61 @@
+"""Broadphase helpers for the plinko collision loops."""
+from bisect import bisect_left
+
+
+class StaticGrid:
+    # Uniform grid over sprites that never move (pins, walls, floors, slots), built once
+    # at board construction. query(rect) returns the same sprites, in the same order, as
+    # pygame.sprite.spritecollide() would for a sprite with that rect and the original group.
+    def __init__(self, sprites, cell_width, cell_height):
+        self.cell_width = max(1, int(cell_width))
+        self.cell_height = max(1, int(cell_height))
+        self.cells = {}
+        self.order = {}
+        for index, sprite in enumerate(sprites):
+            self.order[sprite] = index
+            for cell in self.cells_for(sprite.rect):
+                self.cells.setdefault(cell, []).append(sprite)
+
+    def cells_for(self, rect):
+        x0, x1 = rect.left // self.cell_width, (rect.right - 1) // self.cell_width
+        y0, y1 = rect.top // self.cell_height, (rect.bottom - 1) // self.cell_height
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    def query(self, rect):
+        # The sprites overlapping rect, e.g. the area a ball sweeps through in a step
+        hits = []
+        for cell in self.cells_for(rect):
+            for other in self.cells.get(cell, ()):
+                if other not in hits and rect.colliderect(other.rect):
+                    hits.append(other)
+        if len(hits) > 1:
+            hits.sort(key=self.order.__getitem__)
+        return hits
+
+
+def sweep_and_prune(sprites):
+    # Pairs of sprites whose rects overlap. Sprites are sorted by rect.left, so the only
+    # candidates for a sprite are the run of sprites that start before its right edge.
+    ordered = sorted(sprites, key=lambda sprite: sprite.rect.left)
+    rects = [sprite.rect for sprite in ordered]
+    lefts = [rect.left for rect in rects]
+    pairs = []
+    for i, rect in enumerate(rects):
+        end = bisect_left(lefts, rect.right, i + 1)
+        if end > i + 1:
+            for j in rect.collidelistall(rects[i + 1:end]):
+                pairs.append((ordered[i], ordered[i + 1 + j]))
+    return pairs
+
+
+def touching(group):
+    # For every sprite in the group, the other sprites it overlaps in group order, i.e. what
+    # spritecollide(sprite, group, False) returns minus the sprite itself
+    sprites = list(group)
+    order = {sprite: index for index, sprite in enumerate(sprites)}
+    hits = {}
+    for a, b in sweep_and_prune(sprites):
+        a, b = order[a], order[b]
+        hits.setdefault(a, []).append(b)
+        hits.setdefault(b, []).append(a)
+    return {sprites[index]: [sprites[other] for other in sorted(others)] for index, others in hits.items()}
@@ -0,0 +1,92 @@
+"""Parameter sweep over plinko board layouts.
+
+Every combination of the given values is built into an engine.Board (parameter
+names are the lowercase comp.py constants) and simulated headlessly, one
+configuration per task across a process pool. Each configuration becomes one
+row of a CSV file: its parameters, the mean steps from spawn to slot, the share
+of balls still in flight at the step limit, and the fraction of balls that
+landed in every slot.
+
+    python sweep.py num_layers=5,7,9 pin_spacing_x=60,70,80 --balls 20000 --output sweep.csv
+"""
+import argparse
+import ast
+import csv
+import inspect
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from plinko.engine import Board, simulate
+
+PARAMETERS = [name for name in inspect.signature(Board).parameters if name not in ("slot_points", "seed")]
+
+
+def parse_parameter(spec):
+    # "num_layers=5,7,9" -> ("num_layers", [5, 7, 9])
+    name, _, values = spec.partition("=")
+    if name not in PARAMETERS:
+        raise argparse.ArgumentTypeError(f"unknown parameter {name!r}, choose from {', '.join(PARAMETERS)}")
+    try:
+        return name, [ast.literal_eval(value.strip()) for value in values.split(",")]
+    except (ValueError, SyntaxError):
+        raise argparse.ArgumentTypeError(f"values for {name} must be numbers, got {values!r}")
+
+
+def configurations(grid):
+    # Every combination of the grid's values, as Board keyword arguments
+    names = [name for name, _ in grid]
+    return [dict(zip(names, values)) for values in itertools.product(*(values for _, values in grid))]
+
+
+def run(task):
+    # One configuration, run in a worker process
+    index, params, num_balls, seed, max_steps = task
+    board = Board(seed=seed, **params)
+    result = simulate(board, num_balls, seed, max_steps)
+    return index, result.distribution().tolist(), result.mean_steps, result.stuck / max(result.total, 1)
+
+
+def sweep(configs, num_balls, seed=None, max_steps=5000, workers=None):
+    # Results in configuration order as (distribution, mean steps, stuck rate)
+    tasks = [(index, params, num_balls, seed, max_steps) for index, params in enumerate(configs)]
+    results = [None] * len(tasks)
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+        for done, (index, *result) in enumerate(pool.imap_unordered(run, tasks), 1):
+            results[index] = result
+            print(f"\r{done}/{len(tasks)} configurations", end="", flush=True)
+    print()
+    return results
+
+
+def write_csv(path, configs, results):
+    names = list(configs[0]) if configs else []
+    num_slots = max((len(distribution) for distribution, _, _ in results), default=0)
+    with open(path, "w", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(names + ["mean_steps", "stuck_rate"] + [f"slot_{i}" for i in range(num_slots)])
+        for params, (distribution, mean_steps, stuck_rate) in zip(configs, results):
+            writer.writerow([params[name] for name in names] + [f"{mean_steps:.2f}", f"{stuck_rate:.6f}"] +
+                            [f"{share:.6f}" for share in distribution])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate every combination of plinko board parameters.")
+    parser.add_argument("grid", nargs="+", type=parse_parameter, metavar="NAME=V1,V2,...",
+                        help=f"values to sweep, names: {', '.join(PARAMETERS)}")
+    parser.add_argument("--balls", type=int, default=10_000, help="balls dropped per configuration")
+    parser.add_argument("--seed", type=int, default=None, help="same seed for every configuration")
+    parser.add_argument("--max-steps", type=int, default=5000)
+    parser.add_argument("--workers", type=int, help="worker processes, defaults to all cores")
+    parser.add_argument("--output", default="sweep.csv")
+    args = parser.parse_args()
+
+    configs = configurations(args.grid)
+    start = time.perf_counter()
+    results = sweep(configs, args.balls, args.seed, args.max_steps, args.workers)
+    write_csv(args.output, configs, results)
+    print(f"Simulated {len(configs)} configurations of {args.balls} balls in {time.perf_counter() - start:.1f}s,"
+          f" results in {args.output}")
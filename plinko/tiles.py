@@ -0,0 +1,34 @@
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import tiles
+from plinko import comp
+
+# A wall of comp.py boards, each in its own process. Board i gets seed --seed + i; options
+# this script doesn't know are passed on to every board, e.g.
+#     python tiles.py --grid 4x4 --seed 1
+#     python tiles.py --grid 4x4 --export wall.mp4 --seconds 30 --keys 0:space
+#     python tiles.py --grid 3x2 --trace board.csv
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plinko boards side by side")
+    parser.add_argument("--seed", type=int, help="seed of the first board, the others count up from it")
+    parser.add_argument("--export", metavar="PATH", help="write the wall to a video file (needs ffmpeg) or a directory of PNG frames")
+    parser.add_argument("--seconds", type=float, default=60, help="length of the export in seconds")
+    parser.add_argument("--keys", help='scripted key presses for every board, e.g. "0:space,2.5:return"')
+    tiles.add_arguments(parser)
+    args, board_args = parser.parse_known_args(argv)
+
+    columns, rows = tiles.parse_grid(args.grid)
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    boards = [board_args + ["--seed", str(seed + index)] for index in range(columns * rows)]
+    tiles.run(comp.main, boards, (comp.SCREEN_WIDTH, comp.SCREEN_HEIGHT), comp.FPS, columns, args.scale,
+              "Plinko Boards", args.export, args.seconds, args.keys)
+
+
+if __name__ == "__main__":
+    main()
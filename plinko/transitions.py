@@ -0,0 +1,203 @@
+"""Slot distributions predicted from per-layer transition tables, without physics.
+
+The board is cut into stages by horizontal lines: one where balls are dropped,
+then one between every pin layer and the one above it. A ball crossing a line
+is binned by its x position and velocity. The x bins are a fraction of the pin
+spacing wide and start at a pin, so every bin is the same place relative to the
+pins of its layer whatever the board's width. A stage's table says where the
+balls entering each bin of its top line leave it: the share going to every bin
+of the next line down or, for the last stage, to every slot. Taking the share of
+dropped balls in each bin through the tables in turn gives the slot
+distribution of any number of balls in a few array operations. The tables are
+sparse, a row has no more entries than balls were simulated for it, so fine
+bins stay small.
+
+Tables are built once per board by sending balls from every reachable bin
+through the physics, one stage at a time, in batches on engine.py's arrays.
+Bins get balls in proportion to how many dropped balls go through them, since
+their errors weigh in that much, and a stage's balls start where the balls of
+the stage above ended, so within a bin they cross where real balls do. The tables are cached on disk under a hash of
+the board and the physics code, so changing either builds new tables and drops
+the old ones.
+
+    python comp.py --predict 1000
+    python comp.py --predict 1000 --drop-x 60
+"""
+import glob
+import hashlib
+import json
+import math
+import os
+
+VERSION = 2  # Bump when the table layout changes
+X_BINS = 8  # Bins per pin spacing
+VX_BIN, VY_BIN = 2.0, 2.5  # Velocity bin widths, pixels per 60 Hz frame
+VX_RANGE = (-8, 8)   # Velocities outside the ranges go to the outermost bins
+VY_RANGE = (-4, 16)
+SAMPLES = 256  # Balls simulated per reached bin and stage on average, bins more balls go through get more
+MIN_SAMPLES = 32  # Balls simulated per reached bin and stage at least
+MAX_STEPS = 2000  # Physics steps per stage before a ball counts as lost
+TABLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tables")
+
+
+def add_arguments(parser):
+    parser.add_argument("--predict", type=int, metavar="BALLS",
+                        help="print the expected slot counts of BALLS dropped balls from cached transition tables")
+    parser.add_argument("--drop-x", type=float, help="with --predict, drop every ball with its center at this x")
+    parser.add_argument("--tables", default=TABLES, help="directory caching the transition tables")
+    parser.add_argument("--rebuild", action="store_true", help="with --predict, build the tables even if cached")
+
+
+class Bins:
+    # The states of a ball crossing a line: x, vx and vy, each cut into equal ranges. x covers
+    # x_range, the centers balls are dropped at, in bins pitch / X_BINS wide with an edge at
+    # origin, so the bins line up with the pins.
+    def __init__(self, x_range, pitch, origin):
+        import numpy as np  # Only the predictions need NumPy
+
+        self.np = np
+        width = pitch / X_BINS
+        low = origin - math.floor((origin - x_range[0]) / width) * width
+        x_bins = math.ceil((x_range[1] - low) / width)
+        self.axes = [(low, low + x_bins * width, x_bins),
+                     VX_RANGE + (round((VX_RANGE[1] - VX_RANGE[0]) / VX_BIN),),
+                     VY_RANGE + (round((VY_RANGE[1] - VY_RANGE[0]) / VY_BIN),)]
+        self.limits = [x_range, VX_RANGE, VY_RANGE]  # What sampled states are kept within
+        self.shape = tuple(bins for _, _, bins in self.axes)
+        self.size = math.prod(self.shape)
+
+    def index(self, x, vx, vy):
+        # The bins of states, given as scalars or arrays
+        np = self.np
+        cells = [np.clip(np.floor((np.asarray(value, float) - low) / (high - low) * bins), 0, bins - 1).astype(int)
+                 for value, (low, high, bins) in zip((x, vx, vy), self.axes)]
+        return np.ravel_multi_index(cells, self.shape)
+
+    def sample(self, indexes, generator):
+        # A state at random in each of the bins, as an (n, 3) array of x, vx and vy. The bins
+        # at the sides reach past the centers balls are dropped at, and aren't sampled there.
+        np = self.np
+        cells = np.unravel_index(indexes, self.shape)
+        states = []
+        for cell, (low, high, bins), (start, end) in zip(cells, self.axes, self.limits):
+            left = np.maximum(low + cell * (high - low) / bins, start)
+            right = np.minimum(low + (cell + 1) * (high - low) / bins, end)
+            states.append(left + generator.random(len(indexes)) * (right - left))
+        return np.column_stack(states)
+
+    def spawn(self, x_range, vx_range, vy_range):
+        # Share of balls in every bin when x, vx and vy are drawn evenly from the ranges, which
+        # is the product of the share of each range falling in each bin of its axis
+        np = self.np
+        shares = [self.overlap(value_range, axis) for value_range, axis in zip((x_range, vx_range, vy_range), self.axes)]
+        return np.einsum("i,j,k->ijk", *shares).ravel()
+
+    def overlap(self, value_range, axis):
+        np = self.np
+        (start, end), (low, high, bins) = value_range, axis
+        edges = low + np.arange(bins + 1) * (high - low) / bins
+        edges[0], edges[-1] = -np.inf, np.inf  # The outermost bins take everything beyond them
+        if start == end:
+            return np.histogram([start], edges)[0].astype(float)
+        return np.clip(np.minimum(edges[1:], end) - np.maximum(edges[:-1], start), 0, None) / (end - start)
+
+
+def board_key(board, sources):
+    # Hash of the board description (plain JSON data), the bins and the source code of the physics
+    digest = hashlib.sha256(json.dumps([VERSION, board, X_BINS, VX_BIN, VY_BIN, VX_RANGE, VY_RANGE, SAMPLES,
+                                        MAX_STEPS], sort_keys=True).encode())
+    for source in sources:
+        digest.update(source.encode())
+    return digest.hexdigest()[:16]
+
+
+def build(bins, stages, num_slots, cross, start, drop_y, seed=0):
+    # Tables of every stage, simulating only the bins balls can reach from the start shares.
+    # cross(stage, x, y, vx, vy) moves a batch of balls, centers at the x and y arrays, until
+    # they cross the stage's bottom line, returning an (n, 4) array of their x, y, vx and vy
+    # at the end of that step, or in the last stage land in a slot, returning the slot indexes.
+    # Lost balls, which do neither, get NaN or -1. The first stage's balls start at height
+    # drop_y, later ones where the balls of the stage above ended. A table is three arrays: the
+    # bins balls enter by, the bins or slots they leave by and the share of the balls doing
+    # so. Lost balls leave no entry, so the shares of their bin sum to less than one.
+    np = bins.np
+    generator = np.random.default_rng(seed)
+    tables = []
+    shares = start
+    reached = np.flatnonzero(start)
+    rows = np.repeat(reached, allocate(start[reached], np))
+    states = np.insert(bins.sample(rows, generator), 1, drop_y, axis=1)  # Anywhere in its bin
+    for stage in range(stages):
+        last = stage == stages - 1
+        outcomes = cross(stage, *states.T)
+        if last:
+            found = outcomes >= 0
+            columns, width = outcomes[found], num_slots
+        else:
+            found = ~np.isnan(outcomes[:, 0])
+            columns, width = bins.index(*outcomes[found][:, [0, 2, 3]].T), bins.size
+        entries, counts = np.unique(rows[found] * width + columns, return_counts=True)
+        table = (entries // width, entries % width, (counts / np.bincount(rows)[entries // width]).astype(np.float32))
+        tables.append(table)
+        if not last:
+            weights = shares[rows[found]] / np.bincount(rows)[rows[found]]
+            rows, states = resample(columns, outcomes[found], weights, generator)
+            shares = np.bincount(table[1], shares[table[0]] * table[2], width)
+    return tables
+
+
+def allocate(shares, np):
+    # Balls to simulate for bins with the given shares of the balls: SAMPLES each on average,
+    # MIN_SAMPLES each at least and the rest by share
+    spare = (SAMPLES - MIN_SAMPLES) * len(shares)
+    return MIN_SAMPLES + np.round(shares / shares.sum() * spare).astype(int)
+
+
+def resample(columns, states, weights, generator):
+    # States for the bins in columns to start the next stage from, picked from the states that
+    # ended this stage in them as often as balls from the start end there: where in its bin
+    # a ball crosses a line still decides which pins it hits next. weights are the shares of
+    # the balls each state stands for. Returns the bins, once per pick, and the picked states.
+    import numpy as np  # Only the predictions need NumPy
+
+    order = np.argsort(columns, kind="stable")
+    columns, states, weights = columns[order], states[order], weights[order]
+    reached, firsts = np.unique(columns, return_index=True)
+    lasts = np.r_[firsts[1:], len(columns)] - 1
+    total = np.cumsum(weights)
+    below = total[firsts] - weights[firsts]
+    group = np.repeat(np.arange(len(reached)), allocate(total[lasts] - below, np))
+    picks = below[group] + generator.random(len(group)) * (total[lasts] - below)[group]
+    picks = np.clip(np.searchsorted(total, picks, side="right"), firsts[group], lasts[group])
+    return reached[group], states[picks]
+
+
+def load(directory, scene, key, np):
+    path = os.path.join(directory, f"{scene}-{key}.npz")
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return [(data[f"rows{stage}"], data[f"columns{stage}"], data[f"shares{stage}"])
+                for stage in range(len(data.files) // 3)]
+
+
+def save(directory, scene, key, tables, np):
+    # Tables of an older board of the scene are stale, so they go
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, f"{scene}-*.npz")):
+        os.remove(path)
+    arrays = {}
+    for stage, (rows, columns, shares) in enumerate(tables):
+        arrays.update({f"rows{stage}": rows, f"columns{stage}": columns, f"shares{stage}": shares})
+    np.savez_compressed(os.path.join(directory, f"{scene}-{key}.npz"), **arrays)
+
+
+def predict(tables, start, num_slots):
+    # Share of the balls ending in every slot
+    import numpy as np  # Only the predictions need NumPy
+
+    shares = start
+    for stage, (rows, columns, weights) in enumerate(tables):
+        size = num_slots if stage == len(tables) - 1 else len(start)
+        shares = np.bincount(columns, shares[rows] * weights, size)
+    return shares
@@ -0,0 +1,178 @@
+"""Closed-form pendulum motion for the swing scene.
+
+A started pendulum turns at a constant angular speed, so its angle is a linear
+function of time and the moment it next reaches the bar can be solved for
+instead of being found by testing rounded positions every step. SwingEngine
+jumps from one bar contact to the next: fast-forwarding or seeking costs one
+iteration per contact, however far it goes, and every contact has an exact
+time to start its note at.
+
+SwingArray is the same motion for many pendulums at once, held in NumPy arrays,
+for scenes with hundreds or thousands of them: positions and bar contacts of
+all of them are worked out in a handful of array operations per step.
+
+Times are simulated milliseconds, the same clock as FixedTimestep.time.
+"""
+import math
+
+TAU = 2 * math.pi
+
+
+class Swing:
+    # One pendulum. The angle is measured from straight down (so pi is the top) and is
+    # anchored at (time, angle); speed is signed, in radians per millisecond.
+    def __init__(self, length, radius, angle=math.pi):
+        self.length = length
+        self.radius = radius
+        self.time = 0.0
+        self.angle = angle
+        self.speed = 0.0
+
+    def angle_at(self, time):
+        return self.angle + self.speed * (time - self.time)
+
+    def position(self, time):
+        # Offset of the ball's center from the pivot
+        angle = self.angle_at(time)
+        return self.length * math.sin(angle), self.length * math.cos(angle)
+
+    def set_speed(self, time, speed):
+        # Re-anchor at the current angle so the swing carries on smoothly at the new speed
+        self.angle = self.angle_at(time)
+        self.time = time
+        self.speed = speed
+
+    def next_contact(self, bar_top, bar_bottom):
+        # The bar hangs straight down from the pivot, so the ball can only reach it at the
+        # bottom of a turn, and only if the top of the ball is level with the bar there.
+        # bar_top and bar_bottom are measured down from the pivot.
+        if self.speed == 0 or not bar_top <= self.length - self.radius <= bar_bottom:
+            return None
+        turns = self.angle / TAU
+        target = (math.floor(turns) + 1 if self.speed > 0 else math.ceil(turns) - 1) * TAU
+        return self.time + (target - self.angle) / self.speed
+
+    def bounce(self, time):
+        # Swing back the way it came, from the bottom
+        self.time = time
+        self.angle = 0.0
+        self.speed = -self.speed
+
+
+class SwingEngine:
+    def __init__(self, swings, bar_top, bar_bottom):
+        self.swings = swings
+        self.bar_top = bar_top
+        self.bar_bottom = bar_bottom
+
+    def next_contact(self):
+        # (time, index) of the earliest upcoming bar contact, or None if no pendulum will hit
+        contacts = [(swing.next_contact(self.bar_top, self.bar_bottom), index)
+                    for index, swing in enumerate(self.swings)]
+        return min((contact for contact in contacts if contact[0] is not None), default=None)
+
+    def advance(self, until):
+        # Bounce every pendulum that reaches the bar up to time until, in time order.
+        # Returns the contacts as (time, index).
+        contacts = []
+        contact = self.next_contact()
+        while contact is not None and contact[0] <= until:
+            time, index = contact
+            self.swings[index].bounce(time)
+            contacts.append(contact)
+            contact = self.next_contact()
+        return contacts
+
+
+class SwingArray:
+    # Swing and SwingEngine for many pendulums: element i of every array is pendulum i
+    def __init__(self, lengths, radius, angle, bar_top, bar_bottom):
+        import numpy as np  # Only the many-pendulum scenes need NumPy
+
+        self.np = np
+        self.length = np.asarray(lengths, dtype=float)
+        count = len(self.length)
+        self.radius = np.broadcast_to(np.asarray(radius, dtype=float), (count,)).copy()
+        self.time = np.zeros(count)
+        self.angle = np.broadcast_to(np.asarray(angle, dtype=float), (count,)).copy()
+        self.speed = np.zeros(count)
+        self.bar_top = bar_top
+        self.bar_bottom = bar_bottom
+        # The score every pendulum plays, a row of set_scores()' table, and its notes played so far
+        self.score = np.zeros(count, dtype=int)
+        self.score_index = np.zeros(count, dtype=int)
+        self.scores = np.zeros((1, 1), dtype=int)
+        self.score_length = np.ones(1, dtype=int)
+
+    def __len__(self):
+        return len(self.length)
+
+    def set_scores(self, scores, score):
+        # scores are lists of note numbers, score the one every pendulum plays
+        np = self.np
+        self.score_length = np.array([len(notes) for notes in scores])
+        self.scores = np.zeros((len(scores), self.score_length.max()), dtype=int)
+        for row, notes in enumerate(scores):
+            self.scores[row, :len(notes)] = notes
+        self.score[:] = score
+
+    def play(self, indexes):
+        # The note numbers the pendulums at indexes play, in order, moving their scores on. A
+        # pendulum listed more than once plays its next notes in turn, like Pendulum.play_sound().
+        np = self.np
+        order = np.argsort(indexes, kind="stable")
+        ranked = indexes[order]
+        starts = np.flatnonzero(np.r_[True, ranked[1:] != ranked[:-1]])
+        rank = np.empty(len(indexes), dtype=int)
+        rank[order] = np.arange(len(indexes)) - np.repeat(starts, np.diff(np.r_[starts, len(indexes)]))
+        score = self.score[indexes]
+        position = (self.score_index[indexes] + rank) % self.score_length[score]
+        np.add.at(self.score_index, indexes, 1)
+        return self.scores[score, position]
+
+    def angle_at(self, time):
+        return self.angle + self.speed * (time - self.time)
+
+    def positions(self, time):
+        # Offsets of the balls' centers from the pivot, as an (n, 2) array
+        angle = self.angle_at(time)
+        return self.np.stack((self.length * self.np.sin(angle), self.length * self.np.cos(angle)), axis=1)
+
+    def set_speed(self, time, speed, which=slice(None)):
+        # Re-anchor the pendulums picked by which (an index, mask or slice) at their current angle
+        self.angle[which] = self.angle_at(time)[which]
+        self.time[which] = time
+        self.speed[which] = speed
+
+    def next_contacts(self):
+        # The time every pendulum next reaches the bar, inf for those that never will
+        np = self.np
+        reach = self.length - self.radius
+        hits = (self.speed != 0) & (self.bar_top <= reach) & (reach <= self.bar_bottom)
+        turns = self.angle / TAU
+        target = np.where(self.speed > 0, np.floor(turns) + 1, np.ceil(turns) - 1) * TAU
+        with np.errstate(divide="ignore", invalid="ignore"):
+            times = self.time + (target - self.angle) / self.speed
+        return np.where(hits, times, np.inf)
+
+    def advance(self, until):
+        # Bounce every pendulum that reaches the bar up to time until. A pendulum turning
+        # faster than the step can hit more than once, so this repeats until none is due.
+        # Returns the contacts as arrays of times and indexes, in time order.
+        np = self.np
+        times, indexes = [], []
+        contacts = self.next_contacts()
+        due = np.flatnonzero(contacts <= until)
+        while len(due):
+            times.append(contacts[due])
+            indexes.append(due)
+            self.time[due] = contacts[due]
+            self.angle[due] = 0.0
+            self.speed[due] = -self.speed[due]
+            contacts[due] = self.next_contacts()[due]
+            due = due[contacts[due] <= until]
+        if not times:
+            return np.zeros(0), np.zeros(0, dtype=int)
+        times, indexes = np.concatenate(times), np.concatenate(indexes)
+        order = np.lexsort((indexes, times))
+        return times[order], indexes[order]
@@ -1,9 +1,18 @@
 import pygame
+import argparse
+import os
 import sys
 import math
+import random
+from collections import deque
 
-# Initialize Pygame
-pygame.init()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import audio, benchmark, checkpoint, export, recording, stream
+from common.audio import Sample, Soundtrack
+from common.profiler import FrameProfiler, ProfilerHud
+from common.timestep import FixedTimestep
+from swing import render
+from swing.engine import TAU, Swing, SwingEngine
 
 # Constants
 WIDTH, HEIGHT = 810, 1440
@@ -11,6 +20,8 @@ BALL_RADIUS = 30
 BAR_WIDTH = 5
 BAR_HEIGHT = 385
 FPS = 60
+PHYSICS_RATE = 60  # Physics steps per second, independent of FPS
+SEEK_TIME = 10000  # Simulated ms the arrows jump ahead or back
 
 # Colors
 WHITE = (255, 255, 242)
@@ -21,125 +32,265 @@ BLUE = (198, 222, 241)
 PURPLE = (219, 205, 240)
 TRAIL_LENGTH = 15
 
-# Sounds
-pygame.mixer.set_num_channels(200)
-a_note = pygame.mixer.Sound("sounds/A_BELL.wav")
-c_note = pygame.mixer.Sound("sounds/C_BELL.wav")
-c_sharp_note = pygame.mixer.Sound("sounds/C#_BELL.wav")
-d_note = pygame.mixer.Sound("sounds/D_BELL.wav")
-e_note = pygame.mixer.Sound("sounds/E_BELL.wav")
-f_note = pygame.mixer.Sound("sounds/F_BELL.wav")
-
-class Ball:
-    def __init__(self, color, x, y, radius):
-        self.color = color
-        self.x, self.y, self.radius = x, y, radius
-        self.trail = []
-
-    def update_position(self, new_x, new_y):
-        self.trail.insert(0, (self.x, self.y))
-        if len(self.trail) > TRAIL_LENGTH:
-            self.trail.pop()
-        self.x, self.y = new_x, new_y
-
-    def draw(self, screen):
-        neon_surface = pygame.Surface((self.radius * 2 + 12, self.radius * 2 + 12), pygame.SRCALPHA)
-        pygame.draw.circle(neon_surface, self.color + (100,), (self.radius + 6, self.radius + 6), self.radius + 6, 8)
-        pygame.draw.circle(neon_surface, WHITE, (self.radius + 6, self.radius + 6), self.radius + 3, 2)
-        screen.blit(neon_surface, (self.x - self.radius - 6, self.y - self.radius - 6))
-
-        for i, position in enumerate(self.trail):
-            alpha = int(255 - (255 * (i / TRAIL_LENGTH)))
-            trail_color = (self.color[0], self.color[1], self.color[2], alpha)
-            trail_surface = pygame.Surface((self.radius * 2, self.radius * 2), pygame.SRCALPHA)
-            pygame.draw.circle(trail_surface, trail_color, (self.radius, self.radius), self.radius)
-            screen.blit(trail_surface, (position[0] - self.radius, position[1] - self.radius))
-
-        pygame.draw.circle(screen, self.color, (self.x, self.y), self.radius)
-
-class Pendulum:
-    def __init__(self, color, length, angle, duration, score):
-        self.ball = Ball(color, WIDTH // 2, HEIGHT // 4, BALL_RADIUS)
-        self.length, self.angle, self.duration = length, angle, duration
-        self.score, self.score_index, self.started, self.top_reached = score, 0, False, False
-        self.angular_velocity = 0
-
-    def start(self):
-        self.started, self.angular_velocity = True, (2 * math.pi) / self.duration
-
-    def update(self):
-        self.angle += self.angular_velocity
-        new_x = WIDTH // 2 + int(self.length * math.sin(self.angle))
-        new_y = HEIGHT // 2 + int(self.length * math.cos(self.angle))
-        self.ball.update_position(new_x, new_y)
-
-        if math.cos(self.angle) < -0.1:
-            self.top_reached = True
-
-        if self.score_index >= len(self.score):
-            self.started = False
-
-    def draw(self, screen):
-        pygame.draw.line(screen, WHITE, (WIDTH // 2, HEIGHT // 2 - 3), (self.ball.x, self.ball.y), 2)
-        self.ball.draw(screen)
-
-    def play_sound(self):
-        self.score[self.score_index % len(self.score)].play()
-        self.score_index += 1
-
-class Bar:
-    def __init__(self, x, y, width, height):
-        self.x, self.y, self.width, self.height = x, y, width, height
-        self.collision_positions = []
-
-    def check_collision(self, pendulum):
-        x_collision = pendulum.ball.x >= WIDTH // 2 if pendulum.angular_velocity > 0 else pendulum.ball.x <= WIDTH // 2
-        y_collision = self.y <= pendulum.ball.y - pendulum.ball.radius <= self.y + self.height
-
-        if x_collision and y_collision and pendulum.top_reached:
-            self.collision_positions.append((pendulum.ball.y, pygame.time.get_ticks()))
-            pendulum.angle, pendulum.top_reached = 0, False
-            return True
-
-        return False
-
-    def draw(self, screen):
-        pygame.draw.rect(screen, WHITE, (self.x - 2, self.y - 2, self.width + 2 * 2, self.height + 2 * 2))
-        pygame.draw.rect(screen, RED, (self.x, self.y, self.width, self.height))
-
-        current_time = pygame.time.get_ticks()
-
-        for y, collision_time in self.collision_positions[:]:
-            pygame.draw.rect(screen, (255, 255, 255, 128), (self.x - 4, y - 35, self.width + 8, BAR_HEIGHT // 5))
-
-            if current_time - collision_time > 100:
-                self.collision_positions.remove((y, collision_time))
-
-# Set up the display
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Pendulums Simulation")
-
-# Clock for controlling the frame rate
-clock = pygame.time.Clock()
+# Everything the drawing code needs, shared with the export workers
+LAYOUT = {"center": (WIDTH // 2, HEIGHT // 2), "trail_length": TRAIL_LENGTH, "bar_height": BAR_HEIGHT,
+          "white": WHITE, "black": BLACK, "red": RED}
+
+# Sounds, decoded the first time they play
+SOUNDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sounds")
+MIXER_CHANNELS = 200
+a_note = Sample(os.path.join(SOUNDS, "A_BELL.wav"))
+c_note = Sample(os.path.join(SOUNDS, "C_BELL.wav"))
+c_sharp_note = Sample(os.path.join(SOUNDS, "C#_BELL.wav"))
+d_note = Sample(os.path.join(SOUNDS, "D_BELL.wav"))
+e_note = Sample(os.path.join(SOUNDS, "E_BELL.wav"))
+f_note = Sample(os.path.join(SOUNDS, "F_BELL.wav"))
+bells = [a_note, c_note, c_sharp_note, d_note, e_note, f_note]  # Recordings refer to notes by their index here
 
 # Scores
 score1 = [f_note, f_note, f_note, f_note, e_note, e_note, e_note, e_note]
 score2 = [d_note, d_note, d_note, d_note, c_note, c_note, c_note, c_note, c_sharp_note, c_sharp_note, c_sharp_note, c_sharp_note, c_sharp_note, c_sharp_note, c_sharp_note, c_sharp_note]
 score3 = [a_note, a_note, a_note, a_note, a_note, a_note, a_note, a_note]
 
-# Create instances
-pendulum1 = Pendulum(GREEN, 110, math.pi, 100, score1)
-pendulum2 = Pendulum(BLUE, 220, math.pi, 50, score2)
-pendulum3 = Pendulum(PURPLE, 330, math.pi, 100, score3)
-pendulums = [pendulum2, pendulum1, pendulum3]
-bar = Bar(WIDTH // 2 - BAR_WIDTH // 2, HEIGHT // 2, BAR_WIDTH, BAR_HEIGHT)
 
-# Main game loop
-pendulum_index, weird_stuff, frames = -1, False, 0
+def main(argv=None):
+    # Command line options
+    parser = argparse.ArgumentParser(description="Pendulums simulation")
+    export.add_arguments(parser)
+    benchmark.add_arguments(parser, "pendulums")
+    FrameProfiler.add_arguments(parser)
+    recording.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    stream.add_arguments(parser)
+    audio.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.fork and args.perturb is None:
+        checkpoint.fork(main, argv, args.fork)
+        return
+    if args.export or args.benchmark or args.warmup or args.serve:
+        export.use_dummy_drivers()
+    audio.configure(not args.no_audio and not args.warmup and not args.serve, MIXER_CHANNELS)
+
+    # Initialize Pygame: the mixer and fonts start when they are first used
+    pygame.display.init()
+
+    class Ball:
+        def __init__(self, color, x, y, radius):
+            self.color = color
+            self.x, self.y, self.radius = x, y, radius
+            self.trail = deque(maxlen=TRAIL_LENGTH)  # Ring buffer, newest position first
+
+        def update_position(self, new_x, new_y):
+            self.trail.appendleft((self.x, self.y))
+            self.x, self.y = new_x, new_y
+
+    class Pendulum:
+        def __init__(self, color, length, angle, duration, score):
+            self.ball = Ball(color, WIDTH // 2, HEIGHT // 4, BALL_RADIUS)
+            self.swing = Swing(length, BALL_RADIUS, angle)
+            self.angle = angle  # Where the swing hangs at time 0
+            self.duration = duration  # Physics steps per turn
+            self.score, self.score_index, self.started = score, 0, False
+            self.starts = []  # Times start() was called at, for seek() to replay
+
+        def start(self):
+            self.started = True
+            self.starts.append(timestep.time)
+            self.retime(1)
+
+        def retime(self, direction=None):
+            # One turn every duration steps at the current physics rate, keeping the direction
+            # unless a new one is given
+            direction = direction or math.copysign(1, self.swing.speed)
+            self.swing.set_speed(timestep.time, direction * TAU * timestep.rate / (self.duration * 1000))
+
+        def resize(self, radius):
+            self.ball.radius = self.swing.radius = radius
+
+        def update(self, time):
+            x, y = self.swing.position(time)
+            self.ball.update_position(WIDTH // 2 + int(x), HEIGHT // 2 + int(y))
+
+            if self.score_index >= len(self.score):
+                self.started = False
+
+        def draw(self, screen):
+            ball = self.ball
+            return render.draw_pendulum(screen, LAYOUT, ball.color, ball.x, ball.y, ball.radius, ball.trail)
+
+        def snapshot(self):
+            ball = self.ball
+            return ball.color, ball.x, ball.y, ball.radius, tuple(ball.trail)
+
+        def play_sound(self, time):
+            # Exports get the note at the exact contact time, live playback starts it this step
+            note = self.score[self.score_index % len(self.score)]
+            if soundtrack:
+                soundtrack.play(note, time)
+            else:
+                note.play()
+            if recorder:
+                played.append(bells.index(note))
+            self.score_index += 1
+
+    class Bar:
+        def __init__(self, x, y, width, height):
+            self.x, self.y, self.width, self.height = x, y, width, height
+            self.collision_positions = []
+
+        def hit(self, pendulum, time):
+            # Flash where the ball touched, at the bottom of its swing. Simulation time, so
+            # flashes last as long in an export as they do live.
+            self.collision_positions.append((HEIGHT // 2 + pendulum.swing.length, int(time)))
+
+        def flashes(self, current_time):
+            # Heights of the collision flashes to draw, dropping them once they have been shown for 100ms
+            ys = [y for y, collision_time in self.collision_positions]
+            self.collision_positions = [(y, collision_time) for y, collision_time in self.collision_positions
+                                        if current_time - collision_time <= 100]
+            return ys
+
+        def snapshot(self):
+            return (self.x, self.y, self.width, self.height), tuple(self.flashes(timestep.ticks))
+
+        def draw(self, screen):
+            return render.draw_bar(screen, LAYOUT, *self.snapshot())
+
+    # Set up the display
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Pendulums Simulation")
+
+    # Clock for controlling the frame rate
+    clock = pygame.time.Clock()
+
+    # Create instances
+    pendulum1 = Pendulum(GREEN, 110, math.pi, 100, score1)
+    pendulum2 = Pendulum(BLUE, 220, math.pi, 50, score2)
+    pendulum3 = Pendulum(PURPLE, 330, math.pi, 100, score3)
+    pendulums = [pendulum2, pendulum1, pendulum3]
+    if args.benchmark and args.count:
+        # The same three kinds of pendulum, repeated at lengths spread over the bar
+        kinds = [(BLUE, 50, score2), (GREEN, 100, score1), (PURPLE, 100, score3)]
+        pendulums = [Pendulum(kinds[i % 3][0], 60 + 300 * i // args.count, math.pi, kinds[i % 3][1], kinds[i % 3][2])
+                     for i in range(args.count)]
+    bar = Bar(WIDTH // 2 - BAR_WIDTH // 2, HEIGHT // 2, BAR_WIDTH, BAR_HEIGHT)
+
+    # Bar contacts are solved for exactly, the bar spans from the pivot down to BAR_HEIGHT
+    engine = SwingEngine([pendulum.swing for pendulum in pendulums], bar.y - HEIGHT // 2, bar.y + bar.height - HEIGHT // 2)
+
+    # Physics step
+    def step():
+        nonlocal frames
+
+        if weird_stuff:
+            if frames % 20 == 0:
+                # Speed up the simulation itself rather than the frame rate
+                timestep.rate += 1
+                for pendulum in pendulums:
+                    if pendulum.ball.radius < 150:
+                        pendulum.resize(pendulum.ball.radius + 1)
+                if frames % 40 == 0:
+                    for pendulum in pendulums:
+                        pendulum.duration -= 1 if pendulum.ball.color == BLUE else 2
+                for pendulum in pendulums:
+                    if pendulum.swing.speed:
+                        pendulum.retime()
+            frames += 1
+        profiler.mark("physics")
+
+        # Bounce off the bar at the exact contact times within this step
+        end = timestep.time + 1000 / timestep.rate
+        for time, index in engine.advance(end):
+            bar.hit(pendulums[index], time)
+            pendulums[index].play_sound(time)
+        profiler.mark("collisions")
+
+        for pendulum in pendulums:
+            pendulum.update(end)
+        profiler.mark("physics")
+
+    # Jump to a time without stepping, only the bar contacts on the way are worked through.
+    # Their notes are skipped but the scores move on. Going back, the pendulums start over
+    # from time 0 and are started again at the times Return started them. The space bar
+    # mode changes speeds every few steps, so it can't be skipped over either way.
+    def seek(time):
+        nonlocal pendulum_index
+        if time < timestep.time:
+            starts = sorted((start, index) for index, pendulum in enumerate(pendulums)
+                            for start in pendulum.starts if start <= time)
+            for pendulum in pendulums:
+                swing = pendulum.swing
+                swing.time, swing.angle, swing.speed = 0.0, pendulum.angle, 0.0
+                pendulum.score_index, pendulum.started = 0, False
+                pendulum.starts = [start for start in pendulum.starts if start <= time]
+            for start, index in starts:
+                for _, contact in engine.advance(start):
+                    pendulums[contact].score_index += 1
+                timestep.time = start  # What retime() sets the speed at
+                pendulums[index].started = True
+                pendulums[index].retime(1)
+            pendulum_index = len(starts) - 1  # Return starts the next pendulum in line again
+            bar.collision_positions = []
+        for _, index in engine.advance(time):
+            pendulums[index].score_index += 1
+        timestep.time = time
+        for pendulum in pendulums:
+            pendulum.ball.trail.clear()
+            pendulum.update(time)
+
+    # Checkpoints: everything that changes while the scene runs, as plain data
+    def save_state():
+        return {"timestep": checkpoint.save_timestep(timestep),
+                "pendulums": [(pendulum.swing.length, pendulum.swing.radius, pendulum.swing.time, pendulum.swing.angle,
+                               pendulum.swing.speed, pendulum.ball.x, pendulum.ball.y, pendulum.ball.radius,
+                               list(pendulum.ball.trail), pendulum.duration, pendulum.score_index, pendulum.started,
+                               pendulum.starts)
+                              for pendulum in pendulums],
+                "flashes": list(bar.collision_positions),
+                "pendulum_index": pendulum_index,
+                "weird_stuff": weird_stuff,
+                "frames": frames}
+
+    def restore_state(state):
+        nonlocal pendulum_index, weird_stuff, frames
+        if len(state["pendulums"]) != len(pendulums):
+            raise SystemExit(f"The checkpoint has {len(state['pendulums'])} pendulums, not {len(pendulums)}")
+        checkpoint.restore_timestep(timestep, state["timestep"])
+        for pendulum, (length, radius, time, angle, speed, x, y, ball_radius, trail, duration, score_index,
+                       started, starts) in zip(pendulums, state["pendulums"]):
+            swing = pendulum.swing
+            swing.length, swing.radius, swing.time, swing.angle, swing.speed = length, radius, time, angle, speed
+            pendulum.ball.x, pendulum.ball.y, pendulum.ball.radius = x, y, ball_radius
+            pendulum.ball.trail.clear()
+            pendulum.ball.trail.extend(trail)
+            pendulum.duration, pendulum.score_index, pendulum.started = duration, score_index, started
+            pendulum.starts = list(starts)
+        bar.collision_positions = list(state["flashes"])
+        pendulum_index, weird_stuff, frames = state["pendulum_index"], state["weird_stuff"], state["frames"]
+
+    def perturb(copy):
+        # A --fork copy: every swinging pendulum's speed changed by up to a --jitter share of it
+        rng = random.Random(copy)
+        for pendulum in pendulums:
+            if pendulum.swing.speed:
+                factor = 1 + rng.uniform(-args.jitter, args.jitter)
+                pendulum.swing.set_speed(timestep.time, pendulum.swing.speed * factor)
+
+    def outcome():
+        return {"seconds": round(timestep.time / 1000, 3),
+                "scores": [pendulum.score_index for pendulum in pendulums],
+                "angles": [round(pendulum.swing.angle_at(timestep.time) % TAU, 4) for pendulum in pendulums]}
+
+    # Input
+    def handle_event(event):
+        nonlocal pendulum_index, weird_stuff, frames
 
-while True:
-    for event in pygame.event.get():
         if event.type == pygame.QUIT:
+            profiler.close()
+            if recorder:
+                recorder.close()
+            if server:
+                server.close()
             pygame.quit()
             sys.exit()
         elif event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
@@ -147,37 +298,133 @@ while True:
             pendulums[pendulum_index % len(pendulums)].start()
         elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
             weird_stuff, frames = True, 0
-
-    if weird_stuff:
-        if frames % 20 == 0:
-            FPS += 1
-            for pendulum in pendulums:
-                if pendulum.ball.radius < 150:
-                    pendulum.ball.radius += 1
-            if frames % 40 == 0:
-                for pendulum in pendulums:
-                    pendulum.duration -= 1 if pendulum.ball.color == BLUE else 2
-                    pendulum.angular_velocity = ((2 * math.pi) / pendulum.duration) * (pendulum.angular_velocity / abs(pendulum.angular_velocity))
-        frames += 1
-
-    for pendulum in pendulums:
-        if bar.check_collision(pendulum):
-            pendulum.play_sound()
-            pendulum.angular_velocity *= -1
-
-        pendulum.update()
-
-    screen.fill(BLACK)
-
-    for pendulum in pendulums:
-        pendulum.draw(screen)
-
-    bar.draw(screen)
-
-    border_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-    pygame.draw.circle(border_surface, WHITE, (WIDTH // 2, HEIGHT // 2), 392, 8)
-    screen.blit(border_surface, (0, 0))
-    pygame.draw.circle(screen, RED, (WIDTH // 2, HEIGHT // 2), 390, 5)
-
-    pygame.display.flip()
-    clock.tick(FPS)
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_f:
+            # Toggle unthrottled fast-forward
+            timestep.fast_forward = not timestep.fast_forward
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_h:
+            hud.visible = not hud.visible
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
+            checkpoint.save(checkpoint.path(args), "swing/main.py", save_state())
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_RIGHT and not weird_stuff:
+            seek(timestep.time + SEEK_TIME)
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_LEFT and not weird_stuff:
+            seek(max(timestep.time - SEEK_TIME, 0.0))
+
+    # Frame state for the exporter
+    def snapshot():
+        return [pendulum.snapshot() for pendulum in pendulums], bar.snapshot()
+
+    # Main game loop
+    pendulum_index, weird_stuff, frames = -1, False, 0
+    timestep = FixedTimestep(PHYSICS_RATE, FPS)
+    profiler = FrameProfiler(["events", "physics", "collisions", "draw", "display", "record"])
+    hud = ProfilerHud(profiler, args.hud)
+    if args.trace:
+        profiler.open_trace(args.trace)
+    soundtrack = None  # Records the notes instead of playing them while exporting
+    recorder = None  # Set with --record
+    server = None  # Set with --serve
+    played = []  # Notes started since the last recorded frame
+    elapsed = 1000 / FPS
+
+    # Replay: show or export a recording instead of simulating
+    if args.replay:
+        recording.replay(args.replay, screen, render.render_frame, LAYOUT, render.decode, bells, args.export, args.workers)
+        return
+
+    # Checkpoints: start from a saved state, perturbed in a --fork copy
+    if args.restore:
+        restore_state(checkpoint.load(args.restore, "swing/main.py"))
+    if args.perturb is not None:
+        perturb(args.perturb)
+
+    # Warm-up: simulate headless and save the state for later runs to start from
+    if args.warmup:
+        checkpoint.simulate(timestep, step, args.warmup, keys=args.keys, handle_event=handle_event)
+        checkpoint.save(checkpoint.path(args), "swing/main.py", save_state())
+        return
+
+    # A --fork copy: simulate headless and hand the outcome back
+    if args.perturb is not None:
+        checkpoint.simulate(timestep, step, args.seconds, keys=args.keys, handle_event=handle_event)
+        if args.save:
+            checkpoint.save(checkpoint.path(args), "swing/main.py", save_state())
+        return outcome()
+
+    # Offline export: simulate headless, then render the recorded frames in parallel
+    if args.export:
+        soundtrack = Soundtrack(timestep) if audio.enabled() else None
+        states = export.record(timestep, step, snapshot, handle_event, args.seconds, args.keys)
+        export.FrameExporter(render.render_frame, screen.get_size(), LAYOUT, args.export, FPS, args.workers).export(states, soundtrack)
+        return
+
+    # Benchmark: every pendulum swinging from the start
+    if args.benchmark:
+        for pendulum in pendulums:
+            pendulum.start()
+
+    # Streaming: frames go to socket clients instead of the window
+    server = stream.Server(args.serve, screen.get_size(), FPS, args.encoding, args.queue) if args.serve else None
+
+    # Recording: every frame from here on
+    if args.record:
+        recorder = recording.Recorder(args.record, FPS, *render.recording_columns(TRAIL_LENGTH), meta={"scene": "swing/main.py"})
+
+    # Rects drawn to last frame, the first frame covers the whole screen
+    drawn = [screen.get_rect()]
+
+    while True:
+        profiler.start()
+        for event in pygame.event.get():
+            handle_event(event)
+        profiler.mark("events")
+
+        # Run as many fixed physics steps as the last frame took
+        timestep.advance(step, elapsed)
+
+        # Erase last frame's pendulums and flashes, then draw this frame's under the border
+        for rect in render.merge_rects(drawn):
+            screen.fill(BLACK, rect)
+        changed = drawn
+
+        drawn = [pendulum.draw(screen) for pendulum in pendulums]
+        drawn.append(bar.draw(screen))
+
+        changed += drawn
+        render.draw_border(screen, LAYOUT, changed)
+
+        if hud.visible:
+            # Over the border too; erased with the rest of drawn next frame
+            rect = hud.draw(screen)
+            drawn.append(rect)
+            changed.append(rect)
+        profiler.mark("draw")
+
+        if server:
+            server.publish(screen, changed)
+        else:
+            pygame.display.update(changed)
+        profiler.mark("display")
+        if recorder:
+            render.record_frame(recorder, LAYOUT, snapshot(), played)
+            played.clear()
+            profiler.mark("record")
+        profiler.end_frame(pendulums=len(pendulums))
+
+        if args.benchmark:
+            # Unthrottled, with the same physics steps every frame
+            if profiler.frames == args.benchmark:
+                benchmark.report(profiler, pendulums=len(pendulums))
+                profiler.close()
+                if recorder:
+                    recorder.close()
+                if server:
+                    server.close()
+                return
+            elapsed = 1000 / FPS
+        else:
+            elapsed = timestep.tick(clock)
+
+
+if __name__ == "__main__":
+    main()
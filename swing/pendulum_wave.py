@@ -0,0 +1,246 @@
+import pygame
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import audio, benchmark, export, stream
+from common.audio import Sample, Soundtrack
+from common.profiler import FrameProfiler, ProfilerHud
+from common.timestep import FixedTimestep
+from swing import render
+from swing.engine import TAU, SwingArray
+
+# A pendulum wave: hundreds of pendulums of increasing length, each turning a little faster
+# than the last, held in a SwingArray and drawn with one call for the strings and one blits()
+# call for the balls. They fall in and out of step, making waves that line up again every CYCLE.
+
+# Constants
+WIDTH, HEIGHT = 810, 1440
+BALL_RADIUS = 6
+BAR_WIDTH = 5
+BAR_HEIGHT = 385
+FPS = 60
+PHYSICS_RATE = 60  # Physics steps per second, independent of FPS
+SEEK_TIME = 10000  # Simulated ms the right arrow jumps ahead
+PENDULUMS = 256  # Pendulums in the wave, --count overrides it
+SHORTEST, LONGEST = 60, 380  # Pendulum lengths, all reach the bar
+CYCLE = 60000  # Simulated ms for the shortest pendulum to make BASE_TURNS turns
+BASE_TURNS = 30  # Turns of the shortest pendulum per CYCLE
+SPREAD_TURNS = 10  # Extra turns per CYCLE of the longest pendulum
+TRAIL_LENGTH = 4
+
+# Colors
+WHITE = (255, 255, 242)
+BLACK = (1, 1, 1)
+RED = (255, 173, 173)
+PALETTE_SIZE = 12  # Bands of color across the wave, few colors keep the stamp cache small
+
+
+def palette():
+    colors = []
+    for band in range(PALETTE_SIZE):
+        color = pygame.Color(0)
+        color.hsva = (360 * band / PALETTE_SIZE, 25, 95, 100)
+        colors.append(tuple(color)[:3])
+    return colors
+
+
+# Sounds, decoded the first time they play
+SOUNDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sounds")
+MIXER_CHANNELS = 32
+a_note = Sample(os.path.join(SOUNDS, "A_BELL.wav"))
+c_note = Sample(os.path.join(SOUNDS, "C_BELL.wav"))
+c_sharp_note = Sample(os.path.join(SOUNDS, "C#_BELL.wav"))
+d_note = Sample(os.path.join(SOUNDS, "D_BELL.wav"))
+e_note = Sample(os.path.join(SOUNDS, "E_BELL.wav"))
+f_note = Sample(os.path.join(SOUNDS, "F_BELL.wav"))
+bells = [a_note, c_note, c_sharp_note, d_note, e_note, f_note]
+
+# Scores, the same as swing/main.py's. The wave is cut into bands, shortest first, and each
+# band plays one of them, a note per bar contact, so shorter pendulums ring higher bells.
+score1 = [f_note, f_note, f_note, f_note, e_note, e_note, e_note, e_note]
+score2 = [d_note, d_note, d_note, d_note, c_note, c_note, c_note, c_note, c_sharp_note, c_sharp_note, c_sharp_note, c_sharp_note, c_sharp_note, c_sharp_note, c_sharp_note, c_sharp_note]
+score3 = [a_note, a_note, a_note, a_note, a_note, a_note, a_note, a_note]
+scores = [score1, score2, score3]
+
+
+def main(argv=None):
+    # Command line options
+    parser = argparse.ArgumentParser(description="Pendulum wave simulation")
+    export.add_arguments(parser)
+    benchmark.add_arguments(parser, "pendulums")
+    FrameProfiler.add_arguments(parser)
+    stream.add_arguments(parser)
+    audio.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.export or args.benchmark or args.serve:
+        export.use_dummy_drivers()
+    audio.configure(not args.no_audio and not args.serve, MIXER_CHANNELS)
+
+    # Initialize Pygame: the mixer and fonts start when they are first used
+    pygame.display.init()
+
+    # Set up the display
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Pendulum Wave Simulation")
+    clock = pygame.time.Clock()
+    timestep = FixedTimestep(PHYSICS_RATE, FPS)
+    profiler = FrameProfiler(["events", "physics", "collisions", "sound", "draw", "display"])
+    hud = ProfilerHud(profiler, args.hud)
+    if args.trace:
+        profiler.open_trace(args.trace)
+
+    # The wave, shortest pendulum first
+    count = args.count or PENDULUMS
+    center = (WIDTH // 2, HEIGHT // 2)
+    bar_rect = (WIDTH // 2 - BAR_WIDTH // 2, HEIGHT // 2, BAR_WIDTH, BAR_HEIGHT)
+    swings = SwingArray([SHORTEST + (LONGEST - SHORTEST) * i / max(count - 1, 1) for i in range(count)],
+                        BALL_RADIUS, TAU / 2, 0, BAR_HEIGHT)
+    np = swings.np
+    turns = BASE_TURNS + SPREAD_TURNS * np.arange(count) / max(count - 1, 1)
+    swings.set_speed(0, turns * TAU / CYCLE)
+    swings.set_scores([[bells.index(note) for note in score] for score in scores],
+                      np.arange(count) * len(scores) // count)
+    layout = {"center": center, "trail_length": TRAIL_LENGTH, "bar_height": BAR_HEIGHT,
+              "white": WHITE, "black": BLACK, "red": RED, "radius": BALL_RADIUS,
+              "palette": palette(), "colors": [i * PALETTE_SIZE // count for i in range(count)]}
+
+    # Ball positions on screen and the positions before them, newest first
+    positions = np.array(center) + swings.positions(0).astype(int)
+    trails = np.zeros((TRAIL_LENGTH, count, 2), dtype=int)
+    trail_count = 0
+    flashes = {}  # Flash height -> time of the latest contact there
+    soundtrack = None  # Records the notes instead of playing them while exporting
+
+    # Physics step
+    def step():
+        nonlocal positions, trail_count
+
+        # Bounce off the bar at the exact contact times within this step
+        end = timestep.time + 1000 / timestep.rate
+        times, indexes = swings.advance(end)
+        profiler.mark("collisions")
+
+        # Flash, and ring every bell the pendulums' scores are on, once per step
+        played = set()
+        for time, index, note in zip(times.tolist(), indexes.tolist(), swings.play(indexes).tolist()):
+            flashes[HEIGHT // 2 + int(swings.length[index])] = int(time)
+            if note not in played:
+                played.add(note)
+                if soundtrack:
+                    soundtrack.play(bells[note], time)
+                else:
+                    bells[note].play()
+        profiler.mark("sound")
+
+        trails[1:] = trails[:-1]
+        trails[0] = positions
+        trail_count = min(trail_count + 1, TRAIL_LENGTH)
+        positions = np.array(center) + swings.positions(end).astype(int)
+        profiler.mark("physics")
+
+    # Jump ahead without stepping, only the bar contacts on the way are worked through. Their
+    # notes are skipped but the scores move on.
+    def seek(time):
+        nonlocal positions, trail_count
+        _, indexes = swings.advance(time)
+        swings.play(indexes)
+        timestep.time = time
+        trail_count = 0
+        positions = np.array(center) + swings.positions(time).astype(int)
+
+    def bar_flashes():
+        # Heights of the collision flashes to draw, dropping them once they have been shown for 100ms
+        ys = tuple(flashes)
+        for y, time in list(flashes.items()):
+            if timestep.ticks - time > 100:
+                del flashes[y]
+        return ys
+
+    # Input. The stream server starts with the main loop, but QUIT can come during an export.
+    server = None
+
+    def handle_event(event):
+        if event.type == pygame.QUIT:
+            profiler.close()
+            if server:
+                server.close()
+            pygame.quit()
+            sys.exit()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_f:
+            # Toggle unthrottled fast-forward
+            timestep.fast_forward = not timestep.fast_forward
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_h:
+            hud.visible = not hud.visible
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_RIGHT:
+            seek(timestep.time + SEEK_TIME)
+
+    # Frame state for the exporter
+    def snapshot():
+        return positions.copy(), trails[:trail_count].copy(), (bar_rect, bar_flashes())
+
+    # Offline export: simulate headless, then render the recorded frames in parallel
+    if args.export:
+        if audio.enabled():
+            soundtrack = Soundtrack(timestep)
+        states = export.record(timestep, step, snapshot, handle_event, args.seconds, args.keys)
+        export.FrameExporter(render.render_wave, screen.get_size(), layout, args.export, FPS, args.workers).export(states, soundtrack)
+        return
+
+    # Streaming: frames go to socket clients instead of the window
+    server = stream.Server(args.serve, screen.get_size(), FPS, args.encoding, args.queue) if args.serve else None
+
+    # Rects drawn to last frame, the first frame covers the whole screen
+    drawn = [screen.get_rect()]
+    elapsed = 1000 / FPS
+
+    while True:
+        profiler.start()
+        for event in pygame.event.get():
+            handle_event(event)
+        profiler.mark("events")
+
+        # Run as many fixed physics steps as the last frame took
+        timestep.advance(step, elapsed)
+
+        # Erase last frame's wave and flashes, then draw this frame's under the border
+        for rect in render.merge_rects(drawn):
+            screen.fill(BLACK, rect)
+        changed = drawn
+
+        drawn = [render.draw_wave(screen, layout, positions, trails[:trail_count]),
+                 render.draw_bar(screen, layout, bar_rect, bar_flashes())]
+
+        changed += drawn
+        render.draw_border(screen, layout, changed)
+
+        if hud.visible:
+            # Over the border too; erased with the rest of drawn next frame
+            rect = hud.draw(screen)
+            drawn.append(rect)
+            changed.append(rect)
+        profiler.mark("draw")
+
+        if server:
+            server.publish(screen, changed)
+        else:
+            pygame.display.update(changed)
+        profiler.mark("display")
+        profiler.end_frame(pendulums=count)
+
+        if args.benchmark:
+            # Unthrottled, with the same physics steps every frame
+            if profiler.frames == args.benchmark:
+                benchmark.report(profiler, pendulums=count)
+                profiler.close()
+                if server:
+                    server.close()
+                return
+            elapsed = 1000 / FPS
+        else:
+            elapsed = timestep.tick(clock)
+
+
+if __name__ == "__main__":
+    main()
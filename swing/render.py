@@ -0,0 +1,222 @@
+"""Drawing of the pendulum scene, shared by the live loop and the offline exporter.
+
+The layout is a dict of the scene constants (colors, center, trail length, bar
+height) and a frame is plain data so it can be pickled to worker processes:
+    ([(color, x, y, radius, trail) for every pendulum], (bar rect, flash ys))
+Recordings store the same frames as columns, see common/recording.py.
+
+The wave scene draws hundreds or thousands of pendulums with one
+pygame.draw.lines() call for the strings and one Surface.blits() call of cached
+stamps for the rest. Its frames are arrays:
+    (positions (n, 2), trails (age, n, 2) newest first, (bar rect, flash ys))
+with the per-pendulum colors in its layout.
+"""
+from collections import OrderedDict
+
+import pygame
+
+
+# Pre-rendered glow rings and trail stamps, filled lazily and shared by every ball:
+# ("glow", color, radius), ("trail", color, radius, alpha) and ("ball", color, radius) -> Surface.
+# The radius grows in the space bar mode, so once the cache is full the least recently used
+# stamp makes way for each new one rather than keeping stamps for radii that will not come back.
+stamps = OrderedDict()
+STAMP_LIMIT = 256
+
+
+def cached_stamp(key):
+    # The stamp for key, marked as just used, or None
+    surface = stamps.get(key)
+    if surface is not None:
+        stamps.move_to_end(key)
+    return surface
+
+
+def new_stamp(key, size):
+    if len(stamps) >= STAMP_LIMIT:
+        stamps.popitem(last=False)
+    stamps[key] = pygame.Surface((size, size), pygame.SRCALPHA)
+    return stamps[key]
+
+
+def glow_stamp(layout, color, radius):
+    key = ("glow", color, radius)
+    surface = cached_stamp(key)
+    if surface is None:
+        surface = new_stamp(key, radius * 2 + 12)
+        pygame.draw.circle(surface, color + (100,), (radius + 6, radius + 6), radius + 6, 8)
+        pygame.draw.circle(surface, layout["white"], (radius + 6, radius + 6), radius + 3, 2)
+    return surface
+
+
+def trail_stamp(color, radius, alpha):
+    key = ("trail", color, radius, alpha)
+    surface = cached_stamp(key)
+    if surface is None:
+        surface = new_stamp(key, radius * 2)
+        pygame.draw.circle(surface, (color[0], color[1], color[2], alpha), (radius, radius), radius)
+    return surface
+
+
+def ball_stamp(color, radius):
+    key = ("ball", color, radius)
+    surface = cached_stamp(key)
+    if surface is None:
+        surface = new_stamp(key, radius * 2)
+        pygame.draw.circle(surface, color, (radius, radius), radius)
+    return surface
+
+
+def draw_ball(screen, layout, color, x, y, radius, trail):
+    # Returns the rect drawn to, for dirty rect updates
+    trail_length = layout["trail_length"]
+    rect = screen.blit(glow_stamp(layout, color, radius), (x - radius - 6, y - radius - 6))
+
+    for i, position in enumerate(trail):
+        alpha = int(255 - (255 * (i / trail_length)))
+        rect.union_ip(screen.blit(trail_stamp(color, radius, alpha), (position[0] - radius, position[1] - radius)))
+
+    rect.union_ip(pygame.draw.circle(screen, color, (x, y), radius))
+    return rect
+
+
+def draw_pendulum(screen, layout, color, x, y, radius, trail):
+    center_x, center_y = layout["center"]
+    rect = pygame.draw.line(screen, layout["white"], (center_x, center_y - 3), (x, y), 2)
+    rect.union_ip(draw_ball(screen, layout, color, x, y, radius, trail))
+    return rect
+
+
+def draw_wave(screen, layout, positions, trails):
+    # Every pendulum of the wave: the strings in a single draw.lines() call, then the glows,
+    # trails and balls in a single blits() call. Colors are layout["colors"], an index into
+    # layout["palette"] per pendulum, so there are few stamps. Returns the one rect around
+    # all of it.
+    radius, palette, colors = layout["radius"], layout["palette"], layout["colors"]
+    center_x, center_y = layout["center"]
+    trail_length = layout["trail_length"]
+
+    # The strings as one path from the pivot out to every ball and back
+    path = positions.repeat(2, axis=0)
+    path[1::2] = (center_x, center_y - 3)
+    pygame.draw.lines(screen, layout["white"], False, [(center_x, center_y - 3)] + path.tolist())
+
+    # Stamps are looked up and paired with their corners by map() and zip(), not per ball in Python
+    glows = [glow_stamp(layout, color, radius) for color in palette]
+    blits = list(zip(map(glows.__getitem__, colors), (positions - (radius + 6)).tolist()))
+    for age, trail in enumerate((trails - radius).tolist()):
+        alpha = int(255 - (255 * (age / trail_length)))
+        images = [trail_stamp(color, radius, alpha) for color in palette]
+        blits += zip(map(images.__getitem__, colors), trail)
+    balls = [ball_stamp(color, radius) for color in palette]
+    blits += zip(map(balls.__getitem__, colors), (positions - radius).tolist())
+    screen.blits(blits, doreturn=False)
+
+    # Everything drawn lies around the pivot, the balls and the trails, grown by the glow
+    (left, top), (right, bottom) = positions.min(0).tolist(), positions.max(0).tolist()
+    if len(trails):
+        (trail_left, trail_top), (trail_right, trail_bottom) = trails.min((0, 1)).tolist(), trails.max((0, 1)).tolist()
+        left, top, right, bottom = min(left, trail_left), min(top, trail_top), max(right, trail_right), max(bottom, trail_bottom)
+    left, top, right, bottom = min(left, center_x), min(top, center_y - 3), max(right, center_x), max(bottom, center_y)
+    grow = radius + 6
+    rect = pygame.Rect(left - grow, top - grow, right - left + 2 * grow + 1, bottom - top + 2 * grow + 1)
+    return rect.clip(screen.get_rect())
+
+
+def draw_bar(screen, layout, rect, flashes):
+    x, y, width, height = rect
+    rect = pygame.draw.rect(screen, layout["white"], (x - 2, y - 2, width + 2 * 2, height + 2 * 2))
+    pygame.draw.rect(screen, layout["red"], (x, y, width, height))
+
+    for flash_y in flashes:
+        rect.union_ip(pygame.draw.rect(screen, (255, 255, 255, 128),
+                                       (x - 4, flash_y - 35, width + 8, layout["bar_height"] // 5)))
+    return rect
+
+
+# The border ring never changes, so it is drawn once per screen size onto a transparent layer
+borders = {}
+BORDER_FULL = 0.5  # Share of the screen the changed areas may cover before the border goes in whole
+
+
+def merge_rects(rects):
+    # The rects with every overlapping group joined into its union, so none of them overlap
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        hits = rect.collidelistall(merged)
+        while hits:
+            for index in reversed(hits):
+                rect.union_ip(merged.pop(index))
+            hits = rect.collidelistall(merged)
+        merged.append(rect)
+    return merged
+
+
+def draw_border(screen, layout, areas=None):
+    # Blit the border layer over the whole screen, or only over the areas. The areas are
+    # merged first and go in one blits() call, and once they cover much of the screen a
+    # single whole blit is cheaper than the pieces.
+    size = screen.get_size()
+    if size not in borders:
+        border = pygame.Surface(size, pygame.SRCALPHA)
+        pygame.draw.circle(border, layout["white"], layout["center"], 392, 8)
+        pygame.draw.circle(border, layout["red"], layout["center"], 390, 5)
+        borders[size] = border
+    if areas is not None:
+        areas = merge_rects(areas)
+        if sum(area.w * area.h for area in areas) < BORDER_FULL * size[0] * size[1]:
+            screen.blits([(borders[size], area, area) for area in areas], doreturn=False)
+            return
+    screen.blit(borders[size], (0, 0))
+
+
+def recording_columns(trail_length):
+    # Frame columns and tables of a recording: the bar, a row per pendulum with its trail
+    # padded to trail_length, and a row per flash
+    return ({"bar": ("i2", (4,))},
+            {"pendulums": {"id": "u2", "color": ("u1", (3,)), "x": "i2", "y": "i2", "radius": "u2",
+                           "trail": ("i2", (trail_length, 2)), "trail_length": "u1"},
+             "flashes": {"y": "i2"}})
+
+
+def record_frame(recorder, layout, state, notes=()):
+    pendulums, (bar_rect, flashes) = state
+    trail_length = layout["trail_length"]
+    trails = [list(trail) + [(0, 0)] * (trail_length - len(trail)) for _, _, _, _, trail in pendulums]
+    columns = {"id": range(len(pendulums)),
+               "color": [color for color, _, _, _, _ in pendulums],
+               "x": [x for _, x, _, _, _ in pendulums],
+               "y": [y for _, _, y, _, _ in pendulums],
+               "radius": [radius for _, _, _, radius, _ in pendulums],
+               "trail": trails,
+               "trail_length": [len(trail) for _, _, _, _, trail in pendulums]}
+    recorder.write({"bar": bar_rect}, {"pendulums": columns, "flashes": {"y": flashes}}, notes)
+
+
+def decode(recording, index):
+    # A recorded frame in the form main.snapshot() returns
+    rows = recording.rows("pendulums", index)
+    pendulums = [(tuple(color), x, y, radius, tuple(map(tuple, trail[:length])))
+                 for color, x, y, radius, trail, length in zip(
+                     rows["color"].tolist(), rows["x"].tolist(), rows["y"].tolist(), rows["radius"].tolist(),
+                     rows["trail"].tolist(), rows["trail_length"].tolist())]
+    bar_rect = tuple(recording.frame(index)["bar"].tolist())
+    return pendulums, (bar_rect, tuple(recording.rows("flashes", index)["y"].tolist()))
+
+
+def render_frame(surface, layout, state):
+    pendulums, (bar_rect, flashes) = state
+    surface.fill(layout["black"])
+    for pendulum in pendulums:
+        draw_pendulum(surface, layout, *pendulum)
+    draw_bar(surface, layout, bar_rect, flashes)
+    draw_border(surface, layout)
+
+
+def render_wave(surface, layout, state):
+    positions, trails, (bar_rect, flashes) = state
+    surface.fill(layout["black"])
+    draw_wave(surface, layout, positions, trails)
+    draw_bar(surface, layout, bar_rect, flashes)
+    draw_border(surface, layout)
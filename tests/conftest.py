@@ -0,0 +1,8 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import export
+
+# Tests run the scenes headless
+export.use_dummy_drivers()
@@ -0,0 +1,37 @@
+from common.audio import Sample, Soundtrack, VoiceManager
+from common.timestep import FixedTimestep
+
+A, B, C = Sample("a.wav"), Sample("b.wav"), Sample("c.wav")
+
+
+def voices(max_voices):
+    # Notes go to a soundtrack instead of the mixer, so nothing is decoded
+    manager = VoiceManager([A, B, A, C], max_voices)
+    manager.soundtrack = Soundtrack(FixedTimestep(60, 60))
+    return manager
+
+
+def test_hits_merge_into_one_note_and_drop_over_the_limit():
+    manager = voices(2)
+    for _ in range(5):
+        manager.hit()
+    # a, b, a again (merged), c (no voice left) and a again (merged)
+    assert manager.flush() == [A, B]
+    assert (manager.played, manager.merged, manager.dropped) == (2, 2, 1)
+    assert [note for _, note in manager.soundtrack.events] == [A, B]
+    assert manager.flush() == []
+    assert (manager.played, manager.merged, manager.dropped) == (2, 2, 1)
+
+
+def test_score_moves_on_for_every_hit_played_or_not():
+    manager = voices(1)
+    for _ in range(3):
+        manager.hit()
+    assert manager.flush() == [A]
+    assert manager.score_pointer == 3
+    manager.hit()
+    manager.hit()
+    # Wraps around the score: c, then a from the start
+    assert manager.score_pointer == 1
+    assert manager.flush() == [C]
+    assert manager.dropped == 2
@@ -0,0 +1,47 @@
+import random
+
+import pygame
+
+from common.timestep import FixedTimestep
+from plinko import comp
+
+
+def slot_ball(serial, x, y, vx, vy):
+    ball = comp.Ball(random.Random(serial), FixedTimestep(comp.PHYSICS_RATE, comp.FPS), serial, x, y)
+    ball.velocity = [vx, vy]
+    ball.started = ball.in_slot = True
+    return ball
+
+
+def test_touching_balls_in_a_slot_go_back_to_the_start_of_the_step():
+    # Two balls in a slot that overlap after a step each bounce off the other and go back to where
+    # they were before the step, rect and all, not to the last contact point of their move
+    below = slot_ball(0, 20.0, 1200.0, 0.0, 0.0)
+    above = slot_ball(1, 22.0, 1160.0, 0.5, 20.0)
+    balls = pygame.sprite.Group(below, above)
+    for ball in balls:
+        ball.update()
+    above.prev_x, above.prev_y = 22.25, 1170.0  # Where move() leaves prev after a contact halfway
+    assert pygame.sprite.collide_rect(below, above)
+
+    comp.collide_balls(balls)
+
+    assert (below.real_x, below.real_y) == (20.0, 1200.0)
+    assert (above.real_x, above.real_y) == (22.0, 1160.0)
+    assert below.rect.topleft == (20, 1200)
+    assert above.rect.topleft == (22, 1160)
+    assert above.velocity[1] < 0 < below.velocity[1]  # Pushed apart along the line between them
+
+
+def test_balls_out_of_the_slots_pass_each_other():
+    first = slot_ball(0, 20.0, 600.0, 0.0, 5.0)
+    second = slot_ball(1, 30.0, 610.0, 0.0, 5.0)
+    first.in_slot = second.in_slot = False
+    balls = pygame.sprite.Group(first, second)
+    for ball in balls:
+        ball.update()
+
+    comp.collide_balls(balls)
+
+    assert (first.real_y, second.real_y) == (605.35, 615.35)
+    assert first.velocity == [0.0, 5.35]
@@ -0,0 +1,56 @@
+import random
+
+import pygame
+
+from common.timestep import FixedTimestep
+from plinko import main
+
+
+def pool(max_balls, overflow):
+    balls = pygame.sprite.Group()
+    timestep = FixedTimestep(main.PHYSICS_RATE, main.FPS)
+    return balls, main.BallPool([balls], random.Random(0), timestep, max_balls, overflow)
+
+
+def test_queued_balls_spawn_as_others_leave():
+    balls, balls_pool = pool(2, "queue")
+    first, second = balls_pool.spawn(), balls_pool.spawn()
+    assert balls_pool.spawn() is None
+    assert balls_pool.spawn() is None
+    assert (len(balls), balls_pool.queued) == (2, 2)
+
+    balls_pool.release(first)
+    balls_pool.refill()
+    # The queued spawn reuses the released ball under the next serial, spawns over the cap use none
+    assert first.alive() and first.serial == 2
+    assert (len(balls), balls_pool.queued, balls_pool.created, balls_pool.recycled) == (2, 1, 2, 1)
+
+
+def test_dropped_and_aggregated_balls_are_counted_only():
+    for overflow in ["drop", "aggregate"]:
+        balls, balls_pool = pool(1, overflow)
+        balls_pool.spawn()
+        balls_pool.spawn()
+        balls_pool.spawn()
+        balls_pool.release(balls.sprites()[0])
+        balls_pool.refill()
+        assert len(balls) == 0
+        assert (balls_pool.queued, balls_pool.dropped, balls_pool.aggregated) == \
+            ((0, 2, 0) if overflow == "drop" else (0, 0, 2))
+
+
+def test_arrays_follow_the_balls_in_play():
+    # Releasing a ball moves the last one into its place, so the arrays always hold
+    # exactly the balls in play
+    balls, balls_pool = pool(10, "queue")
+    spawned = [balls_pool.spawn() for _ in range(5)]
+    for ball in spawned:
+        ball.rect.topleft = (ball.serial * 10, ball.serial * 20)
+        balls_pool.store(ball)
+    balls_pool.release(spawned[1])
+    balls_pool.release(spawned[4])
+
+    xs, ys, hues = balls_pool.arrays()
+    assert sorted(zip(xs.tolist(), ys.tolist())) == sorted(ball.rect.topleft for ball in balls)
+    assert hues.tolist() == [ball.hue for ball in balls_pool.live]
+    assert [ball.index for ball in balls_pool.live] == [0, 1, 2]
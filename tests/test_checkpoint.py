@@ -0,0 +1,44 @@
+import argparse
+
+from common import checkpoint
+from plinko import comp
+
+SCENE = "plinko/comp.py"
+KEYS = "0:space,0.1:return,0.3:return,0.5:return"
+
+
+def test_restored_run_continues_bit_for_bit(tmp_path):
+    # Three seconds in one go and the same three seconds with a checkpoint after the first
+    # leave the exact same state behind
+    whole, half, rest = (str(tmp_path / name) for name in ("whole.ckpt", "half.ckpt", "rest.ckpt"))
+    comp.main(["--seed", "1", "--warmup", "3", "--keys", KEYS, "--save", whole, "--no-audio"])
+    comp.main(["--seed", "1", "--warmup", "1", "--keys", KEYS, "--save", half, "--no-audio"])
+    comp.main(["--restore", half, "--warmup", "2", "--save", rest, "--no-audio"])
+
+    state = checkpoint.load(whole, SCENE)
+    assert state["timestep"]["steps"] == 3 * comp.PHYSICS_RATE
+    assert any(ball[-1] for ball in state["balls"])  # Some balls were dropped, so there was physics to repeat
+    assert checkpoint.load(rest, SCENE) == state
+
+
+def test_fork_copies_are_repeatable(tmp_path, capsys):
+    # Every --fork copy gets the same outcome each time it is run, and the copies differ from each other
+    start = str(tmp_path / "start.ckpt")
+    comp.main(["--seed", "2", "--warmup", "1", "--keys", KEYS, "--save", start, "--no-audio"])
+    capsys.readouterr()
+
+    argv = ["--restore", start, "--seconds", "3", "--jitter", "0.5"]
+    checkpoint.fork(comp.main, argv, 3)
+    first = capsys.readouterr().out.splitlines()
+    checkpoint.fork(comp.main, argv, 3)
+    second = capsys.readouterr().out.splitlines()
+
+    assert len(first) == 3
+    assert first == second
+    assert len(set(line.partition(": ")[2] for line in first)) > 1
+
+
+def test_save_path_keeps_braces(tmp_path):
+    path = str(tmp_path / "run {x}" / "copy{fork}.ckpt")
+    args = argparse.Namespace(save=path, perturb=3)
+    assert checkpoint.path(args) == str(tmp_path / "run {x}" / "copy3.ckpt")
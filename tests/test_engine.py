@@ -0,0 +1,27 @@
+from common import checkpoint
+from plinko import comp
+from plinko.engine import Board, Engine
+
+SCENE = "plinko/comp.py"
+
+
+def test_engine_lands_balls_like_comp(tmp_path):
+    # The same balls dropped in comp.py, by way of a checkpoint, and in the engine land in the
+    # same slots, and the same number are still falling when time is up
+    path = str(tmp_path / "drop.ckpt")
+    comp.main(["--seed", "1", "--warmup", "0.01", "--save", path, "--no-audio"])
+
+    engine = Engine(Board(), seed=1)
+    engine.spawn(200)
+    state = checkpoint.load(path, SCENE)
+    state["balls"] = [(serial, 0, x, y, x, y, vx, vy, False, True)
+                      for serial, (x, y, vx, vy) in enumerate(zip(engine.x, engine.y, engine.vx, engine.vy))]
+    state["waiting"] = []
+    checkpoint.save(path, SCENE, state)
+
+    seconds = 6
+    outcome = comp.main(["--restore", path, "--perturb", "0", "--seconds", str(seconds), "--no-audio"])
+    result = engine.run(seconds * comp.PHYSICS_RATE)
+    assert 0 < result.stuck < 150
+    assert outcome["landed"] == result.counts.tolist()
+    assert outcome["balls"] == result.stuck
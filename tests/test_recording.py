@@ -0,0 +1,77 @@
+import os
+import random
+
+import numpy as np
+import pygame
+
+from common import recording
+from common.timestep import FixedTimestep
+from plinko import comp, render
+
+# Item ids, x values and notes of every frame: items come and go, and some frames have none
+FRAMES = [([1, 2], [0.5, 1.5], [3]), ([2], [2.5], []), ([], [], [0, 1]), ([4, 5, 6], [1.0, 2.0, 3.0], [])]
+
+
+def record(path):
+    recorder = recording.Recorder(path, 30, {"score": "i4", "colors": ("u1", (2, 3))}, {"items": {"id": "u4", "x": "f4"}},
+                                  track="items", meta={"scene": "test"})
+    for number, (ids, xs, notes) in enumerate(FRAMES):
+        recorder.write({"score": number, "colors": [[number] * 3, [0, 0, 0]]}, {"items": {"id": ids, "x": xs}}, notes)
+    recorder.close()
+    return recording.Recording(path)
+
+
+def test_frames_read_back_as_written(tmp_path):
+    played = record(str(tmp_path / "run.rec"))
+    assert (len(played), played.fps, played.meta) == (4, 30, {"scene": "test"})
+    assert isinstance(played.tables["items"]["x"], np.memmap)
+    for number, (ids, xs, notes) in enumerate(FRAMES):
+        rows = played.rows("items", number)
+        assert rows["id"].tolist() == ids
+        assert rows["x"].tolist() == xs
+        assert played.frame(number)["score"] == number
+        assert played.frame(number)["colors"].tolist() == [[number] * 3, [0, 0, 0]]
+        assert played.notes(number) == notes
+    # Spawns and kills follow the ids
+    events = [played.rows("events", number) for number in range(4)]
+    assert list(zip(events[0]["kind"].tolist(), events[0]["id"].tolist())) == \
+        [(recording.SPAWN, 1), (recording.SPAWN, 2), (recording.NOTE, 3)]
+    assert list(zip(events[1]["kind"].tolist(), events[1]["id"].tolist())) == [(recording.KILL, 1)]
+    assert events[3]["kind"].tolist() == [recording.SPAWN] * 3
+
+
+def test_recording_cut_short_keeps_its_whole_frames(tmp_path):
+    path = str(tmp_path / "run.rec")
+    record(path)
+    # The last frame's x rows only got one of three values written
+    with open(os.path.join(path, "items.x.bin"), "r+b") as file:
+        file.truncate(4 * 4)
+    played = recording.Recording(path)
+    assert len(played) == 3
+    assert played.rows("items", 2)["id"].tolist() == []
+
+
+def test_replayed_frames_match_the_scene(tmp_path):
+    # What a replay draws from the recording is what the scene showed, frame by frame
+    path = str(tmp_path / "comp.rec")
+    timestep = FixedTimestep(comp.PHYSICS_RATE, comp.FPS)
+    rng = random.Random(1)
+    balls = pygame.sprite.Group()
+    slots = [comp.Slot(i * 50, 400, 50, 100, 1, (i * 40, 0, 0)) for i in range(3)]
+    recorder = recording.Recorder(path, comp.FPS, *render.recording_columns(len(slots)), track="balls")
+    shown = []
+    for frame in range(20):
+        if frame % 5 == 0:
+            ball = comp.Ball(rng, timestep, frame)
+            ball.started = True
+            balls.add(ball)
+        if frame == 12:
+            balls.sprites()[0].kill()
+        timestep.run_step(balls.update)
+        render.record_frame(recorder, balls, slots, [frame % 6] if frame % 3 == 0 else [])
+        shown.append(render.snapshot(balls, slots))
+    recorder.close()
+
+    played = recording.Recording(path)
+    assert list(played.states(render.decode)) == shown
+    assert played.notes(3) == [3]
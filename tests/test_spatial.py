@@ -0,0 +1,37 @@
+import random
+
+import pygame
+
+from plinko.spatial import StaticGrid, touching
+
+
+def sprite(rect):
+    item = pygame.sprite.Sprite()
+    item.rect = pygame.Rect(rect)
+    return item
+
+
+def test_query_matches_spritecollide():
+    # Pins, tall walls and rects hanging off the board, queried with rects of every size,
+    # some of them empty or off the board too, give what the brute-force check gives
+    rng = random.Random(1)
+    group = pygame.sprite.Group()
+    for _ in range(60):
+        group.add(sprite((rng.randint(-50, 800), rng.randint(-50, 1400), 10, 10)))
+    for _ in range(10):
+        group.add(sprite((rng.randint(0, 800), rng.randint(0, 1400), rng.randint(1, 20), rng.randint(100, 600))))
+    grid = StaticGrid(group, 60, 80)
+    probe = pygame.sprite.Sprite()
+    for _ in range(2000):
+        probe.rect = pygame.Rect(rng.randint(-100, 850), rng.randint(-100, 1450), rng.randint(0, 120), rng.randint(0, 120))
+        assert grid.query(probe.rect) == pygame.sprite.spritecollide(probe, group, False)
+
+
+def test_touching_matches_spritecollide():
+    # Every overlapping pair the sweep finds, in group order, and none it misses
+    rng = random.Random(2)
+    group = pygame.sprite.Group(sprite((rng.randint(0, 400), rng.randint(0, 400), 50, 50)) for _ in range(80))
+    hits = touching(group)
+    for item in group:
+        expected = [other for other in pygame.sprite.spritecollide(item, group, False) if other is not item]
+        assert hits.get(item, []) == expected
@@ -0,0 +1,25 @@
+import pygame
+
+from common import stream
+
+
+def test_server_streams_frames_and_cleans_up(tmp_path):
+    # A client gets the frames published after it connected, and closing the server removes its socket
+    address = str(tmp_path / "scene.sock")
+    screen = pygame.Surface((4, 3))
+    screen.fill((10, 20, 30))
+    server = stream.Server(address, screen.get_size(), 60, "zlib")
+    try:
+        connection = stream.connect(address)
+        connection.settimeout(stream.TIMEOUT)
+        # The server counts the client in once it has sent the header
+        hello, frames = stream.read_frames(connection)
+        assert (hello["width"], hello["height"], hello["encoding"]) == (4, 3, "zlib")
+        server.publish(screen, [])
+        index, pixels = next(frames)
+        assert index == 0
+        assert pixels == bytes((10, 20, 30)) * 12
+        connection.close()
+    finally:
+        server.close()
+    assert not (tmp_path / "scene.sock").exists()
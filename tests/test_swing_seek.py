@@ -0,0 +1,23 @@
+from common import checkpoint
+from swing import main
+
+SCENE = "swing/main.py"
+
+
+def swings(path):
+    # Everything seeking re-derives: the swing motion, notes played so far and start times
+    return [pendulum[:5] + pendulum[10:] for pendulum in checkpoint.load(path, SCENE)["pendulums"]]
+
+
+def test_seeking_back_lands_where_stepping_does(tmp_path):
+    # Going back ten seconds from 12 s and running on to 4 s ends up as if the run had gone
+    # straight to 4 s: the start at 6 s is undone and the scores count the earlier contacts only
+    seeked, direct = str(tmp_path / "seeked.ckpt"), str(tmp_path / "direct.ckpt")
+    main.main(["--warmup", "14", "--keys", "0:return,0.5:return,6:return,12:left", "--save", seeked, "--no-audio"])
+    main.main(["--warmup", "4", "--keys", "0:return,0.5:return", "--save", direct, "--no-audio"])
+
+    state = checkpoint.load(seeked, SCENE)
+    assert round(state["timestep"]["time"]) == 4000
+    assert state["pendulum_index"] == 1
+    assert all(pendulum[10] for pendulum in state["pendulums"][:2])  # Notes were played before the seek
+    assert swings(seeked) == swings(direct)
@@ -0,0 +1,37 @@
+import pytest
+
+from common.timestep import FixedTimestep
+
+
+def counter():
+    calls = []
+    return calls, lambda: calls.append(len(calls))
+
+
+def test_steps_follow_elapsed_time():
+    # Frame times that aren't a whole number of steps carry the remainder over to the next frame
+    timestep = FixedTimestep(60, 60)
+    calls, step = counter()
+    counts = [timestep.advance(step, 10) for _ in range(100)]
+    assert len(calls) == timestep.steps == 60
+    assert counts[:4] == [0, 1, 0, 1]
+    assert timestep.time == pytest.approx(1000)
+
+
+def test_rate_is_independent_of_fps():
+    timestep = FixedTimestep(240, 60)
+    calls, step = counter()
+    for _ in range(60):
+        assert timestep.advance(step, 1000 / 60) == 4
+    assert len(calls) == 240
+    assert timestep.time == pytest.approx(1000)
+
+
+def test_slow_frame_runs_at_most_max_steps_and_drops_the_backlog():
+    timestep = FixedTimestep(60, 60, max_steps=16)
+    calls, step = counter()
+    assert timestep.advance(step, 1000) == 16
+    assert timestep.accumulator == 0
+    assert timestep.advance(step, 0) == 0
+    assert timestep.advance(step, 1000 / 60) == 1
+    assert len(calls) == 17
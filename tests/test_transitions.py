@@ -0,0 +1,23 @@
+from plinko import comp
+from plinko.engine import Board, simulate
+
+# Six layers of pins over six slots, more like a real board than comp.py's one-pin default
+BOARD = {"SCREEN_WIDTH": 405, "NUM_SLOTS": 6, "NUM_LAYERS": 6, "PINS_PER_LAYER": 3, "PIN_SPACING_X": 120,
+         "PIN_SPACING_Y": 80, "HORIZONTAL_OFFSET": 40, "PIN_MOD": 0}
+TOLERANCE = 0.015  # Largest difference allowed in any slot's share of the balls
+
+
+def test_predictions_match_dropped_balls(tmp_path, monkeypatch, capsys):
+    # The slot shares predicted from the tables are those of balls dropped on the engine, and
+    # the second prediction reuses the tables the first one built
+    for name, value in BOARD.items():
+        monkeypatch.setattr(comp, name, value)
+    argv = ["--predict", "1000", "--tables", str(tmp_path), "--seed", "1", "--no-audio"]
+    predicted = comp.main(argv)
+    assert comp.main(argv) == predicted
+    assert capsys.readouterr().out.count("Built transition tables") == 1
+
+    board = Board(**{name.lower(): getattr(comp, name) for name in comp.BOARD_CONSTANTS})
+    simulated = simulate(board, 50000, seed=1).distribution().tolist()
+    assert abs(sum(predicted) - 1) < 1e-6  # No ball was lost in the table runs
+    assert max(abs(share - expected) for share, expected in zip(predicted, simulated)) < TOLERANCE